@@ -0,0 +1,89 @@
+# analyze_canopy.py
+#
+# Tiled inference over large canopy photos (drone or wide-angle shots with
+# many leaves): overlapping 224×224 windows are scored in batches and merged
+# into a disease heatmap and a list of hot regions (see
+# utils.predict.predict_leaf_disease_tiled and utils/heatmap.py).
+#
+#   python analyze_canopy.py field.jpg -o field_heatmap.jpg
+#   python analyze_canopy.py field.jpg --stride 56 --max-side 8192 --json regions.json
+#   python analyze_canopy.py field.jpg --batch-sizes 1 8 32 64   # tiles/s per batch size
+
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from utils.heatmap import HOT_THRESHOLD, disease_map, draw_heatmap_overlay, find_hot_regions
+from utils.image_io import TILED_MAX_SIDE, load_large_image
+from utils.predict import DEFAULT_BATCH_SIZE, TILE_STRIDE, predict_leaf_disease_tiled, warm_up
+
+# Longest side of the written overlay image
+OVERLAY_MAX_SIDE = 2048
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Disease heatmap of a large canopy photo.")
+    parser.add_argument("image")
+    parser.add_argument("-o", "--output", help="Write the heatmap overlay to this image file")
+    parser.add_argument("--json", help="Write hot regions and the cell heatmap as JSON to this file")
+    parser.add_argument("--stride", type=int, default=TILE_STRIDE, help="Step between 224×224 windows, in pixels")
+    parser.add_argument("--max-side", type=int, default=TILED_MAX_SIDE,
+                        help="Longest side the photo is decoded at before tiling")
+    parser.add_argument("--threshold", type=float, default=HOT_THRESHOLD, help="Disease score of a hot cell")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[DEFAULT_BATCH_SIZE],
+                        help="Windows per forward pass; several values report throughput for each")
+    args = parser.parse_args()
+    if args.stride < 1 or args.max_side < 224:
+        parser.error("--stride must be positive and --max-side at least 224")
+    return args
+
+
+def main():
+    args = parse_args()
+    large = load_large_image(args.image, args.max_side)
+    height, width = large.rgb.shape[:2]
+    print(f"{args.image}: {large.original_size[0]}×{large.original_size[1]} decoded at {width}×{height}",
+          file=sys.stderr)
+
+    warm_up(background=False)
+    for batch_size in args.batch_sizes:
+        # Trace this batch shape on one row of batch_size windows first
+        predict_leaf_disease_tiled(large.rgb[:224, :224 + args.stride * (batch_size - 1)], args.stride, batch_size)
+        start = time.perf_counter()
+        tiled = predict_leaf_disease_tiled(large.rgb, args.stride, batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"  batch {batch_size:>3}: {len(tiled.offsets)} windows in {elapsed:.2f}s "
+              f"({len(tiled.offsets) / elapsed:.1f} windows/s)", file=sys.stderr)
+
+    regions = find_hot_regions(tiled, args.threshold, large.scale)
+    print(f"\n{len(regions)} hot regions (disease score ≥ {args.threshold:.2f})")
+    for r in regions:
+        x, y, w, h = r.box
+        print(f"  {r.score:.2f}  {r.label:<45} at ({x}, {y}) {w}×{h}  {r.area_ratio:.1%} of the image")
+
+    if args.output:
+        display = Image.fromarray(large.rgb)
+        display.thumbnail((OVERLAY_MAX_SIDE, OVERLAY_MAX_SIDE))
+        Image.fromarray(draw_heatmap_overlay(np.asarray(display), tiled)).save(args.output)
+        print(f"Heatmap overlay written to {args.output}", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "image": args.image,
+                "original_size": large.original_size,
+                "tiled_size": tiled.image_size,
+                "stride": args.stride,
+                "windows": len(tiled.offsets),
+                "cell_px": tiled.cell / large.scale,
+                "disease_map": disease_map(tiled).round(4).tolist(),
+                "regions": [r._asdict() for r in regions],
+            }, f, indent=2)
+        print(f"Regions written to {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
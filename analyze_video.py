@@ -0,0 +1,90 @@
+# analyze_video.py
+#
+# Disease timeline and prevalence of walk-through videos (see utils/video.py).
+# Frames are sampled at --fps, near-duplicate frames reuse the previous
+# prediction, and the per-frame timeline is streamed to a .jsonl or .csv
+# file as it is produced, so any length of video runs in bounded memory.
+#
+#   python analyze_video.py row12.mp4
+#   python analyze_video.py row12.mp4 row13.mp4 --fps 4 -o timeline.csv --summary summary.json
+
+import csv
+import sys
+import json
+import time
+import argparse
+
+from utils.predict import DEFAULT_BATCH_SIZE
+from utils.video import DIFF_THRESHOLD, SAMPLE_FPS, VideoSummary, iter_video_predictions
+
+CSV_FIELDS = ["video", "frame", "time_s", "label", "confidence", "duplicate"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyze leaf disease over walk-through videos.")
+    parser.add_argument("videos", nargs="+", help="Video files")
+    parser.add_argument("-o", "--output", help="Per-frame timeline file (.jsonl or .csv)")
+    parser.add_argument("--summary", help="Write per-video prevalence as JSON to this file")
+    parser.add_argument("--fps", type=float, default=SAMPLE_FPS, help="Frames per second analyzed")
+    parser.add_argument("--diff-threshold", type=float, default=DIFF_THRESHOLD,
+                        help="Near-duplicate cutoff (mean absolute difference, 0–1); 0 scores every frame")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    if args.fps <= 0:
+        parser.error("--fps must be positive")
+    if not 0 <= args.diff_threshold <= 1:
+        parser.error("--diff-threshold must be between 0 and 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    out = writer = None
+    if args.output:
+        out = open(args.output, "w", newline="", encoding="utf-8")
+        if args.output.lower().endswith(".csv"):
+            writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+
+    summaries = {}
+    try:
+        for path in args.videos:
+            summary = VideoSummary()
+            start = time.perf_counter()
+            try:
+                for pred in iter_video_predictions(path, args.fps, args.diff_threshold, args.batch_size):
+                    summary.add(pred)
+                    if out is not None:
+                        row = {"video": path, "frame": pred.index, "time_s": round(pred.time_s, 3),
+                               "label": pred.label, "confidence": round(pred.confidence, 6),
+                               "duplicate": pred.duplicate}
+                        if writer is not None:
+                            writer.writerow(row)
+                        else:
+                            out.write(json.dumps(row) + "\n")
+                    if summary.sampled % 50 == 0:
+                        print(f"\r{path}: {pred.time_s:.0f}s, {summary.sampled} frames", end="", file=sys.stderr)
+            except ValueError as e:
+                print(f"\n❌ {e}", file=sys.stderr)
+                continue
+            elapsed = time.perf_counter() - start
+            summaries[path] = summary.as_dict()
+
+            print(f"\r{path}: {summary.duration_s:.1f}s of video, {summary.sampled} frames sampled, "
+                  f"{summary.sampled - summary.scored} near-duplicates skipped, {elapsed:.1f}s", file=sys.stderr)
+            for row in summary.prevalence():
+                print(f"  {row['share']:>6.1%}  {row['label']:<50} mean confidence {row['mean_confidence']:.2f}")
+    finally:
+        if out is not None:
+            out.close()
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+        print(f"Summary written to {args.summary}", file=sys.stderr)
+    if not summaries:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# benchmark.py
+#
+# Per-stage benchmark of the diagnosis pipeline: image decode (full and
+# reduced-resolution), preprocess_image, spot detection, prediction at several batch
+# sizes, tiled inference over a phone photo and report generation. Runs on a fixed sample of data/PlantVillage and
+# on synthetic large "phone photo" inputs, and writes machine-readable results.
+#
+#   python benchmark.py -o bench.json                      # run and save
+#   python benchmark.py --compare bench.json               # flag regressions vs. a saved baseline
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.image_io import load_image, load_large_image
+from utils.preprocess import preprocess_image, preprocess_images
+from utils.predict import (
+    TILE_STRIDE, get_backend, load_labels, predict_leaf_disease_batch, predict_leaf_disease_tiled, tile_offsets,
+    warm_up
+)
+from utils.report import generate_disease_report
+from utils.spots import analyze_spots, draw_spot_overlay
+
+DATA_DIR = "data/PlantVillage"
+IMG_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+BATCH_SIZES = (1, 8, 32, 64)
+
+# Stage metrics where a larger value is worse; everything else is a rate
+LOWER_IS_BETTER = ("p50_ms", "p95_ms")
+
+
+def sample_paths(num_samples: int) -> List[str]:
+    """A fixed, evenly spaced sample across all classes."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(DATA_DIR):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(IMG_EXTENSIONS))
+    if not paths:
+        raise SystemExit(f"No images found under {DATA_DIR}")
+    step = max(1, len(paths) // num_samples)
+    return paths[::step][:num_samples]
+
+
+def synthetic_phone_photos(sources: List[bytes], count: int, size=(4032, 3024), seed: int = 0) -> List[bytes]:
+    """Upscaled leaves with sensor-like noise, JPEG-encoded like a 12 MP phone photo."""
+    rng = np.random.default_rng(seed)
+    photos = []
+    for data in sources[:count]:
+        with Image.open(io.BytesIO(data)) as img:
+            big = np.asarray(img.convert("RGB").resize(size, Image.BILINEAR), dtype=np.int16)
+        big = np.clip(big + rng.integers(-8, 9, big.shape, dtype=np.int16), 0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(big).save(buf, format="JPEG", quality=90)
+        photos.append(buf.getvalue())
+    return photos
+
+
+def spot_overlay(enhanced: np.ndarray) -> np.ndarray:
+    # Spot statistics plus overlay drawing, as in app.py
+    return draw_spot_overlay(enhanced, analyze_spots(enhanced).boxes)
+
+
+def time_stage(fn: Callable, inputs: list, items_per_call: int = 1, repeats: int = 1) -> Dict[str, float]:
+    """Calls fn on every input `repeats` times and summarizes per-call latency."""
+    fn(inputs[0])  # warm-up, not timed
+    latencies = []
+    for _ in range(repeats):
+        for x in inputs:
+            start = time.perf_counter()
+            fn(x)
+            latencies.append(time.perf_counter() - start)
+    lat = np.array(latencies)
+    return {
+        "calls": len(lat),
+        "p50_ms": round(float(np.percentile(lat, 50)) * 1000, 4),
+        "p95_ms": round(float(np.percentile(lat, 95)) * 1000, 4),
+        "mean_ms": round(float(lat.mean()) * 1000, 4),
+        "images_per_s": round(items_per_call * len(lat) / float(lat.sum()), 2),
+    }
+
+
+def decode(data: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def run(args) -> dict:
+    paths = sample_paths(args.samples)
+    raw = []
+    for p in paths:
+        with open(p, "rb") as f:
+            raw.append(f.read())
+    phones = synthetic_phone_photos(raw, args.large)
+    print(f"{len(raw)} dataset images, {len(phones)} synthetic phone photos", file=sys.stderr)
+
+    results = {}
+
+    def record(name, stats):
+        results[name] = stats
+        print(f"  {name:<32} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms  "
+              f"{stats['images_per_s']:9.1f} img/s", file=sys.stderr)
+
+    for suite, blobs in (("dataset", raw), ("phone", phones)):
+        decoded = [decode(b) for b in blobs]
+        enhanced = [preprocess_image(img) for img in decoded]
+        record(f"{suite}/decode", time_stage(decode, blobs, repeats=args.repeats))
+        record(f"{suite}/load_image", time_stage(load_image, blobs, repeats=args.repeats))
+        record(f"{suite}/preprocess_image", time_stage(preprocess_image, decoded, repeats=args.repeats))
+        record(f"{suite}/preprocess_images", time_stage(
+            preprocess_images, [decoded], items_per_call=len(decoded), repeats=args.repeats
+        ))
+        record(f"{suite}/spot_detection", time_stage(spot_overlay, enhanced, repeats=args.repeats))
+
+    if not args.skip_model:
+        warm_up(background=False)
+        decoded = [decode(b) for b in raw]
+        for bs in BATCH_SIZES:
+            # Cycle through the sample to fill batches larger than it
+            batches = [
+                [decoded[(start + i) % len(decoded)] for i in range(bs)]
+                for start in range(0, max(len(decoded), bs), bs)
+            ]
+            record(f"dataset/predict_b{bs}", time_stage(
+                lambda batch: predict_leaf_disease_batch(batch, batch_size=bs),
+                batches, items_per_call=bs, repeats=args.repeats
+            ))
+        if phones:
+            # Overlapping windows of one phone photo; items are windows
+            canopy = load_large_image(phones[0]).rgb
+            windows = len(tile_offsets(canopy.shape[0], 224, TILE_STRIDE)) * \
+                len(tile_offsets(canopy.shape[1], 224, TILE_STRIDE))
+            for bs in BATCH_SIZES:
+                record(f"phone/predict_tiled_b{bs}", time_stage(
+                    lambda rgb: predict_leaf_disease_tiled(rgb, batch_size=bs),
+                    [canopy], items_per_call=windows, repeats=args.repeats
+                ))
+
+    labels = load_labels() if not args.skip_model else ["Tomato_Early_blight", "Unknown_class"]
+    cases = [(labels[i % len(labels)], c) for i, c in enumerate(np.linspace(0.3, 0.99, 64))]
+    record("report/generate_disease_report", time_stage(
+        lambda case: generate_disease_report(*case), cases, repeats=args.repeats * 10
+    ))
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "backend": None if args.skip_model else get_backend(),
+            "samples": len(raw),
+            "phone_photos": len(phones),
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Returns one message per stage metric that got worse than baseline by more than threshold."""
+    regressions = []
+    for stage, base in baseline["results"].items():
+        cur = current["results"].get(stage)
+        if cur is None:
+            continue
+        for metric in LOWER_IS_BETTER + ("images_per_s",):
+            old, new = base[metric], cur[metric]
+            if old <= 0:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            if worse:
+                regressions.append(f"{stage} {metric}: {old} → {new} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the diagnosis pipeline.")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Flag regressions against a saved results file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression (default 10%%)")
+    parser.add_argument("--samples", type=int, default=64, help="Dataset images in the fixed sample")
+    parser.add_argument("--large", type=int, default=4, help="Synthetic 12 MP phone photos")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip-model", action="store_true", help="Skip stages that need the trained model")
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(current, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) vs {args.compare}:", file=sys.stderr)
+            for msg in regressions:
+                print(f"  {msg}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions vs {args.compare}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# benchmark_app.py
+#
+# Per-session footprint of the Streamlit app, with and without lean rendering
+# (LEAFMEDIC_LEAN_UI, see app.py). Each mode runs in a fresh process that
+# opens --sessions concurrent app sessions (streamlit.testing AppTest), each
+# uploading a different synthetic 12 MP phone photo, then moves the top-k
+# slider once in every session. Each mode gets its own empty prediction
+# cache in a temporary directory. Reports, per session:
+#   - RSS growth of the server process
+#   - bytes sent to the browser: protobuf deltas plus media files (images,
+#     downloads) the browser has not fetched yet, for the first render and
+#     for a rerun
+#
+#   python benchmark_app.py --sessions 20 -o app_footprint.json
+
+import gc
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import argparse
+import subprocess
+
+from benchmark import sample_paths, synthetic_phone_photos
+
+# Stand-in for the file uploader: every session uploads the photo named by
+# its first script run, as a real browser session would
+WRAPPER = """
+import io, os, streamlit as st
+
+class _Upload(io.BytesIO):
+    name = "leaf.jpg"
+    file_id = "bench"
+
+if "bench_photo" not in st.session_state:
+    st.session_state.bench_photo = os.environ["LEAFMEDIC_BENCH_PHOTO"]
+with open(st.session_state.bench_photo, "rb") as f:
+    _data = f.read()
+st.file_uploader = lambda *args, **kwargs: _Upload(_data)
+with open("app.py", encoding="utf-8") as f:
+    _source = f.read()
+exec(compile(_source, "app.py", "exec"))
+"""
+
+
+def rss_bytes() -> int:
+    gc.collect()
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class ByteCounter:
+    """Counts what a session would send over its websocket and media endpoint."""
+
+    def __init__(self):
+        self.delta_bytes = 0
+        self.media_bytes = 0
+        self.seen_media = set()
+
+    def install(self) -> None:
+        from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+        from streamlit.runtime.media_file_manager import MediaFileManager
+
+        counter = self
+        enqueue, add = ForwardMsgQueue.enqueue, MediaFileManager.add
+
+        def counting_enqueue(queue, msg):
+            counter.delta_bytes += msg.ByteSize()
+            return enqueue(queue, msg)
+
+        def counting_add(mgr, path_or_data, *args, **kwargs):
+            if isinstance(path_or_data, bytes):
+                key = hashlib.sha256(path_or_data).digest()
+                if key not in counter.seen_media:  # the browser caches media by URL
+                    counter.seen_media.add(key)
+                    counter.media_bytes += len(path_or_data)
+            return add(mgr, path_or_data, *args, **kwargs)
+
+        ForwardMsgQueue.enqueue = counting_enqueue
+        MediaFileManager.add = counting_add
+
+    def take(self) -> int:
+        sent = self.delta_bytes + self.media_bytes
+        self.delta_bytes = self.media_bytes = 0
+        return sent
+
+
+def run_child(args) -> dict:
+    """Runs one mode in this process and returns its per-session averages."""
+    from streamlit.testing.v1 import AppTest
+
+    counter = ByteCounter()
+    counter.install()
+    with open(args.photos) as f:
+        photos = json.load(f)
+    with tempfile.NamedTemporaryFile("w", suffix=".py", dir=".", delete=False) as f:
+        f.write(WRAPPER)
+        wrapper = f.name
+
+    try:
+        def open_session(photo):
+            os.environ["LEAFMEDIC_BENCH_PHOTO"] = photo
+            at = AppTest.from_file(wrapper, default_timeout=300)
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+            return at
+
+        open_session(photos[0])  # model load, tracing and imports, not counted
+        counter.take()
+
+        rss_before = rss_bytes()
+        sessions, first, rerun = [], [], []
+        for photo in photos[1:args.sessions + 1]:
+            counter.seen_media.clear()
+            sessions.append(open_session(photo))
+            first.append(counter.take())
+            sessions[-1].slider[0].set_value(8).run()
+            rerun.append(counter.take())
+        rss_after = rss_bytes()
+    finally:
+        os.unlink(wrapper)
+
+    n = len(sessions)
+    return {
+        "sessions": n,
+        "rss_per_session_kb": (rss_after - rss_before) / n / 1024,
+        "first_render_kb": sum(first) / n / 1024,
+        "rerun_kb": sum(rerun) / n / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-session memory and bytes sent by the Streamlit app.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--child", choices=["lean", "full"], help=argparse.SUPPRESS)
+    parser.add_argument("--photos", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = sample_paths(args.sessions + 1)
+        sources = []
+        for p in paths:
+            with open(p, "rb") as f:
+                sources.append(f.read())
+        photos = []
+        for i, data in enumerate(synthetic_phone_photos(sources, len(sources))):
+            photos.append(os.path.join(tmp, f"photo{i}.jpg"))
+            with open(photos[-1], "wb") as f:
+                f.write(data)
+        with open(os.path.join(tmp, "photos.json"), "w") as f:
+            json.dump(photos, f)
+        print(f"{len(photos) - 1} sessions, each uploading a 12 MP photo", file=sys.stderr)
+
+        results = {}
+        for mode in ("full", "lean"):
+            # An empty prediction cache per mode, so neither mode gets hits
+            # from the other and the user's cache is left alone
+            env = dict(os.environ, LEAFMEDIC_LEAN_UI="1" if mode == "lean" else "0",
+                       LEAFMEDIC_PREDICTION_CACHE=os.path.join(tmp, f"cache_{mode}.sqlite"))
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--sessions", str(args.sessions),
+                 "--photos", os.path.join(tmp, "photos.json")],
+                env=env, stdout=subprocess.PIPE, check=True, text=True
+            ).stdout
+            results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"\n{'mode':<6} {'RSS/session':>12} {'first render':>13} {'rerun':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<6} {r['rss_per_session_kb']:>9.0f} KB {r['first_render_kb']:>10.1f} KB "
+              f"{r['rerun_kb']:>6.1f} KB")
+    full, lean = results["full"], results["lean"]
+    print(f"\nLean rendering: {1 - lean['first_render_kb'] / full['first_render_kb']:.0%} fewer bytes on first "
+          f"render, {1 - lean['rerun_kb'] / full['rerun_kb']:.0%} fewer per rerun")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmark_cascade.py
+#
+# Escalation rate, latency reduction and agreement with the full model of
+# cascade inference (see utils.predict.set_cascade) on a sample of the
+# held-out validation split. Needs model/fast_model.keras from
+# `python train_model.py --fast`.
+#
+#   python benchmark_cascade.py --samples 500 -o cascade.json
+#   python benchmark_cascade.py --calibrate --agreement 0.995   # recalibrate the threshold first
+
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from utils.image_io import load_image
+from utils.manifest import load_split
+from utils.predict import (
+    calibrate_cascade, cascade_stats, current_version, load_labels, predict_leaf_disease,
+    predict_leaf_disease_batch, set_cascade, warm_up
+)
+
+DATA_DIR = "data/PlantVillage"
+BATCH_SIZE = 32
+
+
+def load_sample(val_files, num_samples: int):
+    """Evenly spaced validation images, decoded the way the app does."""
+    step = max(1, len(val_files) // num_samples)
+    sample = val_files[::step][:num_samples]
+    return [load_image(path).model_rgb for path, _ in sample], np.array([idx for _, idx in sample])
+
+
+def evaluate(name: str, images, targets, labels) -> dict:
+    predict_leaf_disease(images[0])  # trace this shape before timing
+    latencies, predicted = [], []
+    before = cascade_stats()
+    for img in images:
+        start = time.perf_counter()
+        label, _, _ = predict_leaf_disease(img)
+        latencies.append(time.perf_counter() - start)
+        predicted.append(label)
+    after = cascade_stats()
+    predict_leaf_disease_batch(images, BATCH_SIZE)  # traces the batch shapes, incl. partial escalations
+    start = time.perf_counter()
+    predict_leaf_disease_batch(images, BATCH_SIZE)
+    batched_s = time.perf_counter() - start
+    lat = np.array(latencies) * 1000
+    predicted = np.array(predicted)
+    return {
+        "name": name,
+        "accuracy": float(np.mean(predicted == np.asarray(labels)[targets])),
+        "mean_ms": float(lat.mean()),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "batched_ms_per_image": batched_s * 1000 / len(images),
+        "escalated": after["escalated"] - before["escalated"],
+        "predicted": predicted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark confidence-gated cascade inference.")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Recalibrate the threshold on the whole validation split first")
+    parser.add_argument("--agreement", type=float, default=0.99, help="Target agreement for --calibrate")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    version = current_version()
+    if not version.has_fast_model():
+        sys.exit(f"No fast model at {version.fast_model_path}; run `python train_model.py --fast` first.")
+
+    _, _, val_files = load_split(DATA_DIR)
+    if args.calibrate:
+        config = calibrate_cascade((load_image(path).model_rgb for path, _ in val_files), args.agreement)
+        print(f"Calibrated on {config['calibration_images']} validation images.", file=sys.stderr)
+    config = version.fast_config()
+
+    labels = load_labels()
+    images, targets = load_sample(val_files, args.samples)
+    print(f"{len(images)} validation images, fast model {version.fast_input_size()[0]}px, "
+          f"threshold {config['threshold']:.3f}", file=sys.stderr)
+
+    set_cascade(False)
+    warm_up(background=False)
+    full = evaluate("full", images, targets, labels)
+
+    set_cascade(True)
+    warm_up(background=False)
+    cascade = evaluate("cascade", images, targets, labels)
+
+    escalation_rate = cascade["escalated"] / len(images)
+    agreement = float(np.mean(cascade["predicted"] == full["predicted"]))
+
+    print(f"\n{'mode':<9} {'accuracy':>8} {'mean ms':>8} {'p95 ms':>8} {'batched ms/img':>15}")
+    for r in (full, cascade):
+        print(f"{r['name']:<9} {r['accuracy']:>8.3f} {r['mean_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['batched_ms_per_image']:>15.2f}")
+    print(f"\nEscalated to the full model: {escalation_rate:.1%}")
+    print(f"Agreement with the full model: {agreement:.2%}")
+    print(f"Mean latency reduction: {1 - cascade['mean_ms'] / full['mean_ms']:.1%} single-image, "
+          f"{1 - cascade['batched_ms_per_image'] / full['batched_ms_per_image']:.1%} batched")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "samples": len(images),
+                "threshold": config["threshold"],
+                "escalation_rate": escalation_rate,
+                "agreement": agreement,
+                "results": [{k: v for k, v in r.items() if k != "predicted"} for r in (full, cascade)],
+            }, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmark_training.py
+#
+# Scaling benchmark for data-parallel CPU training: runs train_model.py with
+# 1, 2 and 4 local workers on data/PlantVillage and reports epoch time,
+# throughput and scaling efficiency. The first epoch also fills the
+# decoded-image cache, so the steady-state figures come from the later epochs.
+# Every run, including the 1-worker baseline, goes through the same
+# MultiWorkerMirroredStrategy cluster path (train_model.py --cluster), so
+# speedup and efficiency compare like with like.
+#
+#   python benchmark_training.py -o training_scaling.json
+#   python benchmark_training.py --workers 1 2 4 8 --epochs 3 --xla
+#
+# Each run trains and overwrites model/disease_model.keras; keep a copy of a
+# model you care about.
+
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+
+def run_training(workers: int, args, timing_path: str) -> dict:
+    cmd = [
+        sys.executable, "train_model.py",
+        "--workers", str(workers),
+        "--cluster",
+        "--epochs", str(args.epochs),
+        "--timing-file", timing_path,
+    ]
+    if args.xla:
+        cmd.append("--xla")
+    if args.inter_op_threads:
+        cmd += ["--inter-op-threads", str(args.inter_op_threads)]
+    print(f"$ {' '.join(cmd)}", file=sys.stderr)
+    subprocess.run(cmd, check=True)
+    with open(timing_path) as f:
+        return json.load(f)
+
+
+def summarize(timing: dict) -> dict:
+    epochs = timing["epoch_s"]
+    steady = epochs[1:] or epochs
+    images = timing["steps_per_epoch"] * timing["global_batch"]
+    steady_s = float(np.median(steady))
+    return {
+        "workers": timing["workers"],
+        "global_batch": timing["global_batch"],
+        "first_epoch_s": round(epochs[0], 2),
+        "epoch_s": round(steady_s, 2),
+        "images_per_s": round(images / steady_s, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Epoch time of train_model.py for several worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--epochs", type=int, default=2, help="Epochs per run; all but the first are steady state")
+    parser.add_argument("--xla", action="store_true")
+    parser.add_argument("--inter-op-threads", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            results.append(summarize(run_training(workers, args, os.path.join(tmp, f"timing_{workers}.json"))))
+
+    base = results[0]
+    for r in results:
+        r["speedup"] = round(base["epoch_s"] / r["epoch_s"], 2)
+        r["efficiency"] = round(r["speedup"] * base["workers"] / r["workers"], 2)
+
+    print(f"\n{'workers':>7}  {'global batch':>12}  {'1st epoch s':>11}  {'epoch s':>8}  "
+          f"{'img/s':>8}  {'speedup':>7}  {'efficiency':>10}")
+    for r in results:
+        print(f"{r['workers']:>7}  {r['global_batch']:>12}  {r['first_epoch_s']:>11.1f}  {r['epoch_s']:>8.1f}  "
+              f"{r['images_per_s']:>8.1f}  {r['speedup']:>7.2f}  {r['efficiency']:>10.0%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {"cpus": os.cpu_count(), "platform": platform.platform(),
+                         "epochs": args.epochs, "xla": args.xla},
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmark_tta.py
+#
+# Added latency vs. accuracy gain of test-time augmentation (see
+# utils.predict.predict_leaf_disease_tta) on a sample of the held-out
+# validation split. Compares plain prediction, always-on TTA and TTA gated
+# on low base confidence, plus the cost of scoring the same views one by one.
+#
+#   python benchmark_tta.py --samples 500 -o tta.json
+
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from utils.manifest import load_split
+from utils.predict import (
+    TTA_THRESHOLD, TTA_VIEWS, load_labels, predict_leaf_disease, predict_leaf_disease_tta, tta_views, warm_up
+)
+
+DATA_DIR = "data/PlantVillage"
+TARGET_SIZE = (224, 224)
+
+
+def load_sample(num_samples: int):
+    """Evenly spaced validation images, pre-resized so only prediction time is measured."""
+    _, _, val_files = load_split(DATA_DIR)
+    step = max(1, len(val_files) // num_samples)
+    sample = val_files[::step][:num_samples]
+    images = []
+    for path, _ in sample:
+        with Image.open(path) as img:
+            images.append(np.asarray(img.resize(TARGET_SIZE).convert("RGB")))
+    return images, np.array([idx for _, idx in sample])
+
+
+def evaluate(name: str, predict, images, targets, labels) -> dict:
+    predict(images[0])  # trace this shape before timing
+    latencies, correct, confidences = [], [], []
+    for img, target in zip(images, targets):
+        start = time.perf_counter()
+        label, confidence, _ = predict(img)
+        latencies.append(time.perf_counter() - start)
+        correct.append(label == labels[target])
+        confidences.append(confidence)
+    lat = np.array(latencies) * 1000
+    return {
+        "name": name,
+        "accuracy": float(np.mean(correct)),
+        "mean_ms": float(lat.mean()),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "correct": np.array(correct),
+        "confidence": np.array(confidences),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark test-time augmentation.")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=TTA_THRESHOLD, help="Confidence gate for gated TTA")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    labels = load_labels()
+    images, targets = load_sample(args.samples)
+    warm_up(background=False)
+    print(f"{len(images)} validation images, views: {', '.join(TTA_VIEWS)}", file=sys.stderr)
+
+    def separate(img):
+        # Every view as its own single-image call, for comparison with one batched pass
+        results = [predict_leaf_disease(view) for view in tta_views(img, TARGET_SIZE)]
+        probs = np.mean([p for _, _, p in results], axis=0)
+        return labels[int(np.argmax(probs))], float(probs.max()), probs
+
+    runs = [
+        evaluate("plain", predict_leaf_disease, images, targets, labels),
+        evaluate("tta", predict_leaf_disease_tta, images, targets, labels),
+        evaluate(f"tta<{args.threshold:g}",
+                 lambda img: predict_leaf_disease_tta(img, threshold=args.threshold), images, targets, labels),
+        evaluate("tta-separate", separate, images, targets, labels),
+    ]
+
+    plain = runs[0]
+    low = plain["confidence"] < args.threshold
+    print(f"\n{'mode':<14} {'accuracy':>8} {'mean ms':>8} {'p95 ms':>8} {'added ms':>9} {'low-conf acc':>13}")
+    for r in runs:
+        r["added_ms"] = r["mean_ms"] - plain["mean_ms"]
+        r["low_conf_accuracy"] = float(r["correct"][low].mean()) if low.any() else None
+        low_acc = f"{r['low_conf_accuracy']:.3f}" if low.any() else "-"
+        print(f"{r['name']:<14} {r['accuracy']:>8.3f} {r['mean_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['added_ms']:>+9.2f} {low_acc:>13}")
+    print(f"\n{low.sum()} of {len(images)} images ({low.mean():.1%}) below the {args.threshold:g} gate; "
+          f"one batched TTA pass costs {runs[1]['mean_ms'] / runs[3]['mean_ms']:.0%} of scoring the views separately.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "samples": len(images),
+                "views": list(TTA_VIEWS),
+                "threshold": args.threshold,
+                "below_threshold": int(low.sum()),
+                "results": [{k: v for k, v in r.items() if k not in ("correct", "confidence")} for r in runs],
+            }, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# build_index.py
+#
+# Embeds every training image with the current model (penultimate 256-unit
+# Dense layer) into the similar-case index used by the app's "similar cases"
+# panel and utils.predict.find_similar_cases. Rerun after retraining; the
+# index records the model it was built from and refuses queries from another.
+#
+#   python build_index.py
+#   python build_index.py --batch-size 64 -o model/similar_index
+
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.manifest import load_split
+from utils.image_io import load_image
+from utils.predict import embed_images
+from utils.prediction_cache import model_fingerprint
+from utils.similar import SIMILAR_INDEX_PATH, open_index, write_index
+
+DATA_DIR = "data/PlantVillage"
+VAL_SPLIT = 0.2
+TARGET_SIZE = (224, 224)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the similar-case embedding index.")
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("-o", "--output", default=SIMILAR_INDEX_PATH, help="Index path, without extension")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--io-threads", type=int, default=4, help="Threads decoding images ahead of the model")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    class_indices, train_files, _ = load_split(args.data_dir, VAL_SPLIT)
+    names = {idx: name for name, idx in class_indices.items()}
+    paths = [path for path, _ in train_files]
+    labels = [names[idx] for _, idx in train_files]
+
+    dim = embed_images([np.zeros(TARGET_SIZE[::-1] + (3,), dtype=np.uint8)], batch_size=1).shape[1]
+    start = time.perf_counter()
+
+    def decode(path):
+        return load_image(path, TARGET_SIZE).model_rgb
+
+    def batches():
+        with ThreadPoolExecutor(args.io_threads) as pool:
+            for i in range(0, len(paths), args.batch_size):
+                images = list(pool.map(decode, paths[i:i + args.batch_size]))
+                yield embed_images(images, args.batch_size, TARGET_SIZE)
+                done = min(i + args.batch_size, len(paths))
+                print(f"\r{done}/{len(paths)} images", end="", file=sys.stderr)
+        print(file=sys.stderr)
+
+    fingerprint = model_fingerprint("keras", cascade=False)
+    write_index(args.output, batches(), len(paths), dim, paths, labels, fingerprint)
+    elapsed = time.perf_counter() - start
+
+    index = open_index(args.output)
+    size_mb = index.matrix.nbytes / 1e6
+    print(f"Indexed {len(index)} training images ({dim}-d float16, {size_mb:.1f} MB) "
+          f"in {elapsed:.1f}s. Index written to {args.output}.npy")
+
+    # Query latency against the freshly written index
+    queries = np.asarray(index.matrix[:min(20, len(index))], dtype=np.float32)
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q, k=5)
+    print(f"Top-5 search: {(time.perf_counter() - start) / len(queries) * 1000:.2f} ms per query")
+
+
+if __name__ == "__main__":
+    main()
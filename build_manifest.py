@@ -0,0 +1,73 @@
+# build_manifest.py
+#
+# Scans data/PlantVillage into data/manifest.json (see utils/manifest.py) and
+# reports corrupt files and exact/near-duplicate images, including duplicates
+# that fall on both sides of the train/validation split. Rerunning it only
+# re-reads files that are new or changed since the last scan.
+#
+#   python build_manifest.py
+#   python build_manifest.py --max-distance 6 --report duplicates.json
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from utils.manifest import MANIFEST_PATH, NEAR_DUPLICATE_DISTANCE, build_manifest, load_manifest, save_manifest
+
+DATA_DIR = "data/PlantVillage"
+VAL_SPLIT = 0.2
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or update the dataset manifest.")
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("-o", "--output", default=MANIFEST_PATH, help="Manifest file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scan processes")
+    parser.add_argument("--max-distance", type=int, default=NEAR_DUPLICATE_DISTANCE,
+                        help="Perceptual-hash bits that may differ for a near-duplicate (-1 disables)")
+    parser.add_argument("--full", action="store_true", help="Rescan every file, ignoring the existing manifest")
+    parser.add_argument("--report", help="Also write corrupt files and duplicate groups to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    previous = None if args.full else load_manifest(args.output)
+
+    start = time.perf_counter()
+    manifest = build_manifest(args.data_dir, previous, args.workers, args.max_distance, VAL_SPLIT)
+    save_manifest(manifest, args.output)
+    elapsed = time.perf_counter() - start
+
+    stats = manifest["stats"]
+    print(f"{stats['files']} files in {len(manifest['classes'])} classes: {stats['scanned']} scanned, "
+          f"{stats['reused']} unchanged ({elapsed:.1f}s). Manifest written to {args.output}")
+
+    corrupt = [r for r in manifest["files"] if "error" in r]
+    duplicates = manifest["duplicates"]
+    exact = [g for g in duplicates if g["kind"] == "exact"]
+    cross_split = [g for g in duplicates if g["cross_split"]]
+    cross_class = [g for g in duplicates if len(g["classes"]) > 1]
+
+    print(f"  corrupt:             {len(corrupt)}")
+    for r in corrupt:
+        print(f"    {r['path']}: {r['error']}")
+    print(f"  duplicate groups:    {len(exact)} exact, {len(duplicates) - len(exact)} near "
+          f"({sum(len(g['paths']) for g in duplicates)} files)")
+    print(f"  across train/val:    {len(cross_split)}")
+    print(f"  across classes:      {len(cross_class)}")
+    for g in cross_split[:10]:
+        print(f"    [{g['kind']}] " + ", ".join(g["paths"]))
+    if len(cross_split) > 10:
+        print(f"    ... {len(cross_split) - 10} more (see --report)")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"corrupt": corrupt, "duplicates": duplicates}, f, indent=2)
+        print(f"Report written to {args.report}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# compare_backends.py
+#
+# Accuracy-vs-latency comparison of the inference backends in utils.predict.
+# Each exported TFLite model is run on a sample of the validation split and
+# compared against the float Keras model. Exits non-zero when top-1 agreement
+# drops below --tolerance, so it can gate a backend switch.
+#
+#   python compare_backends.py --samples 500 --tolerance 0.99
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from utils.manifest import load_split
+from utils.predict import BACKENDS, current_version, predict_leaf_disease_batch, set_backend
+
+DATA_DIR = "data/PlantVillage"
+TARGET_SIZE = (224, 224)
+
+
+def load_sample(num_samples: int):
+    _, _, val_files = load_split(DATA_DIR, log=print)
+    step = max(1, len(val_files) // num_samples)
+    sample = val_files[::step][:num_samples]
+    # Pre-resize once so only model time is measured
+    images = []
+    for path, _ in sample:
+        with Image.open(path) as img:
+            images.append(img.resize(TARGET_SIZE).convert("RGB"))
+    return images, np.array([idx for _, idx in sample])
+
+
+def run_backend(name: str, images, batch_size: int):
+    set_backend(name)
+    predict_leaf_disease_batch(images[:1], batch_size=1)                       # warm single
+    predict_leaf_disease_batch(images[:batch_size], batch_size=batch_size)     # warm batched
+
+    n_single = min(len(images), 50)
+    start = time.perf_counter()
+    for img in images[:n_single]:
+        predict_leaf_disease_batch([img], batch_size=1)
+    single_ms = (time.perf_counter() - start) / n_single * 1000
+
+    start = time.perf_counter()
+    _, _, probs = predict_leaf_disease_batch(images, batch_size=batch_size)
+    batched_ms = (time.perf_counter() - start) / len(images) * 1000
+    return probs, single_ms, batched_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Keras and TFLite backends.")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--tolerance", type=float, default=0.99,
+                        help="Minimum top-1 agreement with the Keras model")
+    args = parser.parse_args()
+
+    images, truth = load_sample(args.samples)
+    print(f"{len(images)} validation images, batch size {args.batch_size}\n")
+    print(f"{'backend':<16}{'size MB':>9}{'ms/img b=1':>12}{'ms/img batched':>16}"
+          f"{'accuracy':>10}{'agreement':>11}{'max |Δp|':>10}")
+
+    version = current_version()
+    reference = None
+    failed = []
+    for name in BACKENDS:
+        path = version.tflite_paths.get(name)
+        if path is not None and not os.path.exists(path):
+            print(f"{name:<16}  skipped, {path} not found (run export_tflite.py)")
+            continue
+        probs, single_ms, batched_ms = run_backend(name, images, args.batch_size)
+        top1 = probs.argmax(axis=1)
+        if reference is None:
+            reference = probs
+        agreement = float(np.mean(top1 == reference.argmax(axis=1)))
+        max_diff = float(np.abs(probs - reference).max())
+        size_mb = os.path.getsize(path or version.model_path) / 1e6
+        print(f"{name:<16}{size_mb:>9.1f}{single_ms:>12.2f}{batched_ms:>16.2f}"
+              f"{np.mean(top1 == truth):>10.3f}{agreement:>11.3f}{max_diff:>10.4f}")
+        if agreement < args.tolerance:
+            failed.append(name)
+
+    if failed:
+        print(f"\nTop-1 agreement below {args.tolerance}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
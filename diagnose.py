@@ -0,0 +1,287 @@
+# diagnose.py
+#
+# Batch diagnosis over a directory tree, e.g. data/PlantVillage or a field
+# survey dump. Images are decoded in a worker pool, scored in batches and
+# streamed out one JSONL/CSV row per image, including lesion coverage
+# (spot_count, affected_ratio). A checkpoint file records how far the
+# (deterministic, sorted) walk has got, so an interrupted run resumes without
+# reprocessing finished images. Predictions go through the on-disk prediction
+# cache, together with their spot statistics: decode workers hash each file
+# and look it up first, so rescanning a mostly unchanged folder only decodes
+# and runs the model on new or changed files.
+#
+#   python diagnose.py data/PlantVillage -o results.jsonl
+#   python diagnose.py /mnt/survey -o results.csv --top-k 5 --workers 8
+
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from utils.image_io import load_image
+from utils.predict import DEFAULT_BATCH_SIZE, load_labels, predict_leaf_disease_batch, top_predictions
+from utils.prediction_cache import DEFAULT_PATH as CACHE_PATH, PredictionCache, content_digest
+from utils.preprocess import preprocess_images
+from utils.report import generate_disease_report
+from utils.spots import analyze_spots_batch
+
+IMG_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+TARGET_SIZE = (224, 224)
+CSV_FIELDS = ["path", "label", "confidence", "top_k", "spot_count", "affected_ratio", "report", "error"]
+
+
+def iter_image_paths(root: str) -> Iterator[str]:
+    """Yields image paths under root in a stable, sorted order without listing the whole tree up front."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname.lower().endswith(IMG_EXTENSIONS):
+                yield os.path.join(dirpath, fname)
+
+
+class Loaded(NamedTuple):
+    """One file after the decode worker: cached results, or pixels to score."""
+    path: str
+    rgb: Optional[np.ndarray]     # model-size uint8 RGB; None on error or when fully cached
+    error: Optional[str]
+    digest: Optional[str]
+    probs: Optional[np.ndarray]   # cached probabilities
+    spots: Optional[Tuple[int, float]]  # cached (spot_count, affected_ratio)
+
+
+# Read-only view of the prediction cache in each decode worker (see init_worker)
+_worker_cache: Optional[PredictionCache] = None
+
+
+def init_worker(cache_path: Optional[str], fingerprint: Optional[str]) -> None:
+    """Pool initializer; the fingerprint comes from the parent so workers never hash the model file."""
+    global _worker_cache
+    if cache_path is not None:
+        _worker_cache = PredictionCache(cache_path, fingerprint=fingerprint)
+
+
+def load_for_model(path: str) -> Loaded:
+    """
+    Worker: reads one image, hashes its bytes and looks the digest up in the
+    prediction cache. Only if the prediction or the spot statistics are
+    missing is the image decoded to the model input size with
+    utils.image_io.load_image, exactly as the app and serve.py do.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = content_digest(data)
+        probs = spots = None
+        if _worker_cache is not None:
+            probs = _worker_cache.get(digest)
+            spots = _worker_cache.get_spots_many([digest]).get(digest)
+        rgb = None if probs is not None and spots is not None else load_image(data, TARGET_SIZE).model_rgb
+        return Loaded(path, rgb, None, digest, probs, spots)
+    except Exception as e:
+        return Loaded(path, None, f"{type(e).__name__}: {e}", None, None, None)
+
+
+# — Checkpointing —
+def read_checkpoint(path: str, root: str) -> dict:
+    if not os.path.exists(path):
+        return {"root": os.path.abspath(root), "done": 0, "output_offset": 0}
+    with open(path, "r") as f:
+        state = json.load(f)
+    if state.get("root") != os.path.abspath(root):
+        raise ValueError(f"Checkpoint {path} belongs to {state.get('root')}, not {os.path.abspath(root)}")
+    return state
+
+
+def write_checkpoint(path: str, state: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# — Output —
+class RowWriter:
+    """Appends result rows to a .jsonl or .csv file, truncated to the last checkpointed offset."""
+
+    def __init__(self, path: str, offset: int):
+        self.fmt = "csv" if path.lower().endswith(".csv") else "jsonl"
+        fresh = offset == 0
+        self.f = open(path, "w" if fresh else "r+", newline="", encoding="utf-8")
+        if not fresh:
+            # Drop rows written after the last checkpoint; they will be redone
+            self.f.seek(offset)
+            self.f.truncate()
+        self.csv = csv.DictWriter(self.f, fieldnames=CSV_FIELDS) if self.fmt == "csv" else None
+        if self.csv is not None and fresh:
+            self.csv.writeheader()
+
+    def write(self, row: dict) -> None:
+        if self.csv is not None:
+            row = dict(row)
+            if "top_k" in row:
+                row["top_k"] = ";".join(f"{t['label']}:{t['confidence']:.4f}" for t in row["top_k"])
+            self.csv.writerow(row)
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def flush(self) -> int:
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return self.f.tell()
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def score_batch(
+    loaded: List[Loaded],
+    labels: List[str],
+    top_k: int,
+    batch_size: int,
+    with_report: bool,
+    cache: Optional[PredictionCache] = None
+) -> List[dict]:
+    """
+    Builds one row per image of a batch. Only images without a cached
+    prediction go through the model, and only those without cached spot
+    statistics through preprocessing and spot analysis; new results are
+    written back to the cache.
+    """
+    rows = {item.path: {"path": item.path, "error": item.error} for item in loaded if item.error is not None}
+    ok = [item for item in loaded if item.error is None]
+
+    if ok:
+        all_probs = np.empty((len(ok), len(labels)), dtype=np.float32)
+        misses = []
+        for i, item in enumerate(ok):
+            if item.probs is not None:
+                all_probs[i] = item.probs
+            else:
+                misses.append(i)
+        if misses:
+            _, _, miss_probs = predict_leaf_disease_batch([ok[i].rgb for i in misses], batch_size=batch_size)
+            all_probs[misses] = miss_probs
+            if cache is not None:
+                cache.put_many((ok[i].digest, p) for i, p in zip(misses, miss_probs))
+
+        spot_stats = [item.spots for item in ok]
+        spot_misses = [i for i, item in enumerate(ok) if item.spots is None]
+        if spot_misses:
+            # Spots on the enhanced 224×224 image, as in the app overlay; lesion
+            # coverage of the leaf on the same pixels before enhancement
+            model_rgb = np.stack([ok[i].rgb for i in spot_misses])
+            spots = analyze_spots_batch(preprocess_images(model_rgb), rgb=model_rgb)
+            for j, i in enumerate(spot_misses):
+                spot_stats[i] = (int(spots.counts[j]), float(spots.affected_ratio[j]))
+            if cache is not None:
+                cache.put_spots_many((ok[i].digest,) + spot_stats[i] for i in spot_misses)
+
+        pred_labels, confidences = top_predictions(all_probs)
+        top_idx = np.argsort(all_probs, axis=1)[:, ::-1][:, :top_k]
+        for i, item in enumerate(ok):
+            label, confidence = str(pred_labels[i]), float(confidences[i])
+            spot_count, affected_ratio = spot_stats[i]
+            row = {
+                "path": item.path,
+                "label": label,
+                "confidence": round(confidence, 6),
+                "top_k": [
+                    {"label": labels[j], "confidence": round(float(all_probs[i, j]), 6)}
+                    for j in top_idx[i]
+                ],
+                "spot_count": spot_count,
+                "affected_ratio": round(affected_ratio, 6),
+            }
+            if with_report:
+                row["report"] = generate_disease_report(label, confidence)
+            rows[item.path] = row
+
+    return [rows[item.path] for item in loaded]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Diagnose every leaf image under a directory.")
+    parser.add_argument("root", help="Directory to scan recursively for images")
+    parser.add_argument("-o", "--output", default="diagnosis.jsonl", help="Output file (.jsonl or .csv)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.ckpt)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Decode worker processes")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--no-report", action="store_true", help="Skip the generate_disease_report text")
+    parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint")
+    parser.add_argument("--cache-path", default=CACHE_PATH, help="Prediction cache database")
+    parser.add_argument("--no-cache", action="store_true", help="Run the model on every image")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ckpt_path = args.checkpoint or args.output + ".ckpt"
+    if args.restart and os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    state = read_checkpoint(ckpt_path, args.root)
+    if not os.path.exists(args.output):
+        state.update(done=0, output_offset=0)
+    if state["done"]:
+        print(f"Resuming after {state['done']} images from {ckpt_path}", file=sys.stderr)
+
+    labels = load_labels()
+    top_k = max(1, min(args.top_k, len(labels)))
+    writer = RowWriter(args.output, state["output_offset"])
+    cache = None if args.no_cache else PredictionCache(args.cache_path)
+    worker_args = (None, None) if cache is None else (args.cache_path, cache.fingerprint)
+    hits = decoded = 0
+
+    paths = itertools.islice(iter_image_paths(args.root), state["done"], None)
+    chunks = iter(lambda: list(itertools.islice(paths, args.batch_size)), [])
+
+    # Spawned workers never inherit TensorFlow state from this process
+    ctx = multiprocessing.get_context("spawn")
+    processed, start = 0, time.perf_counter()
+    try:
+        with ctx.Pool(args.workers, initializer=init_worker, initargs=worker_args) as pool:
+            # Decode the next chunk while the current one is on the model, so
+            # at most two batches of images are in memory at a time
+            pending = None
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending = pool.map_async(load_for_model, chunk)
+            while pending is not None:
+                loaded = pending.get()
+                chunk = next(chunks, None)
+                pending = pool.map_async(load_for_model, chunk) if chunk is not None else None
+
+                for row in score_batch(loaded, labels, top_k, args.batch_size, not args.no_report, cache):
+                    writer.write(row)
+                state["output_offset"] = writer.flush()
+                state["done"] += len(loaded)
+                state["last_path"] = loaded[-1].path
+                write_checkpoint(ckpt_path, state)
+
+                processed += len(loaded)
+                hits += sum(item.probs is not None for item in loaded)
+                decoded += sum(item.rgb is not None for item in loaded)
+                elapsed = time.perf_counter() - start
+                print(f"\r{state['done']} images  {processed / elapsed:.1f} img/s", end="", file=sys.stderr)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"\nProcessed {processed} images in {elapsed:.1f}s ({rate:.1f} img/s). "
+          f"Results in {args.output}", file=sys.stderr)
+    if cache is not None:
+        print(f"Prediction cache: {hits} hits, {processed - hits} misses; {decoded} images decoded",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# evaluate.py
+#
+# Evaluation of the serving model on the held-out validation split. Images
+# are decoded in a thread pool exactly as the app decodes uploads, scored
+# through utils.predict in batches, and folded into running totals, so the
+# whole split streams through in bounded memory. Reports accuracy, the
+# confusion matrix, per-class precision/recall/F1, expected calibration error
+# (ECE) and throughput as JSON.
+#
+# Before that, a train/serve consistency check scores a sample of validation
+# images twice: through the training pipeline (utils.dataset, with
+# mobilenet_v2.preprocess_input) straight into the Keras model, and through
+# the serving path (predict_leaf_disease_batch) on the same decoded pixels.
+# Any preprocessing skew between the two fails the run (exit code 1).
+#
+#   python evaluate.py -o eval.json                # run after every retrain
+#   python evaluate.py --samples 1000 --batch-size 64
+#   python evaluate.py --consistency-only
+
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.image_io import load_image
+from utils.manifest import load_split
+from utils.predict import (
+    DEFAULT_BATCH_SIZE, current_version, get_backend, get_cascade, predict_leaf_disease_batch, set_backend,
+    set_cascade, warm_up
+)
+
+DATA_DIR = "data/PlantVillage"
+VAL_SPLIT = 0.2
+TARGET_SIZE = (224, 224)
+
+# Equal-width confidence bins for ECE
+CALIBRATION_BINS = 15
+# Largest absolute probability difference allowed between the training and serving paths
+CONSISTENCY_TOLERANCE = 1e-3
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate the serving model on the validation split.")
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    parser.add_argument("--samples", type=int, default=0, help="Evenly spaced validation images (0: all)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--io-threads", type=int, default=4, help="Threads decoding images ahead of the model")
+    parser.add_argument("--consistency-samples", type=int, default=64,
+                        help="Validation images scored through both the training and serving paths (0: skip)")
+    parser.add_argument("--tolerance", type=float, default=CONSISTENCY_TOLERANCE,
+                        help="Largest allowed probability difference between the two paths")
+    parser.add_argument("--consistency-only", action="store_true", help="Only run the consistency check")
+    args = parser.parse_args()
+    if args.consistency_only and args.consistency_samples <= 0:
+        parser.error("--consistency-only needs --consistency-samples of at least 1")
+    return args
+
+
+def evenly_spaced(files, num_samples: int):
+    if num_samples <= 0 or num_samples >= len(files):
+        return files
+    step = len(files) / num_samples
+    return [files[int(i * step)] for i in range(num_samples)]
+
+
+# — Train/Serve Consistency —
+def consistency_check(files, num_classes: int, tolerance: float) -> dict:
+    """
+    Scores the same decoded pixels through the training input pipeline and
+    the Keras model, and through predict_leaf_disease_batch (Keras backend).
+    Also reports how far the serving decoder (utils.image_io) moves
+    predictions compared with the training decoder, which is expected to
+    differ slightly (resampling filter, JPEG draft scaling) and is not asserted.
+    """
+    from utils.dataset import make_image_dataset
+
+    version = current_version()
+    model = version.load_model()
+    ds = make_image_dataset(files, num_classes, TARGET_SIZE[0], batch_size=len(files), training=False, cache_dir=None)
+    train_input, _ = next(iter(ds))
+    train_probs = model(train_input, training=False).numpy()
+    # preprocess_input is x / 127.5 - 1, so the training pipeline's uint8 pixels are recoverable exactly
+    pixels = np.rint((train_input.numpy() + 1.0) * 127.5).clip(0, 255).astype(np.uint8)
+
+    # Full Keras model only: no TFLite backend, no cascade, no shadow scoring
+    backend, cascade = get_backend(), get_cascade()
+    try:
+        set_backend("keras")
+        set_cascade(False)
+        _, _, serve_probs = predict_leaf_disease_batch(list(pixels), len(files), TARGET_SIZE, version, shadow=False)
+        serve_decoded = [load_image(path, TARGET_SIZE).model_rgb for path, _ in files]
+        _, _, decoded_probs = predict_leaf_disease_batch(serve_decoded, len(files), TARGET_SIZE, version, shadow=False)
+    finally:
+        set_backend(backend)
+        set_cascade(cascade)
+
+    max_diff = float(np.abs(serve_probs - train_probs).max())
+    return {
+        "samples": len(files),
+        "tolerance": tolerance,
+        "max_abs_prob_diff": max_diff,
+        "top1_agreement": float(np.mean(serve_probs.argmax(1) == train_probs.argmax(1))),
+        "passed": max_diff <= tolerance,
+        "decoder": {
+            "mean_abs_prob_diff": float(np.abs(decoded_probs - train_probs).mean()),
+            "top1_agreement": float(np.mean(decoded_probs.argmax(1) == train_probs.argmax(1))),
+        },
+    }
+
+
+# — Streaming Evaluation —
+class RunningEvaluation:
+    """Confusion matrix and calibration bins, updated one batch at a time."""
+
+    def __init__(self, num_classes: int, bins: int = CALIBRATION_BINS):
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.bin_count = np.zeros(bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(bins, dtype=np.float64)
+        self.bin_correct = np.zeros(bins, dtype=np.int64)
+
+    def update(self, targets: np.ndarray, probs: np.ndarray) -> None:
+        predicted = probs.argmax(axis=1)
+        confidence = probs[np.arange(len(probs)), predicted]
+        np.add.at(self.confusion, (targets, predicted), 1)
+        bins = np.minimum((confidence * len(self.bin_count)).astype(np.int64), len(self.bin_count) - 1)
+        self.bin_count += np.bincount(bins, minlength=len(self.bin_count))
+        self.bin_confidence += np.bincount(bins, weights=confidence, minlength=len(self.bin_count))
+        self.bin_correct += np.bincount(bins, weights=predicted == targets, minlength=len(self.bin_count)).astype(np.int64)
+
+    def results(self, labels) -> dict:
+        total = int(self.confusion.sum())
+        tp = np.diag(self.confusion).astype(np.float64)
+        predicted = self.confusion.sum(axis=0)
+        actual = self.confusion.sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, actual, out=np.zeros_like(tp), where=actual > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros_like(tp), where=(precision + recall) > 0)
+
+        nonempty = self.bin_count > 0
+        bin_acc = np.divide(self.bin_correct, self.bin_count, out=np.zeros(len(self.bin_count)), where=nonempty)
+        bin_conf = np.divide(self.bin_confidence, self.bin_count, out=np.zeros(len(self.bin_count)), where=nonempty)
+        ece = float(np.sum(self.bin_count * np.abs(bin_acc - bin_conf)) / max(total, 1))
+        edges = np.linspace(0, 1, len(self.bin_count) + 1)
+        return {
+            "images": total,
+            "accuracy": float(tp.sum() / max(total, 1)),
+            "macro_f1": float(f1[actual > 0].mean()) if total else 0.0,
+            "ece": ece,
+            "per_class": [
+                {"label": label, "precision": float(p), "recall": float(r), "f1": float(f), "support": int(n)}
+                for label, p, r, f, n in zip(labels, precision, recall, f1, actual)
+            ],
+            "calibration": [
+                {"range": [float(lo), float(hi)], "count": int(n), "accuracy": float(a), "confidence": float(c)}
+                for lo, hi, n, a, c in zip(edges[:-1], edges[1:], self.bin_count, bin_acc, bin_conf)
+                if n
+            ],
+            "labels": list(labels),
+            "confusion_matrix": self.confusion.tolist(),
+        }
+
+
+def evaluate(files, batch_size: int, io_threads: int, labels) -> dict:
+    """Streams files through parallel decoding and batched prediction."""
+    version = current_version()
+    running = RunningEvaluation(len(labels))
+    decode_s = 0.0
+
+    def decode(path):
+        return load_image(path, TARGET_SIZE).model_rgb
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(io_threads) as pool:
+        # Keep the next chunk decoding while the current one is on the model
+        chunks = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+        pending = pool.map(decode, [path for path, _ in chunks[0]]) if chunks else None
+        for i, chunk in enumerate(chunks):
+            t = time.perf_counter()
+            images = list(pending)
+            decode_s += time.perf_counter() - t
+            if i + 1 < len(chunks):
+                pending = pool.map(decode, [path for path, _ in chunks[i + 1]])
+            _, _, probs = predict_leaf_disease_batch(images, batch_size, TARGET_SIZE, version)
+            running.update(np.array([idx for _, idx in chunk]), probs)
+            done = min((i + 1) * batch_size, len(files))
+            print(f"\r{done}/{len(files)} images", end="", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+
+    results = running.results(labels)
+    results["throughput"] = {
+        "seconds": elapsed,
+        "images_per_s": len(files) / elapsed if elapsed else 0.0,
+        "decode_wait_s": decode_s,
+    }
+    return results
+
+
+def main():
+    args = parse_args()
+    class_indices, _, val_files = load_split(args.data_dir, VAL_SPLIT)
+    version = current_version()
+    labels = version.labels()
+    if [name for name, _ in sorted(class_indices.items(), key=lambda kv: kv[1])] != list(labels):
+        sys.exit(f"Classes under {args.data_dir} differ from model version '{version.name}'.")
+    warm_up(background=False)
+
+    report = {
+        "meta": {
+            "model_version": version.name,
+            "backend": get_backend(),
+            "cascade": get_cascade(),
+            "batch_size": args.batch_size,
+        },
+    }
+    consistency = None
+    if args.consistency_samples > 0:
+        # Scored as one batch, so 0 means "skip" here rather than "all" as for --samples
+        consistency = consistency_check(evenly_spaced(val_files, args.consistency_samples), len(labels), args.tolerance)
+        report["consistency"] = consistency
+        status = "passed" if consistency["passed"] else "FAILED"
+        print(f"Train/serve consistency {status}: max probability difference {consistency['max_abs_prob_diff']:.2e} "
+              f"(tolerance {args.tolerance:.0e}) on {consistency['samples']} images; serving decoder agrees on "
+              f"{consistency['decoder']['top1_agreement']:.1%} of top-1 labels", file=sys.stderr)
+    else:
+        print("Train/serve consistency check skipped (--consistency-samples 0)", file=sys.stderr)
+
+    if not args.consistency_only:
+        files = evenly_spaced(val_files, args.samples)
+        report.update(evaluate(files, args.batch_size, args.io_threads, labels))
+        print(f"Accuracy {report['accuracy']:.4f}, macro F1 {report['macro_f1']:.4f}, ECE {report['ece']:.4f} "
+              f"on {report['images']} images, {report['throughput']['images_per_s']:.1f} img/s")
+        worst = sorted(report["per_class"], key=lambda c: c["f1"])[:3]
+        print("Weakest classes: " + ", ".join(f"{c['label']} (F1 {c['f1']:.3f})" for c in worst))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    if consistency is not None and not consistency["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
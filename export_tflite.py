@@ -0,0 +1,97 @@
+# export_tflite.py
+#
+# Converts the trained model/disease_model.keras into quantized TFLite models
+# for CPU-only edge boxes:
+#   model/disease_model_dynamic.tflite   dynamic-range (int8 weights, float activations)
+#   model/disease_model_int8.tflite      full integer, calibrated on data/PlantVillage
+#
+# Select one at inference time with LEAFMEDIC_BACKEND=tflite-dynamic|tflite-int8
+# or utils.predict.set_backend(), and check it first with compare_backends.py.
+# Each export's input normalization is recorded in tflite_exports.json next to
+# it; utils.predict refuses an export whose record does not match.
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from utils.manifest import load_split
+from utils.predict import INPUT_NORMALIZATION, current_version, to_model_input
+
+DATA_DIR = "data/PlantVillage"
+TARGET_SIZE = (224, 224)
+
+
+def calibration_files(num_samples: int):
+    """Evenly spaced training images across all classes, in a fixed order."""
+    _, train_files, _ = load_split(DATA_DIR, log=print)
+    step = max(1, len(train_files) // num_samples)
+    return [path for path, _ in train_files[::step][:num_samples]]
+
+
+def representative_dataset(paths):
+    # Calibrate on exactly what utils.predict feeds the model
+    def gen():
+        for path in paths:
+            with Image.open(path) as img:
+                arr = to_model_input(img, TARGET_SIZE)
+            yield [arr[np.newaxis]]
+    return gen
+
+
+def convert(model: tf.keras.Model, mode: str, paths=None) -> bytes:
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == "int8":
+        converter.representative_dataset = representative_dataset(paths)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def record_export(meta_path: str, backend: str) -> None:
+    """Notes in tflite_exports.json which input normalization a backend's export was built for."""
+    exports = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            exports = json.load(f)
+    exports[backend] = {"input_normalization": INPUT_NORMALIZATION, "exported": time.time()}
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(exports, f, indent=2)
+    os.replace(tmp, meta_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export quantized TFLite models.")
+    parser.add_argument("--samples", type=int, default=300,
+                        help="Calibration images for full-int8 quantization")
+    parser.add_argument("--only", choices=["dynamic", "int8"],
+                        help="Export just one of the two models")
+    args = parser.parse_args()
+
+    # Exports sit next to the model of the active version
+    version = current_version()
+    model = version.load_model()
+    print(f"Loaded {version.model_path} (version '{version.name}')")
+
+    for mode in ("dynamic", "int8"):
+        if args.only and mode != args.only:
+            continue
+        paths = calibration_files(args.samples) if mode == "int8" else None
+        flatbuffer = convert(model, mode, paths)
+        backend = f"tflite-{mode}"
+        out_path = version.tflite_paths[backend]
+        with open(out_path, "wb") as f:
+            f.write(flatbuffer)
+        record_export(version.tflite_meta_path, backend)
+        print(f"{mode:<8} → {out_path} ({len(flatbuffer) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# loadgen.py
+#
+# Load generator for serve.py. Sends images from a directory with a fixed
+# number of concurrent clients and reports latency percentiles and throughput.
+# Each request appends a unique counter after the end of the image data
+# (ignored by decoders), so its SHA-256 is new and serve.py's prediction
+# cache cannot answer it: the numbers measure decoding and micro-batching.
+# --reuse-payloads sends the sampled bytes unchanged to measure cache hits.
+#
+#   python loadgen.py data/PlantVillage --concurrency 32 --requests 2000
+
+import os
+import time
+import asyncio
+import argparse
+import itertools
+
+import aiohttp
+import numpy as np
+
+IMG_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+
+
+def sample_images(root: str, limit: int):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(IMG_EXTENSIONS))
+    if not paths:
+        raise SystemExit(f"No images found under {root}")
+    step = max(1, len(paths) // limit)
+    payloads = []
+    for p in paths[::step][:limit]:
+        with open(p, "rb") as f:
+            payloads.append(f.read())
+    return payloads
+
+
+async def run(url: str, payloads, concurrency: int, total: int, unique: bool = True):
+    latencies, status_counts = [], {}
+    counter = itertools.count()
+    cycle = itertools.cycle(payloads)
+
+    async def client(session):
+        while (i := next(counter)) < total:
+            data = next(cycle)
+            if unique:
+                data += i.to_bytes(8, "little")
+            form = aiohttp.FormData()
+            form.add_field("image", data, filename="leaf.jpg", content_type="image/jpeg")
+            start = time.perf_counter()
+            try:
+                async with session.post(url, data=form) as resp:
+                    await resp.read()
+                    status = resp.status
+            except aiohttp.ClientError:
+                status = "error"
+            elapsed = time.perf_counter() - start
+            status_counts[status] = status_counts.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    return np.array(latencies), status_counts, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure latency and throughput of serve.py.")
+    parser.add_argument("root", help="Directory of images to send")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/predict")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--sample", type=int, default=64, help="Distinct images to cycle through")
+    parser.add_argument("--reuse-payloads", action="store_true",
+                        help="Send the sampled bytes unchanged, so repeats are prediction cache hits")
+    args = parser.parse_args()
+
+    payloads = sample_images(args.root, args.sample)
+    latencies, status_counts, wall = asyncio.run(
+        run(args.url, payloads, args.concurrency, args.requests, unique=not args.reuse_payloads)
+    )
+
+    print(f"requests:    {sum(status_counts.values())}  {status_counts}")
+    print(f"throughput:  {len(latencies) / wall:.1f} req/s over {wall:.1f}s")
+    if len(latencies):
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"latency:     p50 {p50:.1f} ms   p99 {p99:.1f} ms   max {latencies.max() * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# manage_models.py
+#
+# Model registry CLI (see utils/registry.py). Register the model that
+# train_model.py just wrote as a new version, then activate it: every app and
+# serve.py process watching the registry loads and warms it in the background
+# and swaps it in without a restart.
+#
+#   python manage_models.py register v2 --note "retrained with manifest split"
+#   python manage_models.py activate v2
+#   python manage_models.py list
+#   python manage_models.py activate default     # back to the plain model/ directory
+#
+# To compare a candidate against live traffic first, run it as a shadow:
+#   python serve.py --shadow-version v2
+
+import os
+import sys
+import time
+import argparse
+
+from utils import registry
+
+
+def cmd_list(args) -> None:
+    active = registry.active_version()
+    versions = registry.list_versions()
+    if not versions:
+        print("No model versions found.")
+        return
+    print(f"   {'version':<16} {'registered':<17} {'tflite':<14} note")
+    for name in versions:
+        meta = registry.read_metadata(name)
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(meta["created"])) if "created" in meta else "-"
+        tflite = ", ".join(
+            backend.split("-", 1)[1] for backend, fname in registry.TFLITE_FILES.items()
+            if os.path.exists(os.path.join(registry.version_dir(name), fname))
+        ) or "-"
+        marker = " *" if name == active else "  "
+        print(f"{marker} {name:<16} {created:<17} {tflite:<14} {meta.get('note', '')}")
+
+
+def cmd_register(args) -> None:
+    metadata = {"note": args.note} if args.note else {}
+    path = registry.register(args.name, args.source, metadata)
+    print(f"Registered version '{args.name}' at {path}")
+    if args.activate:
+        cmd_activate(args)
+
+
+def cmd_activate(args) -> None:
+    previous = registry.active_version()
+    registry.set_active(args.name)
+    print(f"Active version: {previous} → {args.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned LeafMedic models.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="List versions; * marks the active one").set_defaults(fn=cmd_list)
+
+    p = sub.add_parser("register", help="Copy a trained model into a new version")
+    p.add_argument("name")
+    p.add_argument("--source", default=registry.LEGACY_DIR,
+                   help="Directory with disease_model.keras and class_indices.json")
+    p.add_argument("--note", help="Free-text note stored in metadata.json")
+    p.add_argument("--activate", action="store_true", help="Make it the active version right away")
+    p.set_defaults(fn=cmd_register)
+
+    p = sub.add_parser("activate", help="Point the registry at a version")
+    p.add_argument("name")
+    p.set_defaults(fn=cmd_activate)
+
+    args = parser.parse_args()
+    try:
+        args.fn(args)
+    except (FileNotFoundError, FileExistsError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+# serve.py
+#
+# Local HTTP inference service. Concurrent uploads are queued and coalesced
+# into one batched forward pass, bounded by a maximum batch size and a
+# maximum queueing delay. When the queue is full, new requests get 503.
+#
+#   python serve.py --port 8080 --max-batch 32 --max-delay-ms 10
+#   curl -F image=@leaf.jpg "http://localhost:8080/predict?report=1"
+#
+# With --metrics, Prometheus metrics are served at /metrics and
+# POST /debug/profile?n=20&kind=cprofile traces the next n batches.
+#
+# Images seen before (same bytes, same model) are answered from the on-disk
+# prediction cache without decoding or queueing; --no-cache turns this off.
+#
+# The service follows the model registry's ACTIVE version (see
+# manage_models.py): a newly activated version is loaded and warmed in the
+# background and swapped in between batches. --shadow-version scores every
+# batch with a second version too and reports the agreement at /healthz.
+# --cascade lets the fast low-resolution model answer confident images.
+
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+from aiohttp import web
+
+from utils import metrics
+from utils.image_io import load_image
+from utils.predict import (
+    DEFAULT_BATCH_SIZE, ModelVersion, cascade_stats, current_version, get_cascade, predict_leaf_disease_batch,
+    set_cascade, set_shadow_version, shadow_stats, top_predictions, warm_up, watch_registry
+)
+from utils.prediction_cache import DEFAULT_PATH as CACHE_PATH, PredictionCache, content_digest
+from utils.report import generate_disease_report
+
+TARGET_SIZE = (224, 224)
+
+
+class QueueFull(Exception):
+    """Raised when the micro-batcher cannot accept more requests."""
+
+
+class MicroBatcher:
+    """
+    Collects single-image requests into batches. A batch is dispatched as soon
+    as it holds max_batch images or its oldest request has waited max_delay
+    seconds, whichever comes first. The model runs on one dedicated thread so
+    the event loop keeps accepting uploads meanwhile.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float, max_queue: int):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leafmedic-model")
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def predict(self, img: np.ndarray) -> Tuple[str, float, list, ModelVersion]:
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((img, future))
+        except asyncio.QueueFull:
+            raise QueueFull()
+        return await future
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            images = [img for img, _ in batch]
+            # The whole batch runs on the version active when it was dispatched
+            version = current_version()
+            try:
+                pred_labels, confidences, all_probs = await loop.run_in_executor(
+                    self.executor, predict_leaf_disease_batch, images, self.max_batch, TARGET_SIZE, version
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for i, (_, future) in enumerate(batch):
+                # The client may have gone away while the batch was running
+                if not future.done():
+                    future.set_result((str(pred_labels[i]), float(confidences[i]), all_probs[i].tolist(), version))
+
+
+def _overloaded() -> web.HTTPServiceUnavailable:
+    return web.HTTPServiceUnavailable(text="Inference queue is full, retry later.",
+                                      headers={"Retry-After": "1"})
+
+
+def _decode(data: bytes) -> np.ndarray:
+    # Decode here, off the model thread, so the batch only holds small images.
+    # Same decode as the app (draft scaling, EXIF orientation), so cached
+    # predictions do not depend on which tool scored an image first.
+    return load_image(data, TARGET_SIZE).model_rgb
+
+
+def _cache_lookup(cache: PredictionCache, data: bytes) -> Tuple[str, Optional[np.ndarray]]:
+    digest = content_digest(data)
+    return digest, cache.get(digest)
+
+
+async def handle_predict(request: web.Request) -> web.Response:
+    batcher: MicroBatcher = request.app["batcher"]
+
+    if request.content_type.startswith("multipart/"):
+        form = await request.post()
+        field = form.get("image")
+        if field is None or not hasattr(field, "file"):
+            raise web.HTTPBadRequest(text="Expected a multipart field named 'image'.")
+        data = field.file.read()
+    else:
+        data = await request.read()
+    if not data:
+        raise web.HTTPBadRequest(text="Empty upload.")
+
+    loop = asyncio.get_running_loop()
+    cache: Optional[PredictionCache] = request.app["cache"]
+    digest, cached = None, None
+    if cache is not None:
+        # SQLite calls (and re-hashing the model file after a swap) stay off the event loop
+        digest, cached = await loop.run_in_executor(None, _cache_lookup, cache, data)
+    if cached is not None:
+        version = current_version()
+        top_labels, top_confidences = top_predictions(cached, version.labels())
+        label, confidence, probs = str(top_labels[0]), float(top_confidences[0]), cached.tolist()
+    else:
+        # Shed load before paying for the decode
+        if batcher.queue.full():
+            raise _overloaded()
+
+        try:
+            img = await loop.run_in_executor(None, _decode, data)
+        except Exception as e:
+            raise web.HTTPBadRequest(text=f"Could not decode image: {e}")
+
+        try:
+            label, confidence, probs, version = await batcher.predict(img)
+        except QueueFull:
+            raise _overloaded()
+        # Entries are keyed by the current version; skip a result from one just swapped out
+        if cache is not None and version is current_version():
+            await loop.run_in_executor(None, cache.put, digest, probs)
+
+    body = {
+        "label": label,
+        "confidence": confidence,
+        "probabilities": dict(zip(version.labels(), probs)),
+        "model_version": version.name,
+    }
+    if request.query.get("report", "0").lower() in ("1", "true", "yes"):
+        body["report"] = generate_disease_report(label, confidence)
+    return web.json_response(body)
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    batcher: MicroBatcher = request.app["batcher"]
+    body = {"status": "ok", "queued": batcher.queue.qsize(), "model_version": current_version().name}
+    stats = shadow_stats()
+    if stats["shadow"] is not None:
+        body["shadow"] = stats
+    if get_cascade():
+        body["cascade"] = cascade_stats()
+    if request.app["cache"] is not None:
+        # COUNT(*) over the cache table can wait on writers; keep it off the event loop
+        body["cache"] = await asyncio.get_running_loop().run_in_executor(None, request.app["cache"].stats)
+    return web.json_response(body)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.prometheus_text(), content_type="text/plain")
+
+
+async def handle_profile(request: web.Request) -> web.Response:
+    # Captures a cProfile (default) or TensorFlow trace of the next n batches
+    kind = request.query.get("kind", "cprofile")
+    try:
+        n = int(request.query.get("n", "20"))
+        if n < 1:
+            raise ValueError(f"n must be at least 1, got {n}")
+        metrics.profile_next(n, kind)
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    return web.json_response({"profiling": kind, "batches": n})
+
+
+def create_app(
+    max_batch: int,
+    max_delay: float,
+    max_queue: int,
+    cache: Optional[PredictionCache] = None,
+    shadow_version: Optional[str] = None,
+    watch_interval: float = 5.0
+) -> web.Application:
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app["cache"] = cache
+
+    async def on_startup(app):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, warm_up, False)
+        if shadow_version:
+            await loop.run_in_executor(None, set_shadow_version, shadow_version, False)
+        if watch_interval > 0:
+            watch_registry(watch_interval)
+        app["batcher"] = MicroBatcher(max_batch, max_delay, max_queue)
+        app["batcher"].start()
+
+    async def on_cleanup(app):
+        await app["batcher"].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/predict", handle_predict)
+    app.router.add_get("/healthz", handle_health)
+    if metrics.is_enabled():
+        app.router.add_get("/metrics", handle_metrics)
+        app.router.add_post("/debug/profile", handle_profile)
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the LeafMedic classifier over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Largest number of requests coalesced into one forward pass")
+    parser.add_argument("--max-delay-ms", type=float, default=10.0,
+                        help="Longest time the first request in a batch waits for others")
+    parser.add_argument("--max-queue", type=int, default=256,
+                        help="Queued requests beyond this are rejected with 503")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record metrics, serve them at /metrics and enable POST /debug/profile")
+    parser.add_argument("--cache-path", default=CACHE_PATH, help="Prediction cache database")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the model, even for repeated images")
+    parser.add_argument("--shadow-version",
+                        help="Also score every batch with this registry version and compare (see /healthz)")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Answer confident images with the fast model, escalating the rest (see /healthz)")
+    parser.add_argument("--watch-interval", type=float, default=5.0,
+                        help="Seconds between checks for a newly activated model version (0 disables)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.metrics:
+        metrics.enable()
+    if args.cascade:
+        set_cascade(True)
+    cache = None if args.no_cache else PredictionCache(args.cache_path)
+    app = create_app(args.max_batch, args.max_delay_ms / 1000.0, args.max_queue, cache,
+                     args.shadow_version, args.watch_interval)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 # train_model.py
 
 import os
+import sys
 import json
+import math
+import time
+import socket
+import argparse
+import subprocess
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
@@ -9,103 +15,739 @@ from tensorflow.keras import layers, models
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint
 import matplotlib.pyplot as plt
 
+import numpy as np
+
+from utils.dataset import cache_features, make_image_dataset
+from utils.manifest import MANIFEST_PATH, load_split
+
 # — Paths & Setup —
 DATA_DIR       = "data/PlantVillage"      # Folder containing subfolders per class
 MODEL_DIR      = "model"
 os.makedirs(MODEL_DIR, exist_ok=True)
 MODEL_PATH     = os.path.join(MODEL_DIR, "disease_model.keras")
 CLASS_IDX_PATH = os.path.join(MODEL_DIR, "class_indices.json")
+CACHE_DIR      = os.path.join(MODEL_DIR, "cache")   # Decoded-image cache for the tf.data pipeline
+BACKUP_DIR     = os.path.join(MODEL_DIR, "backup")  # Epoch-level backup for resuming interrupted runs
+FAST_MODEL_PATH = os.path.join(MODEL_DIR, "fast_model.keras")  # Cascade companion (--fast)
+STUDENT_DIR    = os.path.join(MODEL_DIR, "student") # Distilled student (--distill), registrable as a version
 
 # — Hyperparameters —
 IMG_SIZE   = 224
 BATCH_SIZE = 32
 EPOCHS     = 10
+VAL_SPLIT  = 0.2
+
+# Fast cascade model: narrower MobileNetV2 at reduced resolution
+FAST_IMG_SIZE = 128
+FAST_ALPHA    = 0.35
+
+# Distilled student: narrower MobileNetV2 that downsizes its 224px input internally
+STUDENT_IMG_SIZE = 160
+STUDENT_ALPHA    = 0.5
+TEMPERATURE      = 4.0   # Softens teacher and student probabilities for the distillation loss
+HARD_WEIGHT      = 0.1   # Share of the loss on the true labels; the rest matches the teacher
+STUDENT_WARMUP_EPOCHS = 2     # Head-only epochs before the student backbone is unfrozen
+STUDENT_FINE_TUNE_LR  = 1e-4  # Adam learning rate once the whole student trains
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the LeafMedic disease classifier.")
+    parser.add_argument(
+        "--pipeline", choices=["tfdata", "generator"], default="tfdata",
+        help="Input pipeline: parallel tf.data with a decoded-image cache, or the legacy ImageDataGenerator"
+    )
+    parser.add_argument(
+        "--cache-dir", default=CACHE_DIR,
+        help="Where the tf.data pipeline caches decoded 224×224 images ('' keeps them in memory)"
+    )
+    parser.add_argument(
+        "--mode", choices=["full", "features"], default="full",
+        help="full: train end-to-end through the frozen backbone every epoch; "
+             "features: run the backbone once, cache pooled features and train only the head"
+    )
+    parser.add_argument(
+        "--views", type=int, default=0,
+        help="features mode: extra augmented views per training image to precompute"
+    )
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument(
+        "--manifest", default=MANIFEST_PATH,
+        help="Dataset manifest from build_manifest.py; the directory is walked if it does not exist"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Local worker processes for data-parallel training (MultiWorkerMirroredStrategy, "
+             "tf.data pipeline, full mode); each worker keeps a batch size of BATCH_SIZE"
+    )
+    parser.add_argument(
+        "--cluster", action="store_true",
+        help="Train through the multi-worker cluster path even with --workers 1, e.g. as the "
+             "baseline of a scaling benchmark"
+    )
+    parser.add_argument(
+        "--restarts", type=int, default=2,
+        help="With --workers > 1 or --cluster: times the whole cluster is restarted, from the last epoch backup, "
+             "after a worker dies"
+    )
+    parser.add_argument("--intra-op-threads", type=int, default=0,
+                        help="TensorFlow threads per op (default: TF's choice, or CPUs / workers)")
+    parser.add_argument("--inter-op-threads", type=int, default=0,
+                        help="TensorFlow ops run concurrently (default: TF's choice)")
+    parser.add_argument("--xla", action="store_true", help="Compile the training step with XLA")
+    parser.add_argument("--timing-file", help="Write per-epoch wall times as JSON (for benchmark_training.py)")
+    parser.add_argument(
+        "--fast", action="store_true",
+        help=f"Train the {FAST_IMG_SIZE}px, alpha {FAST_ALPHA} companion model for cascade inference "
+             f"({FAST_MODEL_PATH}) and calibrate its threshold against the full model"
+    )
+    parser.add_argument("--cascade-agreement", type=float, default=0.99,
+                        help="--fast: agreement with the full model required of the answers the fast model keeps")
+    parser.add_argument(
+        "--distill", action="store_true",
+        help=f"Train a compact student on the softened probabilities of {MODEL_PATH} (the teacher) "
+             f"and save it, with the same class indices, to --student-dir"
+    )
+    parser.add_argument("--student-dir", default=STUDENT_DIR, help="--distill: output directory")
+    parser.add_argument("--student-size", type=int, default=STUDENT_IMG_SIZE,
+                        help="--distill: input resolution of the student's backbone")
+    parser.add_argument("--student-alpha", type=float, default=STUDENT_ALPHA,
+                        help="--distill: MobileNetV2 width multiplier of the student (0.35, 0.5, 0.75, 1.0)")
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE,
+                        help="--distill: softening temperature of the distillation loss")
+    args = parser.parse_args()
+    args.cluster = args.cluster or args.workers > 1
+    if args.cluster and (args.mode != "full" or args.pipeline != "tfdata"):
+        parser.error("--workers > 1 and --cluster need --mode full with the tfdata pipeline")
+    if args.fast and (args.cluster or args.mode != "full" or args.pipeline != "tfdata"):
+        parser.error("--fast trains on one worker with --mode full and the tfdata pipeline")
+    if args.distill and (args.fast or args.cluster or args.mode != "full" or args.pipeline != "tfdata"):
+        parser.error("--distill trains on one worker with --mode full and the tfdata pipeline, without --fast")
+    if args.distill and (args.temperature <= 0 or not 32 <= args.student_size <= IMG_SIZE):
+        parser.error(f"--temperature must be positive and --student-size between 32 and {IMG_SIZE}")
+    return args
+
 
 # — Data Generators with Augmentation & Validation Split —
-datagen = ImageDataGenerator(
-    preprocessing_function=tf.keras.applications.mobilenet_v2.preprocess_input,
-    validation_split=0.2,
-    rotation_range=20,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    zoom_range=0.2,
-    horizontal_flip=True,
-    fill_mode='nearest'
-)
-
-train_gen = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=(IMG_SIZE, IMG_SIZE),
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    subset='training'
-)
-val_gen = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=(IMG_SIZE, IMG_SIZE),
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    subset='validation'
-)
-
-# — Save Class Indices for Later —
-with open(CLASS_IDX_PATH, 'w') as f:
-    json.dump(train_gen.class_indices, f)
+def generator_data():
+    datagen = ImageDataGenerator(
+        preprocessing_function=tf.keras.applications.mobilenet_v2.preprocess_input,
+        validation_split=VAL_SPLIT,
+        rotation_range=20,
+        width_shift_range=0.1,
+        height_shift_range=0.1,
+        zoom_range=0.2,
+        horizontal_flip=True,
+        fill_mode='nearest'
+    )
+
+    train_gen = datagen.flow_from_directory(
+        DATA_DIR,
+        target_size=(IMG_SIZE, IMG_SIZE),
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        subset='training'
+    )
+    val_gen = datagen.flow_from_directory(
+        DATA_DIR,
+        target_size=(IMG_SIZE, IMG_SIZE),
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        subset='validation'
+    )
+    return train_gen, val_gen, train_gen.class_indices
+
+
+# — tf.data Pipeline with Decoded-Image Cache & Same Validation Split —
+def tfdata_data(cache_dir, manifest_path=MANIFEST_PATH):
+    class_indices, train_files, val_files = load_split(DATA_DIR, VAL_SPLIT, manifest_path, log=print)
+    print(f"Found {len(train_files)} training and {len(val_files)} validation images "
+          f"belonging to {len(class_indices)} classes.")
+
+    train_ds = make_image_dataset(
+        train_files, len(class_indices), IMG_SIZE, BATCH_SIZE,
+        training=True, cache_dir=cache_dir, cache_name="train"
+    )
+    val_ds = make_image_dataset(
+        val_files, len(class_indices), IMG_SIZE, BATCH_SIZE,
+        training=False, cache_dir=cache_dir, cache_name="val"
+    )
+    return train_ds, val_ds, class_indices
+
 
 # — Build Model: Transfer Learning with MobileNetV2 Base —
-base_model = MobileNetV2(
-    input_shape=(IMG_SIZE, IMG_SIZE, 3),
-    include_top=False,
-    weights='imagenet'
-)
-base_model.trainable = False  # Freeze base
-
-model = models.Sequential([
-    base_model,
-    layers.GlobalAveragePooling2D(),
-    layers.Dropout(0.3),
-    layers.Dense(256, activation='relu'),
-    layers.Dropout(0.3),
-    layers.Dense(train_gen.num_classes, activation='softmax')
-])
-
-model.compile(
-    optimizer='adam',
-    loss='categorical_crossentropy',
-    metrics=['accuracy']
-)
-
-# — Callbacks for Training —
-callbacks = [
-    EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
-    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, verbose=1),
-    ModelCheckpoint(MODEL_PATH, monitor='val_loss', save_best_only=True)
-]
-
-# — Train the Model —
-history = model.fit(
-    train_gen,
-    validation_data=val_gen,
-    epochs=EPOCHS,
-    callbacks=callbacks
-)
-
-# — Save Final Model & Plot History —
-model.save(MODEL_PATH)
-print(f"Trained model saved to {MODEL_PATH}")
+def build_backbone(img_size=IMG_SIZE, alpha=1.0, trainable=False):
+    base_model = MobileNetV2(
+        input_shape=(img_size, img_size, 3),
+        alpha=alpha,
+        include_top=False,
+        weights='imagenet'
+    )
+    set_backbone_trainable(base_model, trainable)  # Frozen by default
+    return base_model
+
+
+def set_backbone_trainable(base_model, trainable):
+    base_model.trainable = trainable
+    if trainable:
+        # BatchNorm keeps its ImageNet statistics (inference mode) while the
+        # convolutions train, which keeps small-batch fine-tuning stable
+        for layer in base_model.layers:
+            if isinstance(layer, layers.BatchNormalization):
+                layer.trainable = False
+
+
+def build_head_layers(num_classes):
+    # Everything after GlobalAveragePooling2D, shared by both training modes
+    return [
+        layers.Dropout(0.3),
+        layers.Dense(256, activation='relu'),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax')
+    ]
+
+
+def compile_model(model, jit_compile=False):
+    model.compile(
+        optimizer='adam',
+        loss='categorical_crossentropy',
+        metrics=['accuracy'],
+        jit_compile=jit_compile
+    )
+    return model
+
+
+def build_model(num_classes, base_model=None, head_layers=None, jit_compile=False):
+    if base_model is None:
+        base_model = build_backbone()
+    if head_layers is None:
+        head_layers = build_head_layers(num_classes)
+
+    model = models.Sequential([
+        base_model,
+        layers.GlobalAveragePooling2D(),
+        *head_layers
+    ])
+    return compile_model(model, jit_compile)
+
+
+# — Frozen-Backbone Feature Caching: Train Only the Head —
+def train_head_on_features(args):
+    class_indices, train_files, val_files = load_split(DATA_DIR, VAL_SPLIT, args.manifest, log=print)
+    num_classes = len(class_indices)
+
+    base_model = build_backbone()
+    extractor = models.Sequential(
+        [base_model, layers.GlobalAveragePooling2D()], name="mobilenetv2_gap"
+    )
+
+    # One pass of the backbone per view; cached on disk for later runs
+    train_views = [
+        cache_features(extractor, train_files, num_classes, args.cache_dir, "train", IMG_SIZE, view=v)
+        for v in range(args.views + 1)
+    ]
+    x_val, y_val = cache_features(extractor, val_files, num_classes, args.cache_dir, "val", IMG_SIZE)
+    x_train = np.concatenate([feats for feats, _ in train_views])
+    y_train = np.concatenate([labels for _, labels in train_views])
+    print(f"Cached {len(x_train)} training and {len(x_val)} validation feature vectors.")
+
+    head_layers = build_head_layers(num_classes)
+    head = compile_model(
+        models.Sequential([layers.Input(shape=(x_train.shape[1],)), *head_layers]), args.xla
+    )
+
+    history = head.fit(
+        x_train.astype(np.float32),
+        tf.keras.utils.to_categorical(y_train, num_classes),
+        validation_data=(np.asarray(x_val, dtype=np.float32), tf.keras.utils.to_categorical(y_val, num_classes)),
+        batch_size=BATCH_SIZE,
+        epochs=args.epochs,
+        shuffle=True,
+        callbacks=[
+            EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
+            ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, verbose=1)
+        ]
+    )
+
+    # Reassemble backbone + trained head into the model utils/predict.py loads
+    model = build_model(num_classes, base_model, head_layers)
+    return model, history, class_indices
+
+
+# — Fast Cascade Model: Low-Resolution Companion of the Full Model —
+def train_fast_model(args):
+    """
+    Trains the small model that answers first in cascade inference (see
+    utils/predict.py), on the same split and class indices as the full model,
+    then calibrates the confidence above which its answers are kept.
+    """
+    class_indices, train_files, val_files = load_split(DATA_DIR, VAL_SPLIT, args.manifest, log=print)
+    if os.path.exists(CLASS_IDX_PATH):
+        with open(CLASS_IDX_PATH) as f:
+            if json.load(f) != class_indices:
+                sys.exit(f"Classes differ from {CLASS_IDX_PATH}; retrain the full model first.")
+    num_classes = len(class_indices)
+
+    train_ds = make_image_dataset(
+        train_files, num_classes, FAST_IMG_SIZE, BATCH_SIZE,
+        training=True, cache_dir=args.cache_dir, cache_name="train"
+    )
+    val_ds = make_image_dataset(
+        val_files, num_classes, FAST_IMG_SIZE, BATCH_SIZE,
+        training=False, cache_dir=args.cache_dir, cache_name="val"
+    )
+    model = build_model(num_classes, build_backbone(FAST_IMG_SIZE, FAST_ALPHA), jit_compile=args.xla)
+    model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        callbacks=[
+            EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
+            ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, verbose=1),
+            ModelCheckpoint(FAST_MODEL_PATH, monitor='val_loss', save_best_only=True)
+        ]
+    )
+    model.save(FAST_MODEL_PATH)
+    print(f"Fast model saved to {FAST_MODEL_PATH}")
+
+    if not os.path.exists(MODEL_PATH):
+        print(f"No full model at {MODEL_PATH}; train it, then rerun --fast to calibrate the cascade.")
+        return
+
+    # Calibrate through the serving path, on the validation split
+    from utils.image_io import load_image
+    from utils.predict import calibrate_cascade
+
+    images = (load_image(path).model_rgb for path, _ in val_files)
+    config = calibrate_cascade(images, args.cascade_agreement, version="default")
+    print(f"Cascade threshold {config['threshold']:.3f} on {config['calibration_images']} validation images: "
+          f"{config['escalation_rate']:.1%} escalated, {config['agreement']:.2%} agreement with the full model.")
+
+
+# — Knowledge Distillation: Compact Student for CPU Serving —
+def build_student(num_classes, img_size=STUDENT_IMG_SIZE, alpha=STUDENT_ALPHA):
+    # Takes IMG_SIZE inputs like the teacher and resizes them itself, so
+    # utils/predict.py serves it without changes. Returns the model and its
+    # backbone, which starts frozen and is unfrozen after the head warm-up
+    backbone = build_backbone(img_size, alpha)
+    stack = [layers.Input(shape=(IMG_SIZE, IMG_SIZE, 3))]
+    if img_size != IMG_SIZE:
+        stack.append(layers.Resizing(img_size, img_size))
+    stack += [backbone, layers.GlobalAveragePooling2D(), *build_head_layers(num_classes)]
+    return models.Sequential(stack, name="student"), backbone
+
+
+class Distiller(tf.keras.Model):
+    """
+    Trains `student` on a blend of the true labels and the teacher's
+    temperature-softened probabilities (Hinton et al.). Only the student's
+    weights change; the teacher runs in inference mode.
+    """
+
+    def __init__(self, teacher, student, temperature=TEMPERATURE, hard_weight=HARD_WEIGHT):
+        super().__init__()
+        self.teacher = teacher
+        self.student = student
+        self.temperature = temperature
+        self.hard_weight = hard_weight
+        self.loss_tracker = tf.keras.metrics.Mean(name="loss")
+        self.accuracy = tf.keras.metrics.CategoricalAccuracy(name="accuracy")
+        self.agreement = tf.keras.metrics.Mean(name="agreement")
+
+    @property
+    def metrics(self):
+        return [self.loss_tracker, self.accuracy, self.agreement]
+
+    def call(self, x, training=False):
+        return self.student(x, training=training)
+
+    def soften(self, probs):
+        # Both models end in softmax: softmax(log p / T) equals softmax(logits / T)
+        return tf.nn.softmax(tf.math.log(tf.clip_by_value(probs, 1e-7, 1.0)) / self.temperature)
+
+    def _step(self, x, y, training):
+        teacher_probs = self.teacher(x, training=False)
+        student_probs = self.student(x, training=training)
+        hard = tf.keras.losses.categorical_crossentropy(y, student_probs)
+        # T² keeps the soft-target gradients on the same scale as the hard ones
+        soft = tf.keras.losses.kl_divergence(self.soften(teacher_probs), self.soften(student_probs))
+        loss = tf.reduce_mean(self.hard_weight * hard + (1.0 - self.hard_weight) * self.temperature ** 2 * soft)
+        return loss, student_probs, teacher_probs
+
+    def _update_metrics(self, loss, y, student_probs, teacher_probs):
+        self.loss_tracker.update_state(loss)
+        self.accuracy.update_state(y, student_probs)
+        agreed = tf.equal(tf.argmax(student_probs, axis=1), tf.argmax(teacher_probs, axis=1))
+        self.agreement.update_state(tf.cast(agreed, tf.float32))
+        return {m.name: m.result() for m in self.metrics}
+
+    def train_step(self, data):
+        x, y = data
+        with tf.GradientTape() as tape:
+            loss, student_probs, teacher_probs = self._step(x, y, training=True)
+        grads = tape.gradient(loss, self.student.trainable_variables)
+        self.optimizer.apply_gradients(zip(grads, self.student.trainable_variables))
+        return self._update_metrics(loss, y, student_probs, teacher_probs)
+
+    def test_step(self, data):
+        x, y = data
+        loss, student_probs, teacher_probs = self._step(x, y, training=False)
+        return self._update_metrics(loss, y, student_probs, teacher_probs)
+
+
+def cpu_latency_ms(model, repeats=50):
+    """Median single-image latency of a compiled forward pass, in milliseconds."""
+    forward = tf.function(lambda x: model(x, training=False))
+    x = tf.zeros((1, IMG_SIZE, IMG_SIZE, 3))
+    for _ in range(3):
+        forward(x)  # trace and warm up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        forward(x).numpy()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def compare_models(teacher, student, val_ds):
+    """Parameter count, CPU latency and validation accuracy of both models, and their top-1 agreement."""
+    correct = {"teacher": 0, "student": 0}
+    agreed = total = 0
+    for x, y in val_ds:
+        truth = np.argmax(y.numpy(), axis=1)
+        teacher_top = np.argmax(teacher(x, training=False).numpy(), axis=1)
+        student_top = np.argmax(student(x, training=False).numpy(), axis=1)
+        correct["teacher"] += int(np.sum(teacher_top == truth))
+        correct["student"] += int(np.sum(student_top == truth))
+        agreed += int(np.sum(teacher_top == student_top))
+        total += len(truth)
+    report = {
+        name: {
+            "params": int(model.count_params()),
+            "latency_ms": cpu_latency_ms(model),
+            "val_accuracy": correct[name] / max(total, 1),
+        }
+        for name, model in (("teacher", teacher), ("student", student))
+    }
+    report["val_images"] = total
+    report["agreement"] = agreed / max(total, 1)
+    report["accuracy_delta"] = report["student"]["val_accuracy"] - report["teacher"]["val_accuracy"]
+    return report
+
+
+def train_student(args):
+    """
+    Distills the trained full model into a compact student on the same split
+    and class indices, saves it as a model directory utils/predict.py and
+    manage_models.py accept, and reports size, CPU latency and accuracy
+    against the teacher.
+    """
+    if not os.path.exists(MODEL_PATH):
+        sys.exit(f"No teacher at {MODEL_PATH}; train the full model first.")
+    class_indices, train_files, val_files = load_split(DATA_DIR, VAL_SPLIT, args.manifest, log=print)
+    with open(CLASS_IDX_PATH) as f:
+        if json.load(f) != class_indices:
+            sys.exit(f"Classes differ from {CLASS_IDX_PATH}; retrain the full model first.")
+    num_classes = len(class_indices)
+
+    train_ds = make_image_dataset(
+        train_files, num_classes, IMG_SIZE, BATCH_SIZE,
+        training=True, cache_dir=args.cache_dir, cache_name="train"
+    )
+    val_ds = make_image_dataset(
+        val_files, num_classes, IMG_SIZE, BATCH_SIZE,
+        training=False, cache_dir=args.cache_dir, cache_name="val"
+    )
+
+    teacher = tf.keras.models.load_model(MODEL_PATH)
+    teacher.trainable = False
+    student, backbone = build_student(num_classes, args.student_size, args.student_alpha)
+    distiller = Distiller(teacher, student, args.temperature)
+
+    # 1. Warm up the new head on the frozen reduced-width backbone
+    warmup_epochs = min(STUDENT_WARMUP_EPOCHS, args.epochs)
+    distiller.compile(optimizer='adam', jit_compile=args.xla)
+    distiller.fit(train_ds, validation_data=val_ds, epochs=warmup_epochs)
+
+    # 2. Distill into the whole student; its backbone is not the teacher's,
+    #    so its ImageNet features have to adapt too
+    if args.epochs > warmup_epochs:
+        set_backbone_trainable(backbone, True)
+        distiller.compile(optimizer=tf.keras.optimizers.Adam(STUDENT_FINE_TUNE_LR), jit_compile=args.xla)
+        distiller.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=args.epochs,
+            initial_epoch=warmup_epochs,
+            callbacks=[
+                EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
+                ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, verbose=1)
+            ]
+        )
+
+    # Same layout as model/: disease_model.keras + class_indices.json
+    os.makedirs(args.student_dir, exist_ok=True)
+    compile_model(student)
+    student.save(os.path.join(args.student_dir, "disease_model.keras"))
+    with open(os.path.join(args.student_dir, "class_indices.json"), 'w') as f:
+        json.dump(class_indices, f)
+
+    report = compare_models(teacher, student, val_ds)
+    report["student_config"] = {
+        "img_size": args.student_size, "alpha": args.student_alpha, "temperature": args.temperature,
+        "warmup_epochs": warmup_epochs, "fine_tune_lr": STUDENT_FINE_TUNE_LR
+    }
+    with open(os.path.join(args.student_dir, "distill_report.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    t, st = report["teacher"], report["student"]
+    print(f"\nStudent saved to {args.student_dir}")
+    print(f"{'':<8} {'params':>11} {'CPU ms/img':>11} {'val acc':>8}")
+    print(f"{'teacher':<8} {t['params']:>11,} {t['latency_ms']:>11.2f} {t['val_accuracy']:>8.3f}")
+    print(f"{'student':<8} {st['params']:>11,} {st['latency_ms']:>11.2f} {st['val_accuracy']:>8.3f}")
+    print(f"{t['params'] / st['params']:.1f}× fewer parameters, {t['latency_ms'] / st['latency_ms']:.1f}× faster, "
+          f"accuracy {report['accuracy_delta']:+.3f}, {report['agreement']:.1%} top-1 agreement with the teacher")
+    print(f"Serve it with: python manage_models.py register student --source {args.student_dir} --activate")
+
+
+# — Threading & Epoch Timing —
+def configure_threads(intra_op, inter_op):
+    # Must run before TensorFlow creates its runtime; 0 keeps TF's default
+    if intra_op:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    if inter_op:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Records the wall time of each epoch, validation included."""
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self._start)
+
+
+def write_timing(path, timer, workers, steps_per_epoch, global_batch):
+    with open(path, 'w') as f:
+        json.dump({
+            "workers": workers,
+            "steps_per_epoch": steps_per_epoch,
+            "global_batch": global_batch,
+            "epoch_s": timer.times
+        }, f)
+
+
+# — Multi-Worker CPU Training: One Process per Worker, Same Host —
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def launch_workers(args):
+    """
+    Runs this script as args.workers local processes forming a
+    MultiWorkerMirroredStrategy cluster (worker 0 is the chief). If any worker
+    dies, the others are stopped and the whole cluster is restarted, up to
+    args.restarts times; BackupAndRestore resumes from the last finished epoch.
+    """
+    intra_op = args.intra_op_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    cmd = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--intra-op-threads", str(intra_op)]
+
+    for attempt in range(args.restarts + 1):
+        cluster = {"worker": [f"localhost:{_free_port()}" for _ in range(args.workers)]}
+        procs = []
+        for index in range(args.workers):
+            tf_config = {"cluster": cluster, "task": {"type": "worker", "index": index}}
+            procs.append(subprocess.Popen(cmd, env=dict(os.environ, TF_CONFIG=json.dumps(tf_config))))
+        try:
+            # A dead worker leaves the others blocked in collectives, so poll
+            while any(p.poll() is None for p in procs):
+                if any(p.poll() not in (None, 0) for p in procs):
+                    break
+                time.sleep(1)
+        finally:
+            for p in procs:
+                if p.poll() is None:
+                    p.terminate()
+            for p in procs:
+                p.wait()
+
+        codes = [p.returncode for p in procs]
+        if all(code == 0 for code in codes):
+            return
+        print(f"Worker exit codes {codes}; "
+              + (f"restarting (attempt {attempt + 2} of {args.restarts + 1})" if attempt < args.restarts else "giving up"))
+    sys.exit(1)
+
+
+def _write_path(path, is_chief, task_index):
+    # Every worker must save (saving is a collective); only the chief keeps the result
+    if is_chief:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.worker{task_index}{ext}"
+
+
+def train_multi_worker(args):
+    """One worker of the cluster started by launch_workers."""
+    task = json.loads(os.environ["TF_CONFIG"])["task"]
+    is_chief = task["index"] == 0
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    num_workers = strategy.num_replicas_in_sync
+
+    class_indices, train_files, val_files = load_split(DATA_DIR, VAL_SPLIT, args.manifest, log=print)
+    num_classes = len(class_indices)
+    global_batch = BATCH_SIZE * num_workers
+
+    def dataset_fn(files, training, name):
+        def fn(ctx):
+            # Each worker reads and caches only its own strided shard of the files
+            shard = files[ctx.input_pipeline_id::ctx.num_input_pipelines]
+            ds = make_image_dataset(
+                shard, num_classes, IMG_SIZE, ctx.get_per_replica_batch_size(global_batch),
+                training=training, cache_dir=args.cache_dir, cache_name=name
+            )
+            # Every worker runs the same number of steps, so shorter training
+            # shards wrap around. Validation is not repeated: its steps are
+            # floored so every shard has that many full batches, and each
+            # epoch scores the same images exactly once
+            return ds.repeat() if training else ds
+        return strategy.distribute_datasets_from_function(fn)
+
+    train_ds = dataset_fn(train_files, True, "train")
+    val_ds = dataset_fn(val_files, False, "val")
+    steps_per_epoch = math.ceil(len(train_files) / global_batch)
+    validation_steps = max(1, len(val_files) // global_batch)
+    if is_chief:
+        print(f"Training on {num_workers} workers: {len(train_files)} training and {len(val_files)} "
+              f"validation images, global batch {global_batch}, {steps_per_epoch} steps per epoch.")
+
+    with strategy.scope():
+        model = build_model(num_classes, jit_compile=args.xla)
+
+    timer = EpochTimer()
+    callbacks = [
+        # Saved at every epoch end and restored on restart, so an interrupted
+        # worker costs at most one epoch; removed once training finishes
+        tf.keras.callbacks.BackupAndRestore(BACKUP_DIR),
+        EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
+        ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, verbose=1),
+        ModelCheckpoint(MODEL_PATH, monitor='val_loss', save_best_only=True),
+        timer
+    ]
+    history = model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        steps_per_epoch=steps_per_epoch,
+        validation_steps=validation_steps,
+        callbacks=callbacks,
+        verbose=2 if is_chief else 0
+    )
+
+    save_path = _write_path(MODEL_PATH, is_chief, task["index"])
+    model.save(save_path)
+    if not is_chief:
+        os.remove(save_path)
+        return
+
+    with open(CLASS_IDX_PATH, 'w') as f:
+        json.dump(class_indices, f)
+    print(f"Trained model saved to {MODEL_PATH}")
+    if args.timing_file:
+        write_timing(args.timing_file, timer, num_workers, steps_per_epoch, global_batch)
+    plot_history(history)
+
 
 # Plot accuracy & loss curves
-plt.figure(figsize=(12,4))
-plt.subplot(1,2,1)
-plt.plot(history.history['accuracy'], label='Train Acc')
-plt.plot(history.history['val_accuracy'], label='Val Acc')
-plt.legend(); plt.title('Accuracy')
-
-plt.subplot(1,2,2)
-plt.plot(history.history['loss'], label='Train Loss')
-plt.plot(history.history['val_loss'], label='Val Loss')
-plt.legend(); plt.title('Loss')
-
-plt.tight_layout()
-plt.savefig(os.path.join(MODEL_DIR, 'training_history.png'))
-print("Training history plot saved.")
+def plot_history(history):
+    plt.figure(figsize=(12,4))
+    plt.subplot(1,2,1)
+    plt.plot(history.history['accuracy'], label='Train Acc')
+    plt.plot(history.history['val_accuracy'], label='Val Acc')
+    plt.legend(); plt.title('Accuracy')
+
+    plt.subplot(1,2,2)
+    plt.plot(history.history['loss'], label='Train Loss')
+    plt.plot(history.history['val_loss'], label='Val Loss')
+    plt.legend(); plt.title('Loss')
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(MODEL_DIR, 'training_history.png'))
+    print("Training history plot saved.")
+
+
+def main():
+    args = parse_args()
+
+    if args.cluster:
+        if "TF_CONFIG" not in os.environ:
+            launch_workers(args)
+        else:
+            configure_threads(args.intra_op_threads, args.inter_op_threads)
+            train_multi_worker(args)
+        return
+
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+
+    if args.fast:
+        train_fast_model(args)
+        return
+
+    if args.distill:
+        train_student(args)
+        return
+
+    if args.mode == "features":
+        model, history, class_indices = train_head_on_features(args)
+        with open(CLASS_IDX_PATH, 'w') as f:
+            json.dump(class_indices, f)
+        model.save(MODEL_PATH)
+        print(f"Trained model saved to {MODEL_PATH}")
+        plot_history(history)
+        return
+
+    if args.pipeline == "generator":
+        train_data, val_data, class_indices = generator_data()
+    else:
+        train_data, val_data, class_indices = tfdata_data(args.cache_dir, args.manifest)
+
+    # — Save Class Indices for Later —
+    with open(CLASS_IDX_PATH, 'w') as f:
+        json.dump(class_indices, f)
+
+    model = build_model(len(class_indices), jit_compile=args.xla)
+
+    # — Callbacks for Training —
+    timer = EpochTimer()
+    callbacks = [
+        EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
+        ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, verbose=1),
+        ModelCheckpoint(MODEL_PATH, monitor='val_loss', save_best_only=True),
+        timer
+    ]
+
+    # — Train the Model —
+    history = model.fit(
+        train_data,
+        validation_data=val_data,
+        epochs=args.epochs,
+        callbacks=callbacks
+    )
+
+    # — Save Final Model & Plot History —
+    model.save(MODEL_PATH)
+    print(f"Trained model saved to {MODEL_PATH}")
+    if args.timing_file:
+        write_timing(args.timing_file, timer, 1, len(train_data), BATCH_SIZE)
+    plot_history(history)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# utils/dataset.py
+
+import os
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from utils.manifest import list_class_files, split_class_files
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def list_image_split(
+    data_dir: str,
+    validation_split: float = 0.2
+) -> Tuple[Dict[str, int], List[Tuple[str, int]], List[Tuple[str, int]]]:
+    """
+    Lists images per class and splits them exactly like
+    `ImageDataGenerator(validation_split=...).flow_from_directory`:
+    classes are the sorted subfolders, files are walked in sorted order, and
+    the first `validation_split` fraction of each class is the validation set.
+
+    Args:
+      data_dir:         Folder containing one subfolder per class
+      validation_split: Fraction of each class held out for validation
+
+    Returns:
+      class_indices: {class name: index}, identical to the generator's mapping
+      train_files:   List of (path, class index) for the training subset
+      val_files:     List of (path, class index) for the validation subset
+    """
+    return split_class_files(list_class_files(data_dir), validation_split)
+
+
+def build_augmenter(seed: Optional[int] = None) -> tf.keras.Sequential:
+    """
+    Batch-level equivalents of the ImageDataGenerator augmentations used for
+    training: rotation 20°, shift 10%, zoom 20%, horizontal flip, nearest fill.
+    """
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomRotation(20 / 360, fill_mode="nearest", seed=seed),
+        tf.keras.layers.RandomTranslation(0.1, 0.1, fill_mode="nearest", seed=seed),
+        tf.keras.layers.RandomZoom(0.2, 0.2, fill_mode="nearest", seed=seed),
+        tf.keras.layers.RandomFlip("horizontal", seed=seed),
+    ], name="augment")
+
+
+def _cache_file(cache_dir: str, name: str, files: List[Tuple[str, int]], img_size: int) -> str:
+    # Key the cache on the file list and size so a changed dataset never
+    # reuses stale decoded tensors
+    digest = hashlib.sha1(
+        "\n".join(f"{path}\t{idx}" for path, idx in files).encode("utf-8")
+    )
+    digest.update(str(img_size).encode("ascii"))
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f"{name}_{img_size}_{digest.hexdigest()[:12]}")
+
+
+def make_image_dataset(
+    files: List[Tuple[str, int]],
+    num_classes: int,
+    img_size: int = 224,
+    batch_size: int = 32,
+    training: bool = False,
+    cache_dir: Optional[str] = None,
+    cache_name: str = "images",
+    seed: Optional[int] = None
+) -> tf.data.Dataset:
+    """
+    Builds a tf.data input pipeline over (path, class index) pairs:
+      1. Decode and resize to img_size×img_size uint8 in parallel
+      2. Cache the decoded tensors (on disk under cache_dir, or in memory if cache_dir is "")
+      3. Shuffle and batch (training only shuffles)
+      4. Apply augmentations as vectorized batch ops (training only)
+      5. Normalize with mobilenet_v2.preprocess_input and one-hot encode labels
+      6. Prefetch
+
+    Args:
+      files:       List of (path, class index), e.g. from list_image_split
+      num_classes: Number of output classes for one-hot labels
+      img_size:    Square side length images are resized to
+      batch_size:  Images per batch
+      training:    Shuffle and augment when True
+      cache_dir:   Folder for the decoded-image cache; "" caches in memory, None disables caching
+      cache_name:  Prefix for the cache file (e.g. "train", "val")
+      seed:        Seed for shuffling and augmentation
+
+    Returns:
+      A dataset of (images float32 [-1, 1], one-hot labels) batches
+    """
+    paths = [path for path, _ in files]
+    labels = [idx for _, idx in files]
+
+    def _decode(path, label):
+        raw = tf.io.read_file(path)
+        img = tf.io.decode_image(raw, channels=3, expand_animations=False)
+        img = tf.image.resize(img, (img_size, img_size), method="nearest")
+        return tf.cast(img, tf.uint8), label
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(_decode, num_parallel_calls=AUTOTUNE, deterministic=not training)
+
+    if cache_dir is not None:
+        ds = ds.cache(_cache_file(cache_dir, cache_name, files, img_size) if cache_dir else "")
+
+    if training:
+        ds = ds.shuffle(min(len(files), 4096), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    augmenter = build_augmenter(seed) if training else None
+
+    def _finish(images, labels):
+        images = tf.cast(images, tf.float32)
+        if augmenter is not None:
+            images = augmenter(images, training=True)
+        images = tf.keras.applications.mobilenet_v2.preprocess_input(images)
+        return images, tf.one_hot(labels, num_classes)
+
+    ds = ds.map(_finish, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def cache_features(
+    extractor: tf.keras.Model,
+    files: List[Tuple[str, int]],
+    num_classes: int,
+    cache_dir: str,
+    cache_name: str,
+    img_size: int = 224,
+    batch_size: int = 64,
+    view: int = 0,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs a frozen feature extractor once over `files` and stores the pooled
+    feature vectors as a float16 .npy next to an int label array. Later calls
+    with the same files, size and view load the arrays from disk.
+
+    Args:
+      extractor:   Frozen model mapping preprocessed images to feature vectors
+      files:       List of (path, class index), e.g. from list_image_split
+      num_classes: Number of output classes
+      cache_dir:   Folder for the feature files and the decoded-image cache
+      cache_name:  Prefix for the cache files (e.g. "train", "val")
+      img_size:    Square side length images are resized to
+      batch_size:  Images per extractor call
+      view:        0 for the plain images, >0 for the view-th augmented copy
+      seed:        Base seed; augmented view k uses seed + k
+
+    Returns:
+      features: float16 array (N, feature_dim), memory-mapped from disk
+      labels:   int array (N,) of class indices in the same order
+    """
+    base = _cache_file(cache_dir, f"{cache_name}_features_{extractor.name}_v{view}", files, img_size)
+    feat_path, label_path = base + ".npy", base + "_labels.npy"
+    if os.path.exists(feat_path) and os.path.exists(label_path):
+        return np.load(feat_path, mmap_mode="r"), np.load(label_path)
+
+    ds = make_image_dataset(
+        files, num_classes, img_size, batch_size,
+        training=view > 0, cache_dir=cache_dir, cache_name=cache_name, seed=seed + view
+    )
+
+    # Write to a temporary file and rename, so an interrupted run never
+    # leaves a truncated feature file behind
+    tmp_path = base + ".tmp.npy"
+    features = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float16, shape=(len(files), extractor.output_shape[-1])
+    )
+    labels = np.empty(len(files), dtype=np.int64)
+    pos = 0
+    for images, onehot in ds:
+        out = extractor(images, training=False).numpy()
+        features[pos:pos + len(out)] = out
+        labels[pos:pos + len(out)] = np.argmax(onehot.numpy(), axis=1)
+        pos += len(out)
+    features.flush()
+    del features
+
+    np.save(label_path, labels)
+    os.replace(tmp_path, feat_path)
+    return np.load(feat_path, mmap_mode="r"), labels
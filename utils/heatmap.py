@@ -0,0 +1,93 @@
+# utils/heatmap.py
+#
+# Spatial output of tiled inference (utils.predict.predict_leaf_disease_tiled):
+# a per-cell disease score (probability mass outside the "healthy" classes),
+# connected hot regions with their dominant disease, and a colour overlay.
+
+from typing import List, NamedTuple, Sequence
+
+import cv2
+import numpy as np
+
+from utils.predict import TiledPrediction
+
+# Disease score at or above which a cell belongs to a hot region
+HOT_THRESHOLD = 0.5
+
+
+class HotRegion(NamedTuple):
+    box: tuple              # (x, y, w, h) in original-image pixels
+    label: str              # most probable disease class over the region
+    score: float            # mean disease score of its cells
+    area_ratio: float       # region cells / all cells
+
+
+def healthy_mask(labels: Sequence[str]) -> np.ndarray:
+    """Boolean (num_classes,) mask of the healthy classes, e.g. "Tomato_healthy"."""
+    return np.array(["healthy" in label.lower() for label in labels])
+
+
+def disease_map(tiled: TiledPrediction) -> np.ndarray:
+    """(rows, cols) float32 probability that each cell shows a disease."""
+    healthy = healthy_mask(tiled.labels)
+    return 1.0 - tiled.heatmap[..., healthy].sum(axis=-1)
+
+
+def find_hot_regions(
+    tiled: TiledPrediction,
+    threshold: float = HOT_THRESHOLD,
+    scale: float = 1.0
+) -> List[HotRegion]:
+    """
+    Groups 8-connected cells whose disease score reaches threshold into
+    regions, highest mean score first.
+
+    Args:
+      tiled:      Result of predict_leaf_disease_tiled
+      threshold:  Disease score cutoff, 0–1
+      scale:      Tiled-image pixels per original pixel (LargeImage.scale), to report
+                  boxes in original-image coordinates
+    """
+    scores = disease_map(tiled)
+    mask = (scores >= threshold).astype(np.uint8)
+    count, component, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    disease = ~healthy_mask(tiled.labels)
+    disease_idx = np.flatnonzero(disease)
+    regions = []
+    for i in range(1, count):
+        cells = component == i
+        mean_probs = tiled.heatmap[cells].mean(axis=0)
+        x, y, w, h = (int(v) * tiled.cell for v in stats[i, :4])
+        # Edge cells may overhang the image
+        w, h = min(w, tiled.image_size[0] - x), min(h, tiled.image_size[1] - y)
+        regions.append(HotRegion(
+            box=tuple(int(round(v / scale)) for v in (x, y, w, h)),
+            label=tiled.labels[disease_idx[np.argmax(mean_probs[disease])]],
+            score=float(scores[cells].mean()),
+            area_ratio=float(cells.sum() / cells.size),
+        ))
+    regions.sort(key=lambda r: -r.score)
+    return regions
+
+
+def draw_heatmap_overlay(image: np.ndarray, tiled: TiledPrediction, alpha: float = 0.45) -> np.ndarray:
+    """
+    Returns a copy of image blended with a colour map of the disease score
+    (blue = healthy, red = diseased).
+
+    Args:
+      image: H×W×3 RGB image of the tiled area to draw on (not modified); any size, e.g. a thumbnail
+      tiled: Result of predict_leaf_disease_tiled
+      alpha: Opacity of the colour map
+    """
+    height, width = image.shape[:2]
+    scores = disease_map(tiled)
+    rows, cols = scores.shape
+    # The cell grid may overhang the right/bottom edge: scale it by the same
+    # factor as the image, then crop
+    sx, sy = width / tiled.image_size[0], height / tiled.image_size[1]
+    map_size = (max(width, round(cols * tiled.cell * sx)), max(height, round(rows * tiled.cell * sy)))
+    upscaled = cv2.resize(scores.astype(np.float32), map_size, interpolation=cv2.INTER_LINEAR)[:height, :width]
+    heat = cv2.applyColorMap((np.clip(upscaled, 0, 1) * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    heat = cv2.cvtColor(heat, cv2.COLOR_BGR2RGB)
+    return cv2.addWeighted(image, 1.0 - alpha, heat, alpha, 0.0)
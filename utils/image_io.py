@@ -0,0 +1,166 @@
+# utils/image_io.py
+#
+# Loads uploaded photos once, at the smallest resolution anything downstream
+# needs. JPEGs are decoded with libjpeg's DCT scaling (PIL draft mode), so a
+# 12–50 MP phone photo never exists in memory at full size. The result is one
+# model-size RGB buffer, shared by preprocessing and prediction, plus a
+# bounded thumbnail for display.
+
+import io
+import math
+from typing import NamedTuple, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils import metrics
+
+# Longest side of the display thumbnail, in pixels
+DISPLAY_MAX_SIDE = 800
+# Longest side a canopy photo is decoded at for tiled inference
+TILED_MAX_SIDE = 4096
+# Height of each view in a side-by-side display composite, and its JPEG quality
+COMPOSITE_PANEL_HEIGHT = 320
+DISPLAY_JPEG_QUALITY = 80
+
+
+class LoadedImage(NamedTuple):
+    """One decoded upload. model_rgb is what preprocess_images and predict_leaf_disease take."""
+    model_rgb: np.ndarray         # target_size uint8 RGB, H×W×3
+    thumbnail: Image.Image        # RGB, longest side ≤ DISPLAY_MAX_SIDE
+    original_size: Tuple[int, int]  # (width, height) after EXIF orientation
+    decoded_size: Tuple[int, int]   # (width, height) actually decoded
+
+
+class LargeImage(NamedTuple):
+    """One decoded canopy photo for tiled inference."""
+    rgb: np.ndarray               # uint8 RGB, H×W×3, longest side ≤ max_side
+    original_size: Tuple[int, int]  # (width, height) after EXIF orientation
+    scale: float                  # rgb pixels per original pixel (≤ 1)
+
+
+def _draft_request(size: Tuple[int, int], target_size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """
+    Smallest (width, height) the decoder may scale down to: large enough for
+    the thumbnail and, on both axes, for the model input.
+    """
+    width, height = size
+    scale = min(1.0, max_side / max(width, height))
+    return (
+        max(math.ceil(width * scale), target_size[0]),
+        max(math.ceil(height * scale), target_size[1]),
+    )
+
+
+@metrics.timed("load_image")
+def load_image(
+    source: Union[bytes, str, io.BytesIO],
+    target_size: Tuple[int, int] = (224, 224),
+    max_side: int = DISPLAY_MAX_SIDE
+) -> LoadedImage:
+    """
+    Decodes an image once into a model-size buffer and a display thumbnail:
+      1. Open lazily and ask JPEG decoding for a 1/2, 1/4 or 1/8 scale that
+         still covers the thumbnail and model sizes (no-op for other formats)
+      2. Decode, apply the EXIF orientation and convert to RGB
+      3. Resize to target_size for the model, and to max_side for display
+
+    Args:
+      source:      Encoded image bytes, a file path or a file-like object
+      target_size: (width, height) of the model buffer
+      max_side:    Longest side of the display thumbnail
+
+    Returns:
+      LoadedImage with the model buffer, thumbnail and original/decoded sizes
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        full_size = img.size
+        # draft() must run before the pixel data is read
+        img.draft("RGB", _draft_request(full_size, target_size, max_side))
+        img.load()
+        decoded_size = img.size
+        oriented = ImageOps.exif_transpose(img)
+
+    if oriented.size != decoded_size:
+        # Rotated by 90° or 270°: report sizes as displayed
+        full_size, decoded_size = full_size[::-1], decoded_size[::-1]
+    img = oriented.convert("RGB")
+
+    model_rgb = np.asarray(img.resize(target_size))
+    img.thumbnail((max_side, max_side))
+    return LoadedImage(model_rgb, img, full_size, decoded_size)
+
+
+@metrics.timed("load_large_image")
+def load_large_image(source: Union[bytes, str, io.BytesIO], max_side: int = TILED_MAX_SIDE) -> LargeImage:
+    """
+    Decodes a large photo (drone or wide-angle canopy shot, up to 8K) into one
+    RGB buffer whose longest side is at most max_side. JPEGs are decoded
+    directly at the smallest 1/2–1/8 scale that still covers max_side, so the
+    full-resolution image is never held in memory.
+
+    Args:
+      source:   Encoded image bytes, a file path or a file-like object
+      max_side: Longest side of the returned buffer
+
+    Returns:
+      LargeImage with the buffer, the original size and the scale between them
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        full_size = img.size
+        img.draft("RGB", _draft_request(full_size, (1, 1), max_side))
+        img.load()
+        decoded_size = img.size
+        oriented = ImageOps.exif_transpose(img)
+
+    if oriented.size != decoded_size:
+        full_size = full_size[::-1]
+    img = oriented.convert("RGB")
+    img.thumbnail((max_side, max_side))
+    return LargeImage(np.asarray(img), full_size, img.size[0] / full_size[0])
+
+
+def encode_jpeg(image: Union[Image.Image, np.ndarray], quality: int = DISPLAY_JPEG_QUALITY) -> bytes:
+    """JPEG bytes of an RGB image, for sending to a browser instead of a lossless PNG."""
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    buf = io.BytesIO()
+    image.convert("RGB").save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def composite_jpeg(
+    views: Sequence[Union[Image.Image, np.ndarray]],
+    panel_height: int = COMPOSITE_PANEL_HEIGHT,
+    gap: int = 8,
+    quality: int = DISPLAY_JPEG_QUALITY
+) -> bytes:
+    """
+    Places several views side by side, each scaled to panel_height, and
+    encodes the result as one JPEG: one small image to display instead of
+    one PNG per view.
+
+    Args:
+      views:        RGB PIL images or uint8 arrays, left to right
+      panel_height: Height of every view in the composite, in pixels
+      gap:          White space between views, in pixels
+      quality:      JPEG quality
+
+    Returns:
+      Encoded JPEG bytes
+    """
+    panels = []
+    for view in views:
+        img = Image.fromarray(view) if isinstance(view, np.ndarray) else view
+        width = max(1, round(img.width * panel_height / img.height))
+        panels.append(img.convert("RGB").resize((width, panel_height), Image.BILINEAR))
+    canvas = Image.new("RGB", (sum(p.width for p in panels) + gap * (len(panels) - 1), panel_height), "white")
+    x = 0
+    for panel in panels:
+        canvas.paste(panel, (x, 0))
+        x += panel.width + gap
+    return encode_jpeg(canvas, quality)
@@ -0,0 +1,341 @@
+# utils/manifest.py
+#
+# Dataset manifest: one record per image under data/PlantVillage with its
+# class, size, mtime, SHA-256, decoded dimensions and a 64-bit perceptual hash.
+# Built once in parallel by build_manifest.py and updated incrementally (only
+# new or changed files are re-read). Training and evaluation take their file
+# lists and train/validation split from it instead of walking the tree, and
+# corrupt files are left out up front.
+
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Same extensions and ordering rules as Keras' flow_from_directory
+IMG_EXTENSIONS = ("png", "jpg", "jpeg", "bmp", "ppm", "tif", "tiff")
+
+MANIFEST_PATH = os.path.join("data", "manifest.json")
+MANIFEST_VERSION = 1
+
+# Largest Hamming distance between perceptual hashes reported as a near-duplicate
+NEAR_DUPLICATE_DISTANCE = 4
+
+Split = Tuple[Dict[str, int], List[Tuple[str, int]], List[Tuple[str, int]]]
+
+
+# — Listing & Splitting —
+def list_class_files(data_dir: str) -> Dict[str, List[str]]:
+    """
+    Image paths per class in flow_from_directory order: classes are the
+    sorted subfolders, files are walked in sorted order.
+    """
+    classes = sorted(
+        d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d))
+    )
+    class_files = {}
+    for name in classes:
+        files = []
+        for root, _, fnames in sorted(os.walk(os.path.join(data_dir, name)), key=lambda x: x[0]):
+            for fname in sorted(fnames):
+                if fname.lower().endswith(IMG_EXTENSIONS):
+                    files.append(os.path.join(root, fname))
+        class_files[name] = files
+    return class_files
+
+
+def split_class_files(class_files: Dict[str, List[str]], validation_split: float = 0.2) -> Split:
+    """The first `validation_split` fraction of each class is the validation set."""
+    class_indices = {name: idx for idx, name in enumerate(class_files)}
+    train_files, val_files = [], []
+    for name, files in class_files.items():
+        idx = class_indices[name]
+        split_at = int(validation_split * len(files))
+        val_files.extend((path, idx) for path in files[:split_at])
+        train_files.extend((path, idx) for path in files[split_at:])
+    return class_indices, train_files, val_files
+
+
+# — Per-File Scan —
+def perceptual_hash(img: Image.Image) -> int:
+    """64-bit DCT hash: the sign of the 8×8 lowest frequencies of a 32×32 grayscale thumbnail vs. their median."""
+    small = np.asarray(img.convert("L").resize((32, 32), Image.BILINEAR), dtype=np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def scan_file(task: Tuple[str, str, str]) -> dict:
+    """
+    Worker: reads and fully decodes one image. Returns its manifest record;
+    a file that cannot be decoded gets an "error" instead of dimensions/phash.
+    """
+    root, cls, path = task
+    st = os.stat(path)
+    record = {
+        "path": os.path.relpath(path, root),
+        "class": cls,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+    with open(path, "rb") as f:
+        data = f.read()
+    record["sha256"] = hashlib.sha256(data).hexdigest()
+    try:
+        with Image.open(path) as img:
+            record["width"], record["height"] = img.size
+            # A reduced-scale JPEG decode still reads every byte, so truncated
+            # or corrupt files fail here, at a fraction of the cost
+            img.draft("RGB", (64, 64))
+            img.load()
+            record["phash"] = f"{perceptual_hash(img):016x}"
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+# — Build / Load / Save —
+def build_manifest(
+    data_dir: str,
+    previous: Optional[dict] = None,
+    workers: Optional[int] = None,
+    max_distance: int = NEAR_DUPLICATE_DISTANCE,
+    validation_split: float = 0.2
+) -> dict:
+    """
+    Scans data_dir into a manifest. Records from `previous` whose size and
+    mtime are unchanged are reused as they are; everything else is read and
+    hashed in a pool of worker processes.
+
+    Args:
+      data_dir:         Folder containing one subfolder per class
+      previous:         Earlier manifest of the same folder, for an incremental update
+      workers:          Scan processes (default: one per CPU; 1 scans inline)
+      max_distance:     Perceptual-hash distance reported as a near-duplicate
+      validation_split: Split used to flag duplicates across train/validation
+
+    Returns:
+      Manifest dict with "files" (one record per image, in split order),
+      "duplicates" and scan statistics
+    """
+    root = os.path.abspath(data_dir)
+    old = {}
+    if previous is not None and previous.get("root") == root and previous.get("version") == MANIFEST_VERSION:
+        old = {r["path"]: r for r in previous["files"]}
+
+    class_files = list_class_files(data_dir)
+    records: List[Optional[dict]] = []
+    todo = []
+    for cls, paths in class_files.items():
+        for path in paths:
+            rel = os.path.relpath(path, root)
+            prev = old.get(rel)
+            st = os.stat(path)
+            if prev is not None and prev["class"] == cls and prev["size"] == st.st_size \
+                    and prev["mtime_ns"] == st.st_mtime_ns:
+                records.append(prev)
+            else:
+                todo.append((len(records), (root, cls, path)))
+                records.append(None)
+
+    workers = workers or os.cpu_count() or 1
+    tasks = [task for _, task in todo]
+    if workers == 1 or len(tasks) < 2:
+        scanned = [scan_file(task) for task in tasks]
+    else:
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            scanned = pool.map(scan_file, tasks, chunksize=32)
+    for (i, _), record in zip(todo, scanned):
+        records[i] = record
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "root": root,
+        "created": time.time(),
+        "classes": list(class_files),
+        "files": records,
+        "stats": {
+            "files": len(records),
+            "scanned": len(todo),
+            "reused": len(records) - len(todo),
+            "corrupt": sum("error" in r for r in records),
+        },
+    }
+    manifest["duplicates"] = find_duplicates(manifest, max_distance, validation_split)
+    return manifest
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[dict]:
+    """The manifest at path, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def split_manifest(manifest: dict, validation_split: float = 0.2) -> Split:
+    """
+    Train/validation split from a manifest, by the same rule as
+    list_image_split. Corrupt files are left out before splitting, so with
+    corrupt files present the split differs from flow_from_directory's.
+    """
+    class_files = {cls: [] for cls in manifest["classes"]}
+    for r in manifest["files"]:
+        if "error" not in r:
+            class_files[r["class"]].append(os.path.join(manifest["root"], r["path"]))
+    return split_class_files(class_files, validation_split)
+
+
+def manifest_changes(manifest: dict, class_files: Dict[str, List[str]]) -> int:
+    """
+    Number of files added, removed, moved between classes or changed (size or
+    mtime) since the manifest was built, given a fresh list_class_files of
+    its root. Only stats files; nothing is read.
+    """
+    if list(class_files) != manifest["classes"]:
+        return max(1, abs(len(class_files) - len(manifest["classes"])))
+    recorded = {r["path"]: r for r in manifest["files"]}
+    changes, seen = 0, 0
+    for cls, paths in class_files.items():
+        for path in paths:
+            r = recorded.get(os.path.relpath(path, manifest["root"]))
+            if r is None:
+                changes += 1
+                continue
+            seen += 1
+            st = os.stat(path)
+            if r["class"] != cls or r["size"] != st.st_size or r["mtime_ns"] != st.st_mtime_ns:
+                changes += 1
+    return changes + len(recorded) - seen
+
+
+def load_split(
+    data_dir: str,
+    validation_split: float = 0.2,
+    manifest_path: str = MANIFEST_PATH,
+    log: Optional[Callable[[str], None]] = None
+) -> Split:
+    """
+    Train/validation split of data_dir from its manifest if one exists and
+    still matches the files on disk, otherwise by walking the directory tree.
+    A stale manifest is never used; rerun build_manifest.py to refresh it.
+
+    Args:
+      data_dir:         Folder containing one subfolder per class
+      validation_split: Fraction of each class used for validation
+      manifest_path:    Manifest from build_manifest.py
+      log:              Called with one line saying where the split came from (e.g. print)
+    """
+    class_files = list_class_files(data_dir)
+    manifest = load_manifest(manifest_path)
+    if manifest is not None and manifest.get("root") == os.path.abspath(data_dir):
+        changes = manifest_changes(manifest, class_files)
+        if changes == 0:
+            if log is not None:
+                built = time.strftime("%Y-%m-%d %H:%M", time.localtime(manifest["created"]))
+                log(f"Using manifest {manifest_path} ({manifest['stats']['files']} files, built {built}; "
+                    f"{manifest['stats']['corrupt']} corrupt skipped)")
+            return split_manifest(manifest, validation_split)
+        if log is not None:
+            log(f"Manifest {manifest_path} is out of date ({changes} file(s) added, removed or changed); "
+                f"listing {data_dir} instead. Rerun build_manifest.py to update it.")
+    return split_class_files(class_files, validation_split)
+
+
+# — Duplicates —
+def _popcount64(x: np.ndarray) -> np.ndarray:
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def near_duplicate_pairs(hashes: np.ndarray, max_distance: int) -> List[Tuple[int, int]]:
+    """
+    Index pairs (i < j) whose 64-bit hashes differ in at most max_distance bits.
+
+    Hashes are split into max_distance + 1 bands; two hashes within distance
+    max_distance agree exactly on at least one band, so only hashes sharing a
+    band value are compared.
+    """
+    bands = max_distance + 1
+    bounds = np.linspace(0, 64, bands + 1).astype(int)
+    pairs = set()
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        mask = np.uint64((1 << int(hi - lo)) - 1)
+        keys = (hashes >> np.uint64(lo)) & mask
+        order = np.argsort(keys, kind="stable")
+        _, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        for start, count in zip(starts[counts > 1], counts[counts > 1]):
+            members = order[start:start + count]
+            dist = _popcount64(hashes[members][:, None] ^ hashes[members][None, :])
+            ii, jj = np.nonzero(np.triu(dist <= max_distance, k=1))
+            pairs.update(zip(members[ii].tolist(), members[jj].tolist()))
+    return sorted((min(i, j), max(i, j)) for i, j in pairs)
+
+
+def find_duplicates(
+    manifest: dict,
+    max_distance: int = NEAR_DUPLICATE_DISTANCE,
+    validation_split: float = 0.2
+) -> List[dict]:
+    """
+    Groups of identical files (same SHA-256) and of near-duplicates (perceptual
+    hashes within max_distance, connected transitively). Each group lists its
+    paths and classes and whether it straddles the train/validation split.
+    """
+    records = [r for r in manifest["files"] if "error" not in r]
+    _, _, val_files = split_manifest(manifest, validation_split)
+    val_paths = {os.path.relpath(path, manifest["root"]) for path, _ in val_files}
+
+    # Union-find over record indices
+    parent = list(range(len(records)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    by_sha: Dict[str, int] = {}
+    for i, r in enumerate(records):
+        j = by_sha.setdefault(r["sha256"], i)
+        if j != i:
+            parent[find(i)] = find(j)
+
+    if max_distance >= 0 and records:
+        hashes = np.array([int(r["phash"], 16) for r in records], dtype=np.uint64)
+        for i, j in near_duplicate_pairs(hashes, max_distance):
+            parent[find(i)] = find(j)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(records)):
+        groups.setdefault(find(i), []).append(i)
+
+    duplicates = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        paths = [records[i]["path"] for i in members]
+        in_val = [p in val_paths for p in paths]
+        duplicates.append({
+            "kind": "exact" if len({records[i]["sha256"] for i in members}) == 1 else "near",
+            "paths": paths,
+            "classes": sorted({records[i]["class"] for i in members}),
+            "cross_split": any(in_val) and not all(in_val),
+        })
+    return duplicates
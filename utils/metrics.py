@@ -0,0 +1,386 @@
+# utils/metrics.py
+#
+# Opt-in instrumentation for the inference hot path. Disabled by default;
+# enable with LEAFMEDIC_METRICS=1 or enable(). When disabled every hook is a
+# single flag check, so it can stay on the hot path permanently.
+#
+# Records per-stage latency histograms and call/error counters, per-class
+# prediction counts and the confidence and input-size distributions. Export
+# as Prometheus text (prometheus_text / start_http_server) or periodic JSON
+# (start_json_dump). profile_next(n) captures a cProfile or TensorFlow
+# profiler trace of the next n predictions.
+
+import os
+import json
+import time
+import logging
+import pstats
+import cProfile
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99)
+MEGAPIXEL_BUCKETS = (0.05, 0.25, 1.0, 2.0, 5.0, 12.0, 24.0, 50.0)
+
+# The stage whose calls count as "requests" for profile_next
+PROFILED_STAGE = "predict_batch"
+
+logger = logging.getLogger(__name__)
+
+_enabled = os.environ.get("LEAFMEDIC_METRICS", "0").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        out, running = [], 0
+        for bound, c in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += c
+            out.append((str(bound), running))
+        return out
+
+    def to_dict(self) -> dict:
+        return {"buckets": dict(self.cumulative()), "sum": self.sum, "count": self.count}
+
+
+_latency: Dict[str, Histogram] = {}
+_calls: Dict[str, int] = {}
+_errors: Dict[str, int] = {}
+_predictions: Dict[str, int] = {}
+_shadow: Dict[str, List[int]] = {}   # version -> [compared, agreed]
+_cascade: Dict[str, int] = {}        # "fast" / "escalated" -> images
+_confidence = Histogram(CONFIDENCE_BUCKETS)
+_megapixels = Histogram(MEGAPIXEL_BUCKETS)
+
+# profile_next state
+_profile_remaining = 0
+_profile_kind = "cprofile"
+_profile_dir = "profiles"
+_profiler: Optional[cProfile.Profile] = None
+_tf_tracing = False
+_profile_busy = False   # one call at a time is profiled; others run unprofiled
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    """Clears all recorded metrics."""
+    global _confidence, _megapixels
+    with _lock:
+        _latency.clear()
+        _calls.clear()
+        _errors.clear()
+        _predictions.clear()
+        _shadow.clear()
+        _cascade.clear()
+        _confidence = Histogram(CONFIDENCE_BUCKETS)
+        _megapixels = Histogram(MEGAPIXEL_BUCKETS)
+
+
+# — Recording —
+def timed(stage: str) -> Callable:
+    """Decorator recording latency, calls and errors of a stage while metrics are enabled."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            profiling = stage == PROFILED_STAGE and _profile_remaining > 0 and _profile_claim()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                with _lock:
+                    _errors[stage] = _errors.get(stage, 0) + 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                if profiling:
+                    _profile_stop()
+                with _lock:
+                    _latency.setdefault(stage, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+                    _calls[stage] = _calls.get(stage, 0) + 1
+        return wrapper
+    return decorator
+
+
+def observe_predictions(labels, confidences) -> None:
+    """Counts predicted classes and records their confidences."""
+    if not _enabled:
+        return
+    with _lock:
+        for label, conf in zip(labels, confidences):
+            _predictions[str(label)] = _predictions.get(str(label), 0) + 1
+            _confidence.observe(float(conf))
+
+
+def observe_shadow(version: str, agreed) -> None:
+    """Counts images scored by a shadow model version and how many it agreed on."""
+    if not _enabled:
+        return
+    with _lock:
+        counts = _shadow.setdefault(version, [0, 0])
+        counts[0] += len(agreed)
+        counts[1] += int(sum(agreed))
+
+
+def observe_cascade(fast: int, escalated: int) -> None:
+    """Counts images answered by the fast cascade model and escalated to the full model."""
+    if not _enabled:
+        return
+    with _lock:
+        _cascade["fast"] = _cascade.get("fast", 0) + fast
+        _cascade["escalated"] = _cascade.get("escalated", 0) + escalated
+
+
+def observe_image_sizes(sizes) -> None:
+    """Records input image sizes, given as (width, height) pairs, in megapixels."""
+    if not _enabled:
+        return
+    with _lock:
+        for width, height in sizes:
+            _megapixels.observe(width * height / 1e6)
+
+
+# — Profiling —
+def profile_next(n: int, kind: str = "cprofile", out_dir: str = "profiles") -> None:
+    """
+    Captures a trace of the next n prediction calls (metrics must be enabled):
+    kind="cprofile" writes a .prof file, kind="tensorflow" a TensorBoard
+    profiler log directory, both under out_dir. Raises ValueError for an
+    invalid request or while a capture is still running.
+    """
+    global _profile_remaining, _profile_kind, _profile_dir
+    if kind not in ("cprofile", "tensorflow"):
+        raise ValueError(f"Unknown profiler '{kind}', expected 'cprofile' or 'tensorflow'")
+    if n < 1:
+        raise ValueError(f"Number of calls to profile must be at least 1, got {n}")
+    with _lock:
+        if _profile_remaining > 0 or _profile_busy:
+            raise ValueError(f"A {_profile_kind} capture is still running ({_profile_remaining} calls left)")
+        _profile_remaining = n
+        _profile_kind = kind
+        _profile_dir = out_dir
+
+
+def _profile_claim() -> bool:
+    """
+    Takes the profiling slot for the calling thread and starts (or resumes)
+    the profiler. Returns False if another call holds the slot, nothing is
+    left to capture, or the profiler could not start.
+    """
+    global _profile_busy
+    with _lock:
+        if _profile_busy or _profile_remaining <= 0:
+            return False
+        _profile_busy = True
+    try:
+        _profile_start()
+    except Exception:
+        logger.exception("Could not start the %s profiler; capture abandoned", _profile_kind)
+        _profile_abandon()
+        return False
+    return True
+
+
+def _profile_start() -> None:
+    global _profiler, _tf_tracing
+    if _profile_kind == "cprofile":
+        if _profiler is None:
+            _profiler = cProfile.Profile()
+        _profiler.enable()
+    elif not _tf_tracing:
+        import tensorflow as tf
+        tf.profiler.experimental.start(os.path.join(_profile_dir, "tensorflow"))
+        _tf_tracing = True
+
+
+def _profile_stop() -> None:
+    """Pauses the profiler after a call, writes the trace after the last one and releases the slot."""
+    global _profiler, _profile_remaining, _profile_busy, _tf_tracing
+    try:
+        if _profile_kind == "cprofile" and _profiler is not None:
+            _profiler.disable()
+        with _lock:
+            _profile_remaining -= 1
+            done = _profile_remaining <= 0
+        if not done:
+            return
+
+        os.makedirs(_profile_dir, exist_ok=True)
+        if _profile_kind == "cprofile":
+            path = os.path.join(_profile_dir, f"predict_{int(time.time())}.prof")
+            pstats.Stats(_profiler).dump_stats(path)
+            logger.info("cProfile trace written to %s", path)
+        else:
+            import tensorflow as tf
+            _tf_tracing = False
+            tf.profiler.experimental.stop()
+            logger.info("TensorFlow profiler trace written to %s", os.path.join(_profile_dir, "tensorflow"))
+        _profiler = None
+    except Exception:
+        # Never let the profiler replace the result of the profiled call
+        logger.exception("Could not write the %s trace; capture abandoned", _profile_kind)
+        _profile_abandon()
+    finally:
+        with _lock:
+            _profile_busy = False
+
+
+def _profile_abandon() -> None:
+    global _profiler, _profile_remaining, _profile_busy, _tf_tracing
+    if _tf_tracing:
+        _tf_tracing = False
+        try:
+            import tensorflow as tf
+            tf.profiler.experimental.stop()
+        except Exception:
+            pass
+    with _lock:
+        _profiler = None
+        _profile_remaining = 0
+        _profile_busy = False
+
+
+# — Export —
+def snapshot() -> dict:
+    """All metrics as a JSON-serializable dict."""
+    with _lock:
+        return {
+            "timestamp": time.time(),
+            "stages": {
+                stage: {
+                    "calls": _calls.get(stage, 0),
+                    "errors": _errors.get(stage, 0),
+                    "latency_seconds": hist.to_dict(),
+                }
+                for stage, hist in _latency.items()
+            },
+            "predictions": dict(_predictions),
+            "shadow": {v: {"compared": c, "agreed": a} for v, (c, a) in _shadow.items()},
+            "cascade": dict(_cascade),
+            "confidence": _confidence.to_dict(),
+            "input_megapixels": _megapixels.to_dict(),
+        }
+
+
+def _histogram_lines(name: str, hist: Histogram, labels: str = "") -> List[str]:
+    sep = "," if labels else ""
+    lines = [f'{name}_bucket{{{labels}{sep}le="{le}"}} {c}' for le, c in hist.cumulative()]
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {hist.sum}")
+    lines.append(f"{name}_count{suffix} {hist.count}")
+    return lines
+
+
+def prometheus_text() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        lines = [
+            "# HELP leafmedic_stage_latency_seconds Latency of each pipeline stage.",
+            "# TYPE leafmedic_stage_latency_seconds histogram",
+        ]
+        for stage, hist in sorted(_latency.items()):
+            lines += _histogram_lines("leafmedic_stage_latency_seconds", hist, f'stage="{stage}"')
+
+        lines += ["# HELP leafmedic_stage_calls_total Calls of each pipeline stage.",
+                  "# TYPE leafmedic_stage_calls_total counter"]
+        lines += [f'leafmedic_stage_calls_total{{stage="{s}"}} {c}' for s, c in sorted(_calls.items())]
+
+        lines += ["# HELP leafmedic_stage_errors_total Failed calls of each pipeline stage.",
+                  "# TYPE leafmedic_stage_errors_total counter"]
+        lines += [f'leafmedic_stage_errors_total{{stage="{s}"}} {c}' for s, c in sorted(_errors.items())]
+
+        lines += ["# HELP leafmedic_predictions_total Predictions per class.",
+                  "# TYPE leafmedic_predictions_total counter"]
+        lines += [f'leafmedic_predictions_total{{label="{l}"}} {c}' for l, c in sorted(_predictions.items())]
+
+        if _shadow:
+            lines += ["# HELP leafmedic_shadow_compared_total Images also scored by a shadow model version.",
+                      "# TYPE leafmedic_shadow_compared_total counter"]
+            lines += [f'leafmedic_shadow_compared_total{{version="{v}"}} {c}' for v, (c, _) in sorted(_shadow.items())]
+            lines += ["# HELP leafmedic_shadow_agreed_total Shadow predictions with the same top-1 class.",
+                      "# TYPE leafmedic_shadow_agreed_total counter"]
+            lines += [f'leafmedic_shadow_agreed_total{{version="{v}"}} {a}' for v, (_, a) in sorted(_shadow.items())]
+
+        if _cascade:
+            lines += ["# HELP leafmedic_cascade_images_total Images answered by the fast model or escalated.",
+                      "# TYPE leafmedic_cascade_images_total counter"]
+            lines += [f'leafmedic_cascade_images_total{{path="{p}"}} {c}' for p, c in sorted(_cascade.items())]
+
+        lines += ["# HELP leafmedic_prediction_confidence Confidence of the top prediction.",
+                  "# TYPE leafmedic_prediction_confidence histogram"]
+        lines += _histogram_lines("leafmedic_prediction_confidence", _confidence)
+
+        lines += ["# HELP leafmedic_input_megapixels Size of input images.",
+                  "# TYPE leafmedic_input_megapixels histogram"]
+        lines += _histogram_lines("leafmedic_input_megapixels", _megapixels)
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(port: int = 9100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves prometheus_text() at /metrics from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="leafmedic-metrics", daemon=True).start()
+    return server
+
+
+def start_json_dump(path: str, interval: float = 60.0) -> threading.Thread:
+    """Rewrites snapshot() to path every interval seconds from a daemon thread."""
+    def _loop():
+        while True:
+            time.sleep(interval)
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(snapshot(), f, indent=2)
+            os.replace(tmp, path)
+
+    thread = threading.Thread(target=_loop, name="leafmedic-metrics-dump", daemon=True)
+    thread.start()
+    return thread
@@ -1,59 +1,892 @@
 # utils/predict.py
+#
+# TensorFlow, the model and the class index file are all loaded lazily on
+# first use, so `from utils.predict import labels` stays cheap and a missing
+# model only fails the callers that actually need it.
+#
+# Models are loaded per version from the registry (utils/registry.py): the
+# active version can be hot-swapped with activate_version / watch_registry,
+# and a second version can be shadowed with set_shadow_version.
+
+import time
+_IMPORT_START = time.perf_counter()
 
 import os
 import json
 import functools
-from typing import Tuple
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import numpy as np
-import tensorflow as tf
 from PIL import Image
-from tensorflow.keras.preprocessing import image as kimage
 
-# Paths
-MODEL_PATH = os.path.join("model", "disease_model.keras")
-CLASS_IDX_PATH = os.path.join("model", "class_indices.json")
+from utils import metrics, registry
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+# Paths of the legacy, unversioned model (the registry version "default")
+MODEL_PATH = os.path.join(registry.LEGACY_DIR, registry.MODEL_FILE)
+CLASS_IDX_PATH = os.path.join(registry.LEGACY_DIR, registry.CLASS_IDX_FILE)
+
+# Quantized models written by export_tflite.py
+TFLITE_PATHS = {
+    backend: os.path.join(registry.LEGACY_DIR, fname) for backend, fname in registry.TFLITE_FILES.items()
+}
+BACKENDS = ("keras",) + tuple(TFLITE_PATHS)
+
+# Default number of images pushed through the model per forward pass
+DEFAULT_BATCH_SIZE = 32
+
+# Pixel scaling the models were trained with (mobilenet_v2.preprocess_input in
+# utils/dataset.py and train_model.py); part of the prediction-cache fingerprint,
+# and recorded with TFLite exports and the cascade calibration, which are
+# refused when it does not match
+INPUT_NORMALIZATION = "mobilenet_v2"
+
+# Inference backend, chosen with LEAFMEDIC_BACKEND or set_backend()
+_backend = os.environ.get("LEAFMEDIC_BACKEND", "keras")
+
+# Startup costs in seconds, filled in as each stage first runs
+_timings: Dict[str, float] = {}
+
 
-# Load and cache model
-@functools.lru_cache(maxsize=1)
-def load_model() -> tf.keras.Model:
-    if not os.path.exists(MODEL_PATH):
-        raise FileNotFoundError(f"Model file not found at: {MODEL_PATH}")
+# Load model and class indices
+@metrics.timed("load_model")
+def _read_model(path: str) -> "tf.keras.Model":
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file not found at: {path}")
+    start = time.perf_counter()
+    import tensorflow as tf
     try:
-        return tf.keras.models.load_model(MODEL_PATH, compile=False)
+        net = tf.keras.models.load_model(path, compile=False)
     except Exception as e:
-        print("❌ Failed to load model from:", MODEL_PATH)
+        print("❌ Failed to load model from:", path)
         print("🔍 Detailed exception:", repr(e))
         raise RuntimeError("Model loading failed.")
+    _timings.setdefault("load_s", time.perf_counter() - start)
+    return net
+
+
+def _read_labels(path: str) -> List[str]:
+    """
+    Reads a class_indices.json into a list where labels[i] = class name for
+    model output index i. Does not import TensorFlow.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Class index file not found at: {path}")
+
+    with open(path, "r") as f:
+        class_indices = json.load(f)
+
+    labels = [None] * len(class_indices)
+    for class_name, idx in class_indices.items():
+        if not isinstance(idx, int) or idx < 0 or idx >= len(labels):
+            raise ValueError(f"Invalid class index for '{class_name}': {idx}")
+        labels[idx] = class_name
+
+    if any(label is None for label in labels):
+        raise ValueError("Class indices mapping is incomplete or contains gaps.")
+    return labels
+
+
+# — Model Versions —
+class ModelVersion:
+    """
+    One model version (see utils/registry.py): its files and, once loaded,
+    its Keras model, labels and traced forward passes. Requests resolve the
+    version once and keep using it, so swapping the active version never
+    pulls a model out from under an in-flight batch.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.directory = registry.version_dir(name)
+        self.model_path = os.path.join(self.directory, registry.MODEL_FILE)
+        self.class_idx_path = os.path.join(self.directory, registry.CLASS_IDX_FILE)
+        self.tflite_paths = {
+            backend: os.path.join(self.directory, fname) for backend, fname in registry.TFLITE_FILES.items()
+        }
+        self.fast_model_path = os.path.join(self.directory, registry.FAST_MODEL_FILE)
+        self.fast_config_path = os.path.join(self.directory, registry.FAST_CONFIG_FILE)
+        self.tflite_meta_path = os.path.join(self.directory, registry.TFLITE_META_FILE)
+        self._net = None
+        self._fast_net = None
+        self._fast_config: Optional[dict] = None
+        self._labels: Optional[List[str]] = None
+        self._forwards: Dict[Tuple, Callable[[np.ndarray], np.ndarray]] = {}
+        # Reentrant: building a forward pass loads the model under the same lock
+        self._lock = threading.RLock()
+
+    def __repr__(self) -> str:
+        return f"ModelVersion({self.name!r})"
+
+    def load_model(self) -> "tf.keras.Model":
+        """Loads the Keras model on first call and returns the cached instance."""
+        # The lock keeps a background warm-up and a first request from both loading
+        with self._lock:
+            if self._net is None:
+                self._net = _read_model(self.model_path)
+            return self._net
+
+    def labels(self) -> List[str]:
+        if self._labels is None:
+            self._labels = _read_labels(self.class_idx_path)
+        return self._labels
+
+    def forward(
+        self,
+        backend: str,
+        batch_size: int,
+        target_size: Tuple[int, int]
+    ) -> Callable[[np.ndarray], np.ndarray]:
+        """The forward pass of this version for one backend and fixed batch shape, built on first use."""
+        key = ("probs", backend, batch_size, target_size)
+        fn = self._forwards.get(key)
+        if fn is None:
+            with self._lock:
+                if key not in self._forwards:
+                    if backend == "keras":
+                        self._forwards[key] = _compiled_forward(self.load_model(), batch_size, target_size)
+                    else:
+                        self._forwards[key] = _tflite_forward(self._tflite_path(backend), batch_size, target_size)
+                fn = self._forwards[key]
+        return fn
+
+    def embed(self, batch_size: int, target_size: Tuple[int, int]) -> Callable[[np.ndarray], np.ndarray]:
+        """Like forward, but returns penultimate-layer embeddings of the Keras model."""
+        key = ("embed", batch_size, target_size)
+        fn = self._forwards.get(key)
+        if fn is None:
+            with self._lock:
+                if key not in self._forwards:
+                    self._forwards[key] = _compiled_embed(self.load_model(), batch_size, target_size)
+                fn = self._forwards[key]
+        return fn
+
+    def has_fast_model(self) -> bool:
+        return os.path.exists(self.fast_model_path)
+
+    def load_fast_model(self) -> "tf.keras.Model":
+        """Loads the low-resolution cascade model (train_model.py --fast) on first call."""
+        with self._lock:
+            if self._fast_net is None:
+                self._fast_net = _read_model(self.fast_model_path)
+            return self._fast_net
+
+    def fast_input_size(self) -> Tuple[int, int]:
+        """(width, height) the fast model takes."""
+        _, height, width, _ = self.load_fast_model().input_shape
+        return width, height
+
+    def fast_config(self) -> dict:
+        """
+        The fast model's calibration (fast_model.json); the threshold defaults
+        to CASCADE_THRESHOLD. A calibration made with a different input
+        normalization (or before it was recorded) is refused.
+        """
+        if self._fast_config is None:
+            config = {"threshold": CASCADE_THRESHOLD}
+            if os.path.exists(self.fast_config_path):
+                with open(self.fast_config_path, "r", encoding="utf-8") as f:
+                    config.update(json.load(f))
+                normalization = config.get("input_normalization")
+                if normalization != INPUT_NORMALIZATION:
+                    raise RuntimeError(
+                        f"{self.fast_config_path} was calibrated with input normalization "
+                        f"'{normalization or 'unrecorded'}', not '{INPUT_NORMALIZATION}'; "
+                        f"rerun train_model.py --fast or benchmark_cascade.py --calibrate"
+                    )
+            self._fast_config = config
+        return self._fast_config
+
+    def fast_forward(self, batch_size: int, target_size: Tuple[int, int]) -> Callable[[np.ndarray], np.ndarray]:
+        """Like forward, for the fast model on the Keras backend; target_size must be fast_input_size()."""
+        key = ("fast", batch_size, target_size)
+        fn = self._forwards.get(key)
+        if fn is None:
+            with self._lock:
+                if key not in self._forwards:
+                    self._forwards[key] = _compiled_forward(self.load_fast_model(), batch_size, target_size)
+                fn = self._forwards[key]
+        return fn
+
+    def _tflite_path(self, backend: str) -> str:
+        if backend not in self.tflite_paths:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        path = self.tflite_paths[backend]
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"TFLite model not found at: {path} (run export_tflite.py)")
+        # Quantization ranges are calibrated on model inputs, so an export made
+        # for other pixel scaling gives wrong answers rather than errors
+        exports = {}
+        if os.path.exists(self.tflite_meta_path):
+            with open(self.tflite_meta_path, "r", encoding="utf-8") as f:
+                exports = json.load(f)
+        normalization = exports.get(backend, {}).get("input_normalization")
+        if normalization != INPUT_NORMALIZATION:
+            raise RuntimeError(
+                f"{path} was exported for input normalization '{normalization or 'unrecorded'}', "
+                f"not '{INPUT_NORMALIZATION}'; rerun export_tflite.py"
+            )
+        return path
+
+    def warm_up(self, target_size: Tuple[int, int] = (224, 224)) -> None:
+        """
+        Loads this version and runs one dummy single-image inference on the
+        selected backend, and through the fast model too when cascading.
+        """
+        width, height = target_size
+        self.labels()
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+        _forward_probs([dummy], 1, target_size, self)
+        if _cascade and self.has_fast_model():
+            self.fast_config()
+            _fast_probs([dummy], 1, self)
+
+
+_versions_lock = threading.Lock()
+_versions: Dict[str, ModelVersion] = {}
+_active: Optional[ModelVersion] = None
+_shadow: Optional[ModelVersion] = None
+
+
+def _get_version(name: str) -> ModelVersion:
+    with _versions_lock:
+        if name not in _versions:
+            _versions[name] = ModelVersion(name)
+        return _versions[name]
+
+
+def _release(version: Optional[ModelVersion]) -> None:
+    # Forget a version no longer active or shadowed; batches still holding it
+    # finish normally and it is freed after them
+    with _versions_lock:
+        if version is not None and version is not _active and version is not _shadow:
+            _versions.pop(version.name, None)
+
+
+def current_version() -> ModelVersion:
+    """
+    The version serving predictions in this process. Resolved on first use
+    from LEAFMEDIC_MODEL_VERSION or the registry's ACTIVE pointer, and
+    changed only by activate_version (or watch_registry).
+    """
+    global _active
+    if _active is None:
+        version = _get_version(os.environ.get("LEAFMEDIC_MODEL_VERSION") or registry.active_version())
+        with _versions_lock:
+            if _active is None:
+                _active = version
+    return _active
+
+
+def _resolve(version: Union[None, str, ModelVersion]) -> ModelVersion:
+    if version is None:
+        return current_version()
+    if isinstance(version, ModelVersion):
+        return version
+    return _get_version(version)
+
+
+def _prepare(name: str, background: bool, target_size: Tuple[int, int],
+             install: Callable[[ModelVersion], None]) -> Optional[threading.Thread]:
+    if not registry.version_exists(name):
+        raise FileNotFoundError(f"Model version '{name}' not found at: {registry.version_dir(name)}")
+
+    def _run():
+        version = _resolve(name)
+        version.warm_up(target_size)
+        install(version)
+
+    if not background:
+        _run()
+        return None
+    thread = threading.Thread(target=_run, name=f"leafmedic-load-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def activate_version(
+    name: str,
+    background: bool = True,
+    target_size: Tuple[int, int] = (224, 224)
+) -> Optional[threading.Thread]:
+    """
+    Loads and warms a model version, then makes it the one this process
+    serves. Requests keep using the previous version until the new one is
+    ready, and batches already running finish on the version they started
+    with. This only affects the current process; use registry.set_active to
+    move every process watching the registry.
+
+    Args:
+        name: Registry version, or "default" for the model/ directory.
+        background: Load in a daemon thread and return it instead of blocking.
+        target_size: Tuple (width, height) the warm-up input is built at.
+    """
+    def install(version: ModelVersion) -> None:
+        global _active, _shadow
+        previous, _active = _active, version
+        if _shadow is version:
+            # The shadow was promoted; there is nothing left to compare against
+            _shadow = None
+        _release(previous)
+        print(f"Serving model version '{version.name}'")
+
+    return _prepare(name, background, target_size, install)
+
+
+def set_shadow_version(
+    name: Optional[str],
+    background: bool = True,
+    target_size: Tuple[int, int] = (224, 224)
+) -> Optional[threading.Thread]:
+    """
+    Runs a second version side by side with the active one: every batch
+    predicted with the active version is also scored by the shadow version
+    in a background thread, and the two are compared (see shadow_stats).
+    Callers always receive the active version's predictions. None turns
+    shadowing off.
+    """
+    global _shadow
+    if name is None:
+        previous, _shadow = _shadow, None
+        _release(previous)
+        return None
+
+    def install(version: ModelVersion) -> None:
+        global _shadow
+        previous, _shadow = _shadow, version
+        _release(previous)
+        with _shadow_lock:
+            _shadow_counts.clear()
+
+    return _prepare(name, background, target_size, install)
+
+
+_watcher: Optional[threading.Thread] = None
+
+
+def watch_registry(interval: float = 5.0, target_size: Tuple[int, int] = (224, 224)) -> threading.Thread:
+    """
+    Starts (once per process) a daemon thread that polls the registry's
+    ACTIVE pointer and hot-swaps to a new version when it changes. A version
+    that fails to load is reported and the current one keeps serving.
+    Ignored while LEAFMEDIC_MODEL_VERSION pins the version.
+    """
+    global _watcher
+    with _versions_lock:
+        if _watcher is not None:
+            return _watcher
+
+        def _run():
+            failed = None
+            while True:
+                time.sleep(interval)
+                if os.environ.get("LEAFMEDIC_MODEL_VERSION"):
+                    continue
+                name = registry.active_version()
+                if name == current_version().name or name == failed:
+                    continue
+                try:
+                    activate_version(name, background=False, target_size=target_size)
+                    failed = None
+                except Exception as e:
+                    print(f"❌ Could not switch to model version '{name}': {e!r}")
+                    failed = name
+
+        _watcher = threading.Thread(target=_run, name="leafmedic-registry-watch", daemon=True)
+        _watcher.start()
+        return _watcher
+
+
+def load_model() -> "tf.keras.Model":
+    """Loads the active version's Keras model on first call and returns the cached instance."""
+    return current_version().load_model()
+
+
+def load_labels() -> List[str]:
+    """
+    Class names of the active version, where labels[i] = class name for
+    model output index i. Does not import TensorFlow.
+    """
+    return current_version().labels()
+
+
+def __getattr__(name: str):
+    # Keeps `from utils.predict import labels, model` working without paying
+    # for them at import time.
+    if name == "labels":
+        return load_labels()
+    if name == "model":
+        return load_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# A PIL image, or a uint8 RGB array already at target_size (e.g. from utils.image_io)
+ImageInput = Union[Image.Image, np.ndarray]
+
+
+def _resized_rgb(img: ImageInput, target_size: Tuple[int, int]) -> np.ndarray:
+    width, height = target_size
+    if isinstance(img, np.ndarray):
+        if img.shape != (height, width, 3):
+            raise ValueError(f"Array input must be a {height}×{width}×3 RGB image, got shape {img.shape}")
+        return img
+    return np.asarray(img.resize(target_size).convert("RGB"))
+
+
+def to_model_input(img: ImageInput, target_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Resize, convert to RGB and scale an image to a float32 array in [-1, 1],
+    exactly like mobilenet_v2.preprocess_input in the training pipeline.
+    """
+    return _resized_rgb(img, target_size).astype(np.float32) / 127.5 - 1.0
+
+
+def _image_size(img: ImageInput) -> Tuple[int, int]:
+    return (img.shape[1], img.shape[0]) if isinstance(img, np.ndarray) else img.size
+
+
+def _batch_shape(n: int, batch_size: int) -> int:
+    """
+    Rounds a partial batch up to the next power of two (capped at batch_size),
+    so callers with varying batch sizes, such as a micro-batching server, only
+    ever trace a handful of graph shapes.
+    """
+    shape = 1
+    while shape < min(n, batch_size):
+        shape *= 2
+    return min(shape, batch_size)
+
+
+def set_backend(name: str) -> None:
+    """
+    Selects the inference backend used by predict_leaf_disease(_batch):
+    "keras" (float32 .keras model), "tflite-dynamic" or "tflite-int8".
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of {BACKENDS}")
+    _backend = name
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def _compiled_forward(
+    net: "tf.keras.Model",
+    batch_size: int,
+    target_size: Tuple[int, int]
+) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Builds a traced forward pass of a model for one fixed batch shape.
+
+    Every call with the same (batch_size, target_size) reuses the same concrete
+    graph, so the per-call overhead of `model.predict` is paid only once.
+    """
+    import tensorflow as tf
+
+    width, height = target_size
+    spec = tf.TensorSpec((batch_size, height, width, 3), tf.float32)
+
+    @tf.function(input_signature=[spec])
+    def forward(batch):
+        return net(batch, training=False)
+
+    return lambda batch: forward(tf.constant(batch)).numpy()
+
+
+def _tflite_interpreter_class():
+    # The standalone tflite_runtime wheel is enough on edge boxes; fall back
+    # to the interpreter bundled with TensorFlow
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def _tflite_forward(
+    path: str,
+    batch_size: int,
+    target_size: Tuple[int, int]
+) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Builds a TFLite interpreter for one fixed batch shape. Quantized input and
+    output tensors are converted from and to float32 probabilities, so callers
+    see the same values as with the Keras backend.
+    """
+    interpreter = _tflite_interpreter_class()(model_path=path, num_threads=os.cpu_count())
+    width, height = target_size
+    interpreter.resize_tensor_input(
+        interpreter.get_input_details()[0]["index"], (batch_size, height, width, 3)
+    )
+    interpreter.allocate_tensors()
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    # An interpreter holds its tensors in place, so calls must not overlap
+    lock = threading.Lock()
+
+    def forward(batch: np.ndarray) -> np.ndarray:
+        if inp["dtype"] != np.float32:
+            scale, zero_point = inp["quantization"]
+            limits = np.iinfo(inp["dtype"])
+            batch = np.clip(np.round(batch / scale + zero_point), limits.min, limits.max)
+            batch = batch.astype(inp["dtype"])
+        with lock:
+            interpreter.set_tensor(inp["index"], batch)
+            interpreter.invoke()
+            preds = interpreter.get_tensor(out["index"])
+        if out["dtype"] != np.float32:
+            scale, zero_point = out["quantization"]
+            preds = (preds.astype(np.float32) - zero_point) * scale
+        return preds
+
+    return forward
+
+
+def top_predictions(
+    all_probs: np.ndarray,
+    labels: Optional[Sequence[str]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Class names and probabilities of the most likely class in each row of
+    all_probs (N, num_classes). Names come from labels, or the active version.
+    """
+    all_probs = np.atleast_2d(all_probs)
+    top_idx = np.argmax(all_probs, axis=1)
+    names = np.asarray(labels if labels is not None else load_labels())
+    return names[top_idx], all_probs[np.arange(len(all_probs)), top_idx]
+
+
+@metrics.timed("predict_batch")
+def predict_leaf_disease_batch(
+    images: Sequence[ImageInput],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    target_size: Tuple[int, int] = (224, 224),
+    version: Union[None, str, ModelVersion] = None,
+    shadow: bool = True
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Predicts the disease class of many plant leaf images at once.
+
+    Images are stacked into fixed-shape batches (zero-padded to batch_size, or
+    to a power of two for fewer images) and run through a single compiled
+    forward pass per batch of the selected backend (see set_backend). With
+    cascading on (see set_cascade), the fast model answers first and only
+    uncertain images reach the full model. With a shadow version set, the
+    batch is also scored by it in the background.
+
+    Args:
+        images: Sequence of PIL.Image.Image objects (RGB or grayscale), or of
+            uint8 RGB arrays already resized to target_size.
+        batch_size: Maximum number of images per forward pass.
+        target_size: Tuple (width, height) to resize each image for the model.
+        version: Model version (name or ModelVersion) to use instead of the active
+            one (see utils/registry.py). Only the active version is shadowed.
+        shadow: Whether the shadow version (if any) also scores this batch;
+            False keeps checks and tools out of the shadow comparison.
+
+    Returns:
+        predicted_labels: Numpy array (N,) of class names with highest probability.
+        confidences: Numpy array (N,) of the probability of each predicted label.
+        all_probs: Numpy array (N, num_classes) of probabilities for all classes.
+    """
+    images = list(images)
+    if not images:
+        raise ValueError("predict_leaf_disease_batch() needs at least one image.")
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
+
+    model_version = _resolve(version)
+    metrics.observe_image_sizes(_image_size(img) for img in images)
+    if _cascade and model_version.has_fast_model():
+        all_probs = _cascade_probs(images, batch_size, tuple(target_size), model_version)
+    else:
+        all_probs = _forward_probs(images, batch_size, tuple(target_size), model_version)
+    predicted_labels, confidences = top_predictions(all_probs, model_version.labels())
+    metrics.observe_predictions(predicted_labels, confidences)
+
+    shadow_version = _shadow if shadow else None
+    if shadow_version is not None and model_version is _active and shadow_version is not model_version:
+        _submit_shadow(shadow_version, images, batch_size, tuple(target_size), predicted_labels, confidences)
+
+    return predicted_labels, confidences, all_probs
 
-model = load_model()
 
-# Load class indices
-if not os.path.exists(CLASS_IDX_PATH):
-    raise FileNotFoundError(f"Class index file not found at: {CLASS_IDX_PATH}")
+def _forward_probs(
+    images: List[ImageInput],
+    batch_size: int,
+    target_size: Tuple[int, int],
+    version: ModelVersion
+) -> np.ndarray:
+    """Class probabilities (N, num_classes) of images, in fixed-shape batches of at most batch_size."""
+    return _run_batched(images, batch_size, target_size, functools.partial(version.forward, _backend))
 
-with open(CLASS_IDX_PATH, "r") as f:
-    class_indices = json.load(f)
 
-# Build a label list where labels[i] = class name for model output index i
-labels = [None] * len(class_indices)
-for class_name, idx in class_indices.items():
-    if not isinstance(idx, int) or idx < 0 or idx >= len(labels):
-        raise ValueError(f"Invalid class index for '{class_name}': {idx}")
-    labels[idx] = class_name
+def _run_batched(
+    images: List[ImageInput],
+    batch_size: int,
+    target_size: Tuple[int, int],
+    get_forward: Callable[[int, Tuple[int, int]], Callable[[np.ndarray], np.ndarray]]
+) -> np.ndarray:
+    """Model outputs (N, ...) of images, pushed through get_forward's pass in fixed-shape batches."""
+    n = len(images)
+    batch_size = _batch_shape(n, batch_size)
+    forward = get_forward(batch_size, target_size)
 
-if any(label is None for label in labels):
-    raise ValueError("Class indices mapping is incomplete or contains gaps.")
+    width, height = target_size
+    batch = np.zeros((batch_size, height, width, 3), dtype=np.float32)
+    outputs = None
 
+    for start in range(0, n, batch_size):
+        chunk = images[start:start + batch_size]
+        for i, img in enumerate(chunk):
+            batch[i] = to_model_input(img, target_size)
+        batch[len(chunk):] = 0.0
+
+        if "first_inference_s" not in _timings:
+            start_t = time.perf_counter()
+            preds = forward(batch)
+            _timings["first_inference_s"] = time.perf_counter() - start_t
+        else:
+            preds = forward(batch)
+        if outputs is None:
+            outputs = np.empty((n,) + preds.shape[1:], dtype=np.float32)
+        outputs[start:start + len(chunk)] = preds[:len(chunk)]
+    return outputs
+
+
+# — Cascade —
+# A small low-resolution companion model (train_model.py --fast) scores every
+# image first; only images where its confidence is below the calibrated
+# threshold in fast_model.json are escalated to the full model. Off unless
+# enabled with LEAFMEDIC_CASCADE=1 or set_cascade(True), and only used for
+# versions that have a fast model. The fast model always runs on Keras.
+
+# Threshold used until calibrate_cascade has written one
+CASCADE_THRESHOLD = 0.9
+
+_cascade = os.environ.get("LEAFMEDIC_CASCADE", "0").lower() in ("1", "true", "yes")
+_cascade_lock = threading.Lock()
+_cascade_counts = {"fast": 0, "escalated": 0}
+
+
+def set_cascade(enabled: bool) -> None:
+    """Turns confidence-gated cascade inference on or off for this process."""
+    global _cascade
+    _cascade = enabled
+
+
+def get_cascade() -> bool:
+    return _cascade
+
+
+def _fast_probs(images: List[ImageInput], batch_size: int, version: ModelVersion) -> np.ndarray:
+    """Class probabilities of the fast model; arrays at the full model's size are downscaled first."""
+    import cv2  # only needed here; keeps `import utils.predict` light
+
+    fast_size = version.fast_input_size()
+    small = [
+        cv2.resize(img, fast_size, interpolation=cv2.INTER_AREA)
+        if isinstance(img, np.ndarray) and img.shape[1::-1] != fast_size else img
+        for img in images
+    ]
+    return _run_batched(small, batch_size, fast_size, version.fast_forward)
+
+
+def _cascade_probs(
+    images: List[ImageInput],
+    batch_size: int,
+    target_size: Tuple[int, int],
+    version: ModelVersion
+) -> np.ndarray:
+    probs = _fast_probs(images, batch_size, version)
+    escalate = np.flatnonzero(probs.max(axis=1) < version.fast_config()["threshold"])
+    if len(escalate):
+        probs[escalate] = _forward_probs([images[i] for i in escalate], batch_size, target_size, version)
+    with _cascade_lock:
+        _cascade_counts["fast"] += len(images) - len(escalate)
+        _cascade_counts["escalated"] += len(escalate)
+    metrics.observe_cascade(len(images) - len(escalate), len(escalate))
+    return probs
+
+
+def cascade_stats() -> dict:
+    """Images answered by the fast model and escalated to the full model in this process."""
+    with _cascade_lock:
+        counts = dict(_cascade_counts)
+    total = counts["fast"] + counts["escalated"]
+    return {**counts, "escalation_rate": counts["escalated"] / total if total else None}
+
+
+def cascade_threshold(
+    confidences: np.ndarray,
+    agrees: np.ndarray,
+    target_agreement: float = 0.99
+) -> float:
+    """
+    Lowest fast-model confidence threshold at which the answers it accepts
+    agree with the full model at least target_agreement of the time.
+
+    Args:
+        confidences: Fast-model top-1 confidence per calibration image.
+        agrees: Whether the fast and full model's top-1 classes match, per image.
+        target_agreement: Required agreement among accepted images.
+
+    Returns:
+        The threshold; above 1.0 (escalate everything) if none qualifies.
+    """
+    order = np.argsort(-confidences, kind="stable")
+    accepted_agreement = np.cumsum(agrees[order]) / np.arange(1, len(order) + 1)
+    ok = np.flatnonzero(accepted_agreement >= target_agreement)
+    if not len(ok):
+        return 1.01
+    return float(confidences[order[ok[-1]]])
+
+
+def calibrate_cascade(
+    images: Iterable[ImageInput],
+    target_agreement: float = 0.99,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    target_size: Tuple[int, int] = (224, 224),
+    version: Union[None, str, ModelVersion] = None
+) -> dict:
+    """
+    Scores calibration images (e.g. the validation split) with both the fast
+    and the full model, picks the cascade threshold (see cascade_threshold)
+    and writes it to the version's fast_model.json. Images are consumed in
+    chunks, so a generator keeps memory flat.
+
+    Returns:
+        The written config: threshold, target agreement, number of images and
+        the escalation rate and agreement with the full model it gives on them.
+    """
+    model_version = _resolve(version)
+    images = iter(images)
+    confidences, agrees = [], []
+    while True:
+        chunk = list(itertools.islice(images, batch_size * 8))
+        if not chunk:
+            break
+        full = _forward_probs(chunk, batch_size, tuple(target_size), model_version)
+        fast = _fast_probs(chunk, batch_size, model_version)
+        confidences.append(fast.max(axis=1))
+        agrees.append(fast.argmax(axis=1) == full.argmax(axis=1))
+    if not confidences:
+        raise ValueError("calibrate_cascade() needs at least one image.")
+    confidences, agrees = np.concatenate(confidences), np.concatenate(agrees)
+
+    threshold = cascade_threshold(confidences, agrees, target_agreement)
+    accepted = confidences >= threshold
+    config = {
+        "threshold": threshold,
+        "target_agreement": target_agreement,
+        "calibration_images": len(confidences),
+        "escalation_rate": float(1.0 - accepted.mean()),
+        # Escalated images get the full model's answer, so they always agree
+        "agreement": float(np.mean(agrees | ~accepted)),
+        "input_normalization": INPUT_NORMALIZATION,
+        "calibrated": time.time(),
+    }
+    tmp = model_version.fast_config_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp, model_version.fast_config_path)
+    model_version._fast_config = None
+    return config
+
+
+# — Shadow Comparison —
+# Batches scored by the shadow version queue up here; beyond this many, new
+# batches are skipped rather than letting the shadow fall further behind
+SHADOW_MAX_PENDING = 4
+
+_shadow_lock = threading.Lock()
+_shadow_executor: Optional[ThreadPoolExecutor] = None
+_shadow_pending = 0
+_shadow_counts: Dict[str, float] = {}
+
+
+def _submit_shadow(
+    shadow: ModelVersion,
+    images: List[ImageInput],
+    batch_size: int,
+    target_size: Tuple[int, int],
+    primary_labels: np.ndarray,
+    primary_confidences: np.ndarray
+) -> None:
+    global _shadow_executor, _shadow_pending
+    with _shadow_lock:
+        if _shadow_pending >= SHADOW_MAX_PENDING:
+            _shadow_counts["skipped"] = _shadow_counts.get("skipped", 0) + len(images)
+            return
+        _shadow_pending += 1
+        if _shadow_executor is None:
+            _shadow_executor = ThreadPoolExecutor(1, thread_name_prefix="leafmedic-shadow")
+    # The caller may reuse its arrays once we return
+    images = [img.copy() if isinstance(img, np.ndarray) else img for img in images]
+    _shadow_executor.submit(_run_shadow, shadow, images, batch_size, target_size,
+                            primary_labels, primary_confidences)
+
+
+def _run_shadow(shadow, images, batch_size, target_size, primary_labels, primary_confidences) -> None:
+    global _shadow_pending
+    try:
+        probs = _forward_probs(images, batch_size, target_size, shadow)
+        shadow_labels, shadow_confidences = top_predictions(probs, shadow.labels())
+        agreed = shadow_labels == primary_labels
+        with _shadow_lock:
+            _shadow_counts["compared"] = _shadow_counts.get("compared", 0) + len(images)
+            _shadow_counts["agreed"] = _shadow_counts.get("agreed", 0) + int(agreed.sum())
+            _shadow_counts["confidence_delta_sum"] = _shadow_counts.get("confidence_delta_sum", 0.0) + \
+                float(np.sum(shadow_confidences - primary_confidences))
+        metrics.observe_shadow(shadow.name, agreed)
+    except Exception as e:
+        print(f"❌ Shadow version '{shadow.name}' failed: {e!r}")
+        with _shadow_lock:
+            _shadow_counts["errors"] = _shadow_counts.get("errors", 0) + 1
+    finally:
+        with _shadow_lock:
+            _shadow_pending -= 1
+
+
+def shadow_stats() -> dict:
+    """
+    Agreement between the active and the shadow version since the shadow was set:
+    images compared, top-1 agreement rate, mean confidence change (shadow minus
+    active), and images skipped because the shadow was behind.
+    """
+    with _shadow_lock:
+        counts = dict(_shadow_counts)
+    compared = int(counts.get("compared", 0))
+    return {
+        "active": current_version().name,
+        "shadow": _shadow.name if _shadow is not None else None,
+        "compared": compared,
+        "agreement": counts.get("agreed", 0) / compared if compared else None,
+        "mean_confidence_delta": counts.get("confidence_delta_sum", 0.0) / compared if compared else None,
+        "skipped": int(counts.get("skipped", 0)),
+        "errors": int(counts.get("errors", 0)),
+    }
+
+
+@metrics.timed("predict_leaf_disease")
 def predict_leaf_disease(
-    pil_img: Image.Image,
+    pil_img: ImageInput,
     target_size: Tuple[int, int] = (224, 224)
 ) -> Tuple[str, float, np.ndarray]:
     """
     Predicts the disease class of a plant leaf image.
 
     Args:
-        pil_img: A PIL.Image.Image object (can be RGB or grayscale).
+        pil_img: A PIL.Image.Image object (can be RGB or grayscale), or a uint8
+            RGB array already resized to target_size.
         target_size: Tuple (width, height) to resize the image for the model.
 
     Returns:
@@ -61,15 +894,336 @@ def predict_leaf_disease(
         confidence: Probability (0–1) of the predicted_label.
         all_probs: Numpy array of probabilities for all classes.
     """
-    # Resize and convert to RGB
-    img = pil_img.resize(target_size).convert("RGB")
+    predicted_labels, confidences, all_probs = predict_leaf_disease_batch(
+        [pil_img], batch_size=1, target_size=target_size
+    )
+    return str(predicted_labels[0]), float(confidences[0]), all_probs[0]
+
+
+# — Test-Time Augmentation —
+# Deterministic views of the model-size image: flips, ±10° rotations and a
+# centre crop. All views of an image go through one batched forward pass and
+# their probabilities are averaged.
+TTA_VIEWS = ("identity", "hflip", "vflip", "rot+10", "rot-10", "crop")
+
+# Confidence below which gated TTA kicks in; the low-confidence branch of
+# generate_disease_report starts here too
+TTA_THRESHOLD = 0.7
+
+
+def tta_views(
+    img: ImageInput,
+    target_size: Tuple[int, int] = (224, 224),
+    views: Sequence[str] = TTA_VIEWS
+) -> np.ndarray:
+    """
+    Builds the named views of an image at the model input size.
+
+    Args:
+        img: A PIL.Image.Image, or a uint8 RGB array already resized to target_size.
+        target_size: Tuple (width, height) of the model input.
+        views: Names from TTA_VIEWS; "rot<angle>" takes any angle in degrees.
+
+    Returns:
+        Numpy uint8 array (len(views), height, width, 3).
+    """
+    import cv2  # only needed here; keeps `import utils.predict` light
+
+    base = _resized_rgb(img, target_size)
+    height, width = base.shape[:2]
+    out = np.empty((len(views),) + base.shape, dtype=np.uint8)
+    for i, view in enumerate(views):
+        if view == "identity":
+            out[i] = base
+        elif view == "hflip":
+            out[i] = base[:, ::-1]
+        elif view == "vflip":
+            out[i] = base[::-1]
+        elif view.startswith("rot"):
+            rotation = cv2.getRotationMatrix2D((width / 2, height / 2), float(view[3:]), 1.0)
+            out[i] = cv2.warpAffine(base, rotation, (width, height), borderMode=cv2.BORDER_REFLECT_101)
+        elif view == "crop":
+            # Central 87.5%, scaled back up
+            dy, dx = height // 16, width // 16
+            out[i] = cv2.resize(base[dy:height - dy, dx:width - dx], (width, height),
+                                interpolation=cv2.INTER_LINEAR)
+        else:
+            raise ValueError(f"Unknown TTA view '{view}', expected one of {TTA_VIEWS}")
+    return out
+
+
+@metrics.timed("predict_tta")
+def predict_leaf_disease_tta(
+    pil_img: ImageInput,
+    target_size: Tuple[int, int] = (224, 224),
+    views: Sequence[str] = TTA_VIEWS,
+    threshold: Optional[float] = None
+) -> Tuple[str, float, np.ndarray]:
+    """
+    predict_leaf_disease with test-time augmentation: the probabilities of
+    all views, computed in a single batched forward pass, are averaged.
+
+    With a threshold, the plain image is scored first and the other views are
+    only run when its confidence is below the threshold (e.g. TTA_THRESHOLD).
+
+    Args:
+        pil_img: A PIL.Image.Image object, or a uint8 RGB array already resized to target_size.
+        target_size: Tuple (width, height) to resize the image for the model.
+        views: Views to average, see tta_views.
+        threshold: Base confidence at or above which TTA is skipped; None always runs it.
+
+    Returns:
+        predicted_label: The class name with highest averaged probability.
+        confidence: Averaged probability (0–1) of the predicted_label.
+        all_probs: Numpy array of averaged probabilities for all classes.
+    """
+    if not views:
+        raise ValueError("predict_leaf_disease_tta() needs at least one view.")
+    target_size = tuple(target_size)
+    base = _resized_rgb(pil_img, target_size)
+    metrics.observe_image_sizes([_image_size(pil_img)])
+
+    version = current_version()
+    probs = None
+    if threshold is not None:
+        base_probs = _forward_probs([base], 1, target_size, version)[0]
+        extra = [v for v in views if v != "identity"]
+        if base_probs.max() >= threshold or not extra:
+            probs = base_probs
+        else:
+            stack = _forward_probs(list(tta_views(base, target_size, extra)), len(extra), target_size, version)
+            if len(extra) < len(views):
+                stack = np.vstack([base_probs[np.newaxis], stack])
+            probs = stack.mean(axis=0)
+    if probs is None:
+        views_probs = _forward_probs(list(tta_views(base, target_size, views)), len(views), target_size, version)
+        probs = views_probs.mean(axis=0)
+
+    predicted_labels, confidences = top_predictions(probs, version.labels())
+    metrics.observe_predictions(predicted_labels, confidences)
+    return str(predicted_labels[0]), float(confidences[0]), probs
+
+
+# — Tiled Inference —
+# Large canopy photos are not squashed to one model input: overlapping
+# target_size windows are slid over the decoded image, scored in fixed-shape
+# batches, and their probabilities averaged into a coarse per-class heatmap
+# (see utils/heatmap.py for hot regions and the overlay).
+
+# Step between windows; half a tile gives every interior cell four votes
+TILE_STRIDE = 112
+
+
+class TiledPrediction(NamedTuple):
+    offsets: np.ndarray     # (N, 2) int, (x, y) of each window's top-left corner
+    probs: np.ndarray       # (N, num_classes) probabilities of each window
+    heatmap: np.ndarray     # (rows, cols, num_classes) mean probabilities per cell
+    cell: int               # cell side in image pixels (= stride)
+    labels: List[str]       # class names, in probability order
+    image_size: Tuple[int, int]  # (width, height) of the tiled image
+
+
+def tile_offsets(length: int, tile: int, stride: int) -> List[int]:
+    """Window starts along one axis: every stride, plus one flush with the far edge."""
+    if length <= tile:
+        return [0]
+    offsets = list(range(0, length - tile + 1, stride))
+    if offsets[-1] != length - tile:
+        offsets.append(length - tile)
+    return offsets
+
+
+@metrics.timed("predict_tiled")
+def predict_leaf_disease_tiled(
+    rgb: np.ndarray,
+    stride: int = TILE_STRIDE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    target_size: Tuple[int, int] = (224, 224),
+    version: Union[None, str, ModelVersion] = None
+) -> TiledPrediction:
+    """
+    Scores every overlapping target_size window of a large image.
+
+    The windows are slices of the one decoded buffer, not copies; only the
+    float32 batch the model reads from is filled per forward pass, so memory
+    beyond the image itself is one batch plus N×num_classes probabilities.
+    Images smaller than a window are padded by reflection.
+
+    Args:
+        rgb: uint8 RGB array (H, W, 3) at the resolution to tile, e.g. from
+            utils.image_io.load_large_image.
+        stride: Step between windows in pixels; smaller means more overlap.
+        batch_size: Maximum number of windows per forward pass.
+        target_size: Tuple (width, height) of the model input and of each window.
+        version: Model version (name or ModelVersion) instead of the active one.
+
+    Returns:
+        TiledPrediction with per-window probabilities and the per-cell heatmap.
+    """
+    if rgb.ndim != 3 or rgb.shape[2] != 3:
+        raise ValueError(f"Expected an H×W×3 RGB array, got shape {rgb.shape}")
+    if stride < 1:
+        raise ValueError(f"stride must be positive, got {stride}")
+    width, height = target_size = tuple(target_size)
+    if rgb.shape[0] < height or rgb.shape[1] < width:
+        import cv2  # only needed here; keeps `import utils.predict` light
+
+        pad_y, pad_x = max(0, height - rgb.shape[0]), max(0, width - rgb.shape[1])
+        rgb = cv2.copyMakeBorder(rgb, 0, pad_y, 0, pad_x, cv2.BORDER_REFLECT_101)
+
+    model_version = _resolve(version)
+    img_h, img_w = rgb.shape[:2]
+    offsets = np.array(
+        [(x, y) for y in tile_offsets(img_h, height, stride) for x in tile_offsets(img_w, width, stride)],
+        dtype=np.int32
+    )
+    windows = [rgb[y:y + height, x:x + width] for x, y in offsets.tolist()]
+    metrics.observe_image_sizes([(img_w, img_h)])
+    probs = _forward_probs(windows, batch_size, target_size, model_version)
+
+    # Average the windows covering each stride-sized cell
+    cell = stride
+    rows, cols = -(-img_h // cell), -(-img_w // cell)
+    sums = np.zeros((rows, cols, probs.shape[1]), dtype=np.float32)
+    counts = np.zeros((rows, cols, 1), dtype=np.float32)
+    for (x, y), p in zip(offsets.tolist(), probs):
+        r0, r1 = y // cell, -(-(y + height) // cell)
+        c0, c1 = x // cell, -(-(x + width) // cell)
+        sums[r0:r1, c0:c1] += p
+        counts[r0:r1, c0:c1] += 1
+    heatmap = sums / np.maximum(counts, 1)
+    return TiledPrediction(offsets, probs, heatmap, cell, model_version.labels(), (img_w, img_h))
+
+
+# — Similar Cases —
+# Penultimate-layer embeddings (the 256-unit Dense before the classifier) of
+# the Keras model, matched against the training-set index built by
+# build_index.py (see utils/similar.py).
+def _embedding_layers(net: "tf.keras.Model") -> list:
+    """The model's layers up to and including the last Dense before the output layer."""
+    import tensorflow as tf
+
+    dense = [i for i, layer in enumerate(net.layers) if isinstance(layer, tf.keras.layers.Dense)]
+    if len(dense) < 2:
+        raise ValueError("Model has no hidden Dense layer to take embeddings from.")
+    return net.layers[:dense[-2] + 1]
+
+
+def _compiled_embed(
+    net: "tf.keras.Model",
+    batch_size: int,
+    target_size: Tuple[int, int]
+) -> Callable[[np.ndarray], np.ndarray]:
+    """Like _compiled_forward, but stops at the embedding layer."""
+    import tensorflow as tf
+
+    embed_layers = _embedding_layers(net)
+    width, height = target_size
+    spec = tf.TensorSpec((batch_size, height, width, 3), tf.float32)
+
+    @tf.function(input_signature=[spec])
+    def forward(batch):
+        x = batch
+        for layer in embed_layers:
+            x = layer(x, training=False)
+        return x
+
+    return lambda batch: forward(tf.constant(batch)).numpy()
+
+
+@metrics.timed("embed_images")
+def embed_images(
+    images: Sequence[ImageInput],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    target_size: Tuple[int, int] = (224, 224)
+) -> np.ndarray:
+    """
+    Penultimate-layer embeddings of many images, always computed with the
+    Keras model whatever the selected backend.
+
+    Args:
+        images: Sequence of PIL.Image.Image objects, or of uint8 RGB arrays already resized to target_size.
+        batch_size: Maximum number of images per forward pass.
+        target_size: Tuple (width, height) to resize each image for the model.
+
+    Returns:
+        Numpy float32 array (N, embedding_dim), not normalized.
+    """
+    images = list(images)
+    if not images:
+        raise ValueError("embed_images() needs at least one image.")
+    return _run_batched(images, batch_size, tuple(target_size), current_version().embed)
+
+
+@metrics.timed("find_similar_cases")
+def find_similar_cases(
+    pil_img: ImageInput,
+    k: int = 5,
+    target_size: Tuple[int, int] = (224, 224),
+    index_path: Optional[str] = None
+) -> List[dict]:
+    """
+    The k training images whose embeddings are closest (by cosine similarity)
+    to this image's.
+
+    Args:
+        pil_img: A PIL.Image.Image object, or a uint8 RGB array already resized to target_size.
+        k: Number of neighbors.
+        target_size: Tuple (width, height) to resize the image for the model.
+        index_path: Index built by build_index.py (default: utils.similar.SIMILAR_INDEX_PATH).
+
+    Returns:
+        List of {"path", "label", "similarity"} dicts, most similar first.
+    """
+    from utils.similar import SIMILAR_INDEX_PATH, open_index
+    from utils.prediction_cache import model_fingerprint
+
+    index = open_index(index_path or SIMILAR_INDEX_PATH)
+    if index.model_fingerprint != model_fingerprint("keras", cascade=False):
+        raise RuntimeError("Similar-case index was built from a different model; rerun build_index.py")
+    return index.neighbors(embed_images([pil_img], batch_size=1, target_size=target_size)[0], k)
+
+
+def warm_up(
+    background: bool = True,
+    target_size: Tuple[int, int] = (224, 224)
+) -> Optional[threading.Thread]:
+    """
+    Loads the model and runs one dummy single-image inference so the first real
+    request does not pay for graph tracing.
+
+    Args:
+        background: Run in a daemon thread and return it instead of blocking.
+        target_size: Tuple (width, height) the dummy input is built at.
+
+    Returns:
+        The started thread when background is True, otherwise None.
+    """
+    def _run():
+        current_version().warm_up(target_size)
+
+    if not background:
+        _run()
+        return None
+    thread = threading.Thread(target=_run, name="leafmedic-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_timings() -> Dict[str, float]:
+    """
+    Returns the startup costs measured so far, in seconds:
+      import_s:          importing this module
+      load_s:            importing TensorFlow and loading the model
+      first_inference_s: first forward pass, including graph tracing
+    """
+    return dict(_timings)
+
 
-    # Convert to array, normalize, and expand dims
-    arr = kimage.img_to_array(img) / 255.0
-    arr = np.expand_dims(arr, axis=0)
+_timings["import_s"] = time.perf_counter() - _IMPORT_START
 
-    # Predict
-    preds = model.predict(arr)[0]
-    top_idx = int(np.argmax(preds))
 
-    return labels[top_idx], float(preds[top_idx]), preds
+if __name__ == "__main__":
+    warm_up(background=False)
+    for stage, seconds in startup_timings().items():
+        print(f"{stage:<18} {seconds * 1000:9.1f} ms")
@@ -0,0 +1,244 @@
+# utils/prediction_cache.py
+#
+# Persistent prediction cache, keyed by the SHA-256 of the encoded image plus
+# a fingerprint of the model that scored it. Probability vectors are stored
+# as raw float32 in a SQLite database in WAL mode, so any number of
+# processes (app, serve.py, diagnose.py) can share one cache file. Entries
+# from an older model never match the current fingerprint; they are simply
+# the least recently used rows and get evicted first. Spot statistics
+# (utils/spots.py) depend only on the pixels, not the model, and are kept in
+# a second table keyed by digest and SPOTS_VERSION, so diagnose.py can skip
+# decoding an image whose prediction and spots are both cached.
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from utils.predict import INPUT_NORMALIZATION, current_version, get_backend, get_cascade
+
+DEFAULT_PATH = os.environ.get("LEAFMEDIC_PREDICTION_CACHE", os.path.join("model", "prediction_cache.sqlite"))
+DEFAULT_MAX_ENTRIES = 200_000
+
+# A hit refreshes its LRU timestamp at most this often, so hits are reads
+LRU_RESOLUTION_S = 60.0
+# Puts between two size checks, per process
+EVICT_CHECK_EVERY = 256
+
+# Every tool decodes uploads with utils.image_io.load_image before scoring;
+# part of the fingerprint so entries from an older decode path never match
+DECODE_PATH = "image_io.load_image"
+
+# Key of cached spot statistics; change it whenever utils/spots.py or the
+# decode path changes what analyze_spots returns
+SPOTS_VERSION = f"{DECODE_PATH}:spots-leaf-hsv-1"
+
+_fingerprints: Dict[Tuple, str] = {}
+
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 hex digest of encoded image bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def model_fingerprint(backend: Optional[str] = None, cascade: Optional[bool] = None) -> str:
+    """
+    Hash of the files that determine a prediction: the active version's Keras
+    model (or TFLite model for a TFLite backend) and class_indices.json, plus
+    the backend name, input normalization and decode path, and with cascading
+    on the fast model and its calibration. Recomputed only when one of the files changes
+    on disk, so swapping model versions switches to that version's entries.
+    """
+    backend = backend or get_backend()
+    version = current_version()
+    paths = (version.tflite_paths.get(backend, version.model_path), version.class_idx_path)
+    if (get_cascade() if cascade is None else cascade) and version.has_fast_model():
+        backend += "+cascade"
+        paths += tuple(p for p in (version.fast_model_path, version.fast_config_path) if os.path.exists(p))
+    key = (backend,) + tuple((p, st.st_mtime_ns, st.st_size) for p, st in zip(paths, map(os.stat, paths)))
+    if key not in _fingerprints:
+        h = hashlib.sha256(f"{backend}:{INPUT_NORMALIZATION}:{DECODE_PATH}".encode("utf-8"))
+        for path in paths:
+            h.update(_file_sha256(path).encode("ascii"))
+        _fingerprints[key] = h.hexdigest()[:32]
+    return _fingerprints[key]
+
+
+class PredictionCache:
+    """
+    Size-bounded LRU cache of probability vectors on disk.
+
+    Args:
+      path:        SQLite database file (created if missing)
+      max_entries: Rows kept after eviction; each row is ~150 bytes plus 4 per class
+      fingerprint: Model fingerprint to key on (default: model_fingerprint(), checked on every call)
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 fingerprint: Optional[str] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self._fingerprint = fingerprint
+        self._local = threading.local()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " digest TEXT NOT NULL, fingerprint TEXT NOT NULL, probs BLOB NOT NULL,"
+                " last_used REAL NOT NULL, PRIMARY KEY (digest, fingerprint)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS predictions_lru ON predictions (last_used)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS spot_stats ("
+                " digest TEXT NOT NULL, version TEXT NOT NULL, spot_count INTEGER NOT NULL,"
+                " affected_ratio REAL NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (digest, version)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS spot_stats_lru ON spot_stats (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and process; sqlite3 objects cannot be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @property
+    def fingerprint(self) -> str:
+        return self._fingerprint or model_fingerprint()
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        """Cached probabilities for an image digest, or None."""
+        return self.get_many([digest]).get(digest)
+
+    def get_many(self, digests: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Cached probabilities for every digest that has an entry."""
+        digests = list(dict.fromkeys(digests))
+        if not digests:
+            return {}
+        fingerprint = self.fingerprint
+        conn = self._connect()
+        found, stale = {}, []
+        now = time.time()
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            rows = conn.execute(
+                f"SELECT digest, probs, last_used FROM predictions WHERE fingerprint = ? "
+                f"AND digest IN ({','.join('?' * len(chunk))})",
+                [fingerprint] + chunk,
+            ).fetchall()
+            for digest, blob, last_used in rows:
+                found[digest] = np.frombuffer(blob, dtype=np.float32)
+                if now - last_used > LRU_RESOLUTION_S:
+                    stale.append(digest)
+        if stale:
+            conn.executemany(
+                "UPDATE predictions SET last_used = ? WHERE digest = ? AND fingerprint = ?",
+                [(now, d, fingerprint) for d in stale],
+            )
+        self.hits += len(found)
+        self.misses += len(digests) - len(found)
+        return found
+
+    def put(self, digest: str, probs: np.ndarray) -> None:
+        self.put_many([(digest, probs)])
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> None:
+        """Stores probability vectors for image digests in one transaction."""
+        fingerprint, now = self.fingerprint, time.time()
+        rows = [(d, fingerprint, np.asarray(p, dtype=np.float32).tobytes(), now) for d, p in items]
+        if not rows:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._puts += len(rows)
+        if self._puts >= EVICT_CHECK_EVERY:
+            self._puts = 0
+            self.evict()
+
+    def get_spots_many(self, digests: Iterable[str]) -> Dict[str, Tuple[int, float]]:
+        """Cached (spot_count, affected_ratio) for every digest that has an entry."""
+        digests = list(dict.fromkeys(digests))
+        conn = self._connect()
+        found = {}
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            rows = conn.execute(
+                f"SELECT digest, spot_count, affected_ratio FROM spot_stats WHERE version = ? "
+                f"AND digest IN ({','.join('?' * len(chunk))})",
+                [SPOTS_VERSION] + chunk,
+            ).fetchall()
+            found.update((digest, (count, ratio)) for digest, count, ratio in rows)
+        return found
+
+    def put_spots_many(self, items: Iterable[Tuple[str, int, float]]) -> None:
+        """Stores (digest, spot_count, affected_ratio) rows in one transaction."""
+        now = time.time()
+        rows = [(d, SPOTS_VERSION, int(c), float(r), now) for d, c, r in items]
+        if not rows:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO spot_stats VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def evict(self) -> int:
+        """Deletes least recently used rows beyond max_entries (per table); returns how many."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = 0
+            for table, key in (("predictions", "digest, fingerprint"), ("spot_stats", "digest, version")):
+                excess = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute(
+                        f"DELETE FROM {table} WHERE ({key}) IN "
+                        f"(SELECT {key} FROM {table} ORDER BY last_used LIMIT ?)",
+                        (excess,),
+                    )
+                    evicted += excess
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def clear(self) -> None:
+        conn = self._connect()
+        conn.execute("DELETE FROM predictions")
+        conn.execute("DELETE FROM spot_stats")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counts of this instance and the current number of rows."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
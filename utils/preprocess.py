@@ -1,9 +1,17 @@
 # utils/preprocess.py
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Tuple, Union
+
 import cv2
 import numpy as np
 from PIL import Image
 
+from utils import metrics
+
+@metrics.timed("preprocess_image")
 def preprocess_image(pil_img: Image.Image, target_size: tuple = (224, 224)) -> np.ndarray:
     """
     Applies classical image preprocessing to a PIL image:
@@ -41,3 +49,95 @@ def preprocess_image(pil_img: Image.Image, target_size: tuple = (224, 224)) -> n
     sharp_rgb = cv2.cvtColor(sharp, cv2.COLOR_GRAY2RGB)
     
     return sharp_rgb
+
+
+# — Batched preprocessing —
+# Same result as preprocess_image, pixel for pixel, for many images at once.
+# The RGB→BGR round-trip is dropped (RGB→gray equals RGB→BGR→gray), every
+# step writes into per-thread scratch buffers or straight into the output
+# array, and images are spread over a thread pool since OpenCV releases the GIL.
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_scratch = threading.local()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="leafmedic-preprocess")
+        return _pool
+
+
+def _scratch_buffers(height: int, width: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    bufs = getattr(_scratch, "bufs", None)
+    if bufs is None or bufs[0].shape != (height, width):
+        bufs = tuple(np.empty((height, width), dtype=np.uint8) for _ in range(3))
+        _scratch.bufs = bufs
+    return bufs
+
+
+def _enhance_into(rgb: np.ndarray, out: np.ndarray) -> None:
+    """Grayscale, equalize, blur, unsharp-mask and expand back to 3 channels, in place into out."""
+    gray, eq, blur = _scratch_buffers(*rgb.shape[:2])
+    cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY, dst=gray)
+    cv2.equalizeHist(gray, dst=eq)
+    cv2.GaussianBlur(eq, (5, 5), 0, dst=blur)
+    # Reuse gray for the sharpened result
+    cv2.addWeighted(eq, 1.5, blur, -0.5, 0, dst=gray)
+    cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB, dst=out)
+
+
+def _to_rgb_array(img: Union[Image.Image, np.ndarray], target_size: Tuple[int, int]) -> np.ndarray:
+    width, height = target_size
+    if isinstance(img, np.ndarray):
+        # Only RGB uint8 at the target size can skip PIL; grayscale or RGBA are converted below
+        if img.ndim == 3 and img.shape == (height, width, 3) and img.dtype == np.uint8:
+            return img
+        img = Image.fromarray(img)
+    # Same convert/resize order as preprocess_image
+    return np.asarray(img.convert("RGB").resize(target_size))
+
+
+@metrics.timed("preprocess_images")
+def preprocess_images(
+    images: Union[Sequence[Image.Image], np.ndarray],
+    target_size: tuple = (224, 224),
+    out: Optional[np.ndarray] = None,
+    workers: Optional[int] = None
+) -> np.ndarray:
+    """
+    Batched preprocess_image: applies the same enhancement to many images.
+
+    Args:
+      images:      List of PIL Images, or an N×H×W×3 uint8 RGB array
+      target_size: (width, height) to resize
+      out:         Optional preallocated N×height×width×3 uint8 output array to fill
+      workers:     Threads to use (default: one per CPU; 1 runs inline)
+
+    Returns:
+      N×height×width×3 uint8 RGB array, identical to stacking preprocess_image results
+    """
+    n = len(images)
+    width, height = target_size
+    if out is None:
+        out = np.empty((n, height, width, 3), dtype=np.uint8)
+    elif out.shape != (n, height, width, 3) or out.dtype != np.uint8:
+        raise ValueError(f"out must be a uint8 array of shape {(n, height, width, 3)}, got {out.dtype} {out.shape}")
+
+    def _one(i: int) -> None:
+        _enhance_into(_to_rgb_array(images[i], target_size), out[i])
+
+    if workers == 1 or n <= 1:
+        for i in range(n):
+            _one(i)
+    else:
+        pool = _get_pool() if workers is None else ThreadPoolExecutor(max_workers=workers)
+        try:
+            # list() re-raises the first worker exception, if any
+            list(pool.map(_one, range(n)))
+        finally:
+            if workers is not None:
+                pool.shutdown()
+    return out
@@ -0,0 +1,149 @@
+# utils/registry.py
+#
+# Versioned model registry on disk. Each version is a directory under
+# model/registry/<name> holding disease_model.keras, class_indices.json,
+# metadata.json and optionally its TFLite exports and fast cascade model.
+# model/registry/ACTIVE names the version processes should serve; it is
+# replaced atomically, and running processes that call
+# utils.predict.watch_registry() pick the change up, warm the new version in
+# the background and swap it in.
+#
+# The plain model/ directory written by train_model.py is the version
+# "default", so a tree without a registry behaves exactly as before.
+# Managed with manage_models.py.
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+from typing import List, Optional
+
+LEGACY_DIR = "model"
+REGISTRY_DIR = os.environ.get("LEAFMEDIC_REGISTRY", os.path.join(LEGACY_DIR, "registry"))
+ACTIVE_FILE = "ACTIVE"
+DEFAULT_VERSION = "default"
+
+MODEL_FILE = "disease_model.keras"
+CLASS_IDX_FILE = "class_indices.json"
+METADATA_FILE = "metadata.json"
+# Optional low-resolution companion model for cascade inference (train_model.py --fast)
+FAST_MODEL_FILE = "fast_model.keras"
+FAST_CONFIG_FILE = "fast_model.json"
+TFLITE_FILES = {
+    "tflite-dynamic": "disease_model_dynamic.tflite",
+    "tflite-int8": "disease_model_int8.tflite",
+}
+# What each TFLite export was built with (export_tflite.py), keyed by backend
+TFLITE_META_FILE = "tflite_exports.json"
+
+_VERSION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+def version_dir(name: str) -> str:
+    """Directory of a version; "default" is the legacy model/ directory."""
+    if name == DEFAULT_VERSION:
+        return LEGACY_DIR
+    if not _VERSION_NAME.match(name):
+        raise ValueError(f"Invalid model version name: '{name}'")
+    return os.path.join(REGISTRY_DIR, name)
+
+
+def version_exists(name: str) -> bool:
+    return os.path.exists(os.path.join(version_dir(name), MODEL_FILE))
+
+
+def list_versions() -> List[str]:
+    """Registered versions, oldest first, plus "default" if model/ has a model."""
+    versions = []
+    if os.path.isdir(REGISTRY_DIR):
+        names = [n for n in os.listdir(REGISTRY_DIR) if _VERSION_NAME.match(n) and version_exists(n)]
+        versions = sorted(names, key=lambda n: read_metadata(n).get("created", 0))
+    if version_exists(DEFAULT_VERSION):
+        versions.insert(0, DEFAULT_VERSION)
+    return versions
+
+
+def read_metadata(name: str) -> dict:
+    path = os.path.join(version_dir(name), METADATA_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def active_version() -> str:
+    """The version named by the ACTIVE pointer, or "default" if there is none."""
+    path = os.path.join(REGISTRY_DIR, ACTIVE_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return DEFAULT_VERSION
+    return name or DEFAULT_VERSION
+
+
+def set_active(name: str) -> None:
+    """Points ACTIVE at a version. The pointer file is replaced atomically."""
+    if not version_exists(name):
+        raise FileNotFoundError(f"Model version '{name}' not found at: {version_dir(name)}")
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    path = os.path.join(REGISTRY_DIR, ACTIVE_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+    os.replace(tmp, path)
+
+
+def register(name: str, source_dir: str = LEGACY_DIR, metadata: Optional[dict] = None) -> str:
+    """
+    Copies a model, its class indices and any TFLite exports or fast cascade
+    model from source_dir into a new registry version. The version directory
+    appears complete or not at all.
+
+    Args:
+      name:       New version name (letters, digits, ".", "_", "-")
+      source_dir: Directory holding disease_model.keras and class_indices.json
+      metadata:   Extra fields for metadata.json (e.g. a note or metrics)
+
+    Returns:
+      The new version's directory
+    """
+    if name == DEFAULT_VERSION:
+        raise ValueError(f"'{DEFAULT_VERSION}' is reserved for the legacy model/ directory")
+    target = version_dir(name)
+    if os.path.exists(target):
+        raise FileExistsError(f"Model version '{name}' already exists at: {target}")
+    for fname in (MODEL_FILE, CLASS_IDX_FILE):
+        if not os.path.exists(os.path.join(source_dir, fname)):
+            raise FileNotFoundError(f"{fname} not found in: {source_dir}")
+
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    tmp = os.path.join(REGISTRY_DIR, f".{name}.{os.getpid()}.tmp")
+    os.makedirs(tmp)
+    try:
+        copied = []
+        for fname in (MODEL_FILE, CLASS_IDX_FILE, *TFLITE_FILES.values(), TFLITE_META_FILE, FAST_MODEL_FILE, FAST_CONFIG_FILE):
+            src = os.path.join(source_dir, fname)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(tmp, fname))
+                copied.append(fname)
+        h = hashlib.sha256()
+        with open(os.path.join(tmp, MODEL_FILE), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        with open(os.path.join(tmp, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": name,
+                "created": time.time(),
+                "source": os.path.abspath(source_dir),
+                "model_sha256": h.hexdigest(),
+                "files": copied,
+                **(metadata or {}),
+            }, f, indent=2)
+        os.rename(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
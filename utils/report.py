@@ -1,5 +1,7 @@
 # utils/report.py
 
+from utils import metrics
+
 # Dictionary mapping class folder names to human-readable descriptions and treatments
 disease_info = {
     "Apple___Black_rot": {
@@ -252,6 +254,7 @@ disease_info = {
     }
 }
 
+@metrics.timed("report")
 def generate_disease_report(label: str, confidence: float) -> str:
     """
     Build a detailed, human-readable report based on predicted class and confidence.
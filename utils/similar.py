@@ -0,0 +1,146 @@
+# utils/similar.py
+#
+# Similar-case index: L2-normalized penultimate-layer embeddings of the
+# training images, stored as a float16 .npy matrix with a JSON sidecar of
+# paths and labels. The matrix is memory-mapped and scanned in chunks, so a
+# search never holds more than one chunk of it in RAM; cosine similarity is
+# then a plain dot product.
+#
+# Built by build_index.py; queried through utils.predict.find_similar_cases.
+
+import os
+import json
+import functools
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SIMILAR_INDEX_PATH = os.path.join("model", "similar_index")   # + .npy / .json
+
+# Rows scored per step of a search
+SEARCH_CHUNK_ROWS = 8192
+
+
+def _paths(base: str) -> Tuple[str, str]:
+    return base + ".npy", base + ".json"
+
+
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def write_index(
+    base: str,
+    batches: Iterable[np.ndarray],
+    count: int,
+    dim: int,
+    paths: Sequence[str],
+    labels: Sequence[str],
+    model_fingerprint: Optional[str] = None
+) -> None:
+    """
+    Streams embedding batches into a new index. The matrix and sidecar are
+    written under temporary names and renamed at the end, so readers never
+    see a half-written index.
+
+    Args:
+      base:              Index path without extension
+      batches:           Float embedding batches (B, dim), `count` rows in total, in `paths` order
+      count, dim:        Shape of the final matrix
+      paths, labels:     Source image and class name of each row
+      model_fingerprint: Fingerprint of the model the embeddings come from
+    """
+    matrix_path, meta_path = _paths(base)
+    tmp_matrix, tmp_meta = matrix_path + ".tmp.npy", meta_path + ".tmp"
+    matrix = np.lib.format.open_memmap(tmp_matrix, mode="w+", dtype=np.float16, shape=(count, dim))
+    row = 0
+    for batch in batches:
+        matrix[row:row + len(batch)] = l2_normalize(np.asarray(batch, dtype=np.float32))
+        row += len(batch)
+    if row != count:
+        raise ValueError(f"Expected {count} embeddings, got {row}")
+    matrix.flush()
+    del matrix
+
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump({
+            "model_fingerprint": model_fingerprint,
+            "dim": dim,
+            "paths": list(paths),
+            "labels": list(labels),
+        }, f)
+    os.replace(tmp_matrix, matrix_path)
+    os.replace(tmp_meta, meta_path)
+
+
+class SimilarIndex:
+    """Read-only, memory-mapped embedding index with top-k cosine search."""
+
+    def __init__(self, base: str = SIMILAR_INDEX_PATH):
+        matrix_path, meta_path = _paths(base)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.matrix = np.load(matrix_path, mmap_mode="r")
+        self.paths: List[str] = meta["paths"]
+        self.labels: List[str] = meta["labels"]
+        self.model_fingerprint: Optional[str] = meta.get("model_fingerprint")
+        if self.matrix.shape != (len(self.paths), meta["dim"]):
+            raise ValueError(f"Index {matrix_path} has shape {self.matrix.shape}, "
+                             f"sidecar describes {(len(self.paths), meta['dim'])}")
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def search(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k cosine search.
+
+        Args:
+          queries: Embeddings (D,) or (Q, D); normalized here
+          k:       Neighbors per query
+
+        Returns:
+          indices (Q, k) and similarities (Q, k), best first
+        """
+        q = l2_normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        k = min(k, len(self))
+        best_idx = np.empty((len(q), 0), dtype=np.int64)
+        best_sim = np.empty((len(q), 0), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_CHUNK_ROWS):
+            chunk = np.asarray(self.matrix[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            sims = q @ chunk.T
+            # Keep the running top-k: merge this chunk's top-k with the best so far
+            top = np.argpartition(-sims, min(k, sims.shape[1]) - 1, axis=1)[:, :k]
+            best_idx = np.concatenate([best_idx, top + start], axis=1)
+            best_sim = np.concatenate([best_sim, np.take_along_axis(sims, top, axis=1)], axis=1)
+            keep = np.argpartition(-best_sim, min(k, best_sim.shape[1]) - 1, axis=1)[:, :k]
+            best_idx = np.take_along_axis(best_idx, keep, axis=1)
+            best_sim = np.take_along_axis(best_sim, keep, axis=1)
+        order = np.argsort(-best_sim, axis=1)
+        return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_sim, order, axis=1)
+
+    def neighbors(self, query: np.ndarray, k: int = 5) -> List[dict]:
+        """The k most similar indexed images to one embedding, as {path, label, similarity} dicts."""
+        idx, sims = self.search(query, k)
+        return [
+            {"path": self.paths[i], "label": self.labels[i], "similarity": float(s)}
+            for i, s in zip(idx[0].tolist(), sims[0].tolist())
+        ]
+
+
+@functools.lru_cache(maxsize=4)
+def _open_cached(base: str, mtime_ns: int) -> SimilarIndex:
+    return SimilarIndex(base)
+
+
+def open_index(base: str = SIMILAR_INDEX_PATH) -> SimilarIndex:
+    """The index at base, reopened only when build_index.py has rewritten it."""
+    matrix_path, meta_path = _paths(base)
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        raise FileNotFoundError(f"Similar-case index not found at: {matrix_path} (run build_index.py)")
+    return _open_cached(base, os.stat(meta_path).st_mtime_ns)
+
+
+def index_exists(base: str = SIMILAR_INDEX_PATH) -> bool:
+    return all(os.path.exists(p) for p in _paths(base))
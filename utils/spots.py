@@ -0,0 +1,261 @@
+# utils/spots.py
+
+from typing import NamedTuple, Optional, Sequence, Union
+
+import cv2
+import numpy as np
+
+from utils import metrics
+
+# Leaf segmentation on the un-enhanced RGB image, in OpenCV HSV units
+# (hue 0–179, saturation 0–255): the background of a leaf photo is far less
+# saturated than the leaf, and healthy tissue is green to yellow-green
+LEAF_MIN_SATURATION = 40
+HEALTHY_HUE_RANGE = (30, 90)
+
+
+class SpotStats(NamedTuple):
+    """Spot statistics for one image. Boxes are (x, y, w, h) in pixels."""
+    count: int
+    boxes: np.ndarray           # (K, 4) int32
+    areas: np.ndarray           # (K,) int32, pixels per spot
+    centroids: np.ndarray       # (K, 2) float32, (x, y)
+    affected_ratio: float       # lesion pixels / leaf pixels (NaN without rgb)
+
+
+class SpotBatch(NamedTuple):
+    """Spot statistics for N images; per-spot arrays are concatenated and tagged with image_index."""
+    counts: np.ndarray          # (N,) int32
+    affected_ratio: np.ndarray  # (N,) float32, lesion pixels / leaf pixels
+    image_index: np.ndarray     # (K_total,) int32
+    boxes: np.ndarray           # (K_total, 4) int32
+    areas: np.ndarray           # (K_total,) int32
+    centroids: np.ndarray       # (K_total, 2) float32
+
+
+def _fill_holes(mask: np.ndarray) -> np.ndarray:
+    """Sets every background pixel not 4-connected to the image border to 255."""
+    padded = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    cv2.floodFill(padded, None, (0, 0), 255)
+    holes = padded[1:-1, 1:-1] == 0
+    return np.where(holes, np.uint8(255), mask)
+
+
+# — Mosaic —
+# N images of one size are processed as a single (N·(H+1))×W mosaic: each is
+# followed by a one-pixel separator row of background. Nothing 8-connected
+# can cross a full background row, and every image border touches either the
+# separator or the mosaic border, so flood fills and labelling over the
+# mosaic give exactly the per-image results in one OpenCV call each
+# (morphology too, once the separators are reset; see _affected_ratios).
+def _mosaic(stack: np.ndarray) -> np.ndarray:
+    n, h = stack.shape[:2]
+    mosaic = np.zeros((n, h + 1) + stack.shape[2:], dtype=stack.dtype)
+    mosaic[:, :h] = stack
+    return mosaic.reshape((n * (h + 1),) + stack.shape[2:])
+
+
+def _tiles(mosaic: np.ndarray, n: int) -> np.ndarray:
+    """(N, H, W, ...) view of the images in a mosaic, without the separator rows."""
+    return mosaic.reshape((n, -1) + mosaic.shape[1:])[:, :-1]
+
+
+def _separators(mosaic: np.ndarray, n: int) -> np.ndarray:
+    return mosaic.reshape((n, -1) + mosaic.shape[1:])[:, -1]
+
+
+def _affected_ratios(rgb: np.ndarray) -> np.ndarray:
+    """affected_leaf_ratio of each image of an N×H×W×3 stack, over one mosaic."""
+    n = len(rgb)
+    hsv = cv2.cvtColor(_mosaic(rgb), cv2.COLOR_RGB2HSV)
+    hue, sat = hsv[..., 0], hsv[..., 1]
+    saturated = sat >= LEAF_MIN_SATURATION
+
+    # 3×3 opening done as erode + dilate, resetting the separators between
+    # them so each image sees OpenCV's default border on every side
+    kernel = np.ones((3, 3), np.uint8)
+    leaf = saturated.astype(np.uint8) * 255
+    _separators(leaf, n)[:] = 255
+    leaf = cv2.erode(leaf, kernel)
+    _separators(leaf, n)[:] = 0
+    leaf = cv2.dilate(leaf, kernel)
+    _separators(leaf, n)[:] = 0
+    leaf = _fill_holes(leaf) > 0
+
+    healthy = saturated & (hue >= HEALTHY_HUE_RANGE[0]) & (hue <= HEALTHY_HUE_RANGE[1])
+    leaf_pixels = _tiles(leaf, n).sum(axis=(1, 2))
+    lesion_pixels = _tiles(leaf & ~healthy, n).sum(axis=(1, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(leaf_pixels > 0, lesion_pixels / np.maximum(leaf_pixels, 1), 0.0)
+
+
+def affected_leaf_ratio(rgb: np.ndarray) -> float:
+    """
+    Fraction of the leaf covered by lesions:
+      1. Leaf mask: pixels with saturation ≥ LEAF_MIN_SATURATION, opened to
+         drop speckle, with holes filled so pale or dark lesions enclosed by
+         the leaf count as leaf
+      2. Lesion pixels: leaf pixels that are not healthy green (hue outside
+         HEALTHY_HUE_RANGE, or desaturated)
+
+    Args:
+      rgb: H×W×3 uint8 RGB image before enhancement (colour is needed)
+
+    Returns:
+      Lesion pixels / leaf pixels, or 0.0 if no leaf is found
+    """
+    return float(_affected_ratios(rgb[np.newaxis])[0])
+
+
+def _analyze_stack(gray: np.ndarray, min_area: int, rgb: Optional[np.ndarray]) -> SpotBatch:
+    """Spot statistics of an N×H×W grayscale stack, labelled as one mosaic."""
+    n, h = gray.shape[:2]
+    # Otsu picks a threshold per image; everything after it runs on the mosaic
+    thresh = np.empty_like(gray)
+    for i in range(n):
+        cv2.threshold(gray[i], 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=thresh[i])
+    mosaic = _mosaic(thresh)
+    filled = _fill_holes(mosaic)
+    num, labels, stats, centroids = cv2.connectedComponentsWithStats(filled, connectivity=8, ltype=cv2.CV_32S)
+
+    # Areas and centroids count only real spot pixels, not filled holes: the
+    # holes' pixels are subtracted from the components' integer pixel and
+    # coordinate sums. Label 0 is the background and is dropped with [1:]
+    holes = filled != mosaic
+    hole_labels = labels[holes]
+    ys, xs = np.nonzero(holes)
+    filled_areas = stats[:, cv2.CC_STAT_AREA]
+    areas = (filled_areas - np.bincount(hole_labels, minlength=num))[1:]
+    sum_x = np.rint(centroids[:, 0] * filled_areas) - np.bincount(hole_labels, weights=xs, minlength=num)
+    sum_y = np.rint(centroids[:, 1] * filled_areas) - np.bincount(hole_labels, weights=ys, minlength=num)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cx = sum_x[1:] / areas
+        cy = sum_y[1:] / areas
+
+    # Group spots by image; OpenCV's order within an image is kept
+    image_of = stats[1:, cv2.CC_STAT_TOP] // (h + 1)
+    order = np.argsort(image_of, kind="stable")
+    order = order[areas[order] >= max(min_area, 1)]
+    image_index = image_of[order].astype(np.int32)
+    offset = image_index * (h + 1)
+    boxes = stats[1:][order, :4].astype(np.int32)
+    boxes[:, 1] -= offset
+    return SpotBatch(
+        counts=np.bincount(image_index, minlength=n).astype(np.int32),
+        affected_ratio=_affected_ratios(rgb) if rgb is not None else np.full(n, np.nan),
+        image_index=image_index,
+        boxes=boxes,
+        areas=areas[order].astype(np.int32),
+        centroids=np.stack([cx[order], cy[order] - offset], axis=1).astype(np.float32),
+    )
+
+
+def _to_gray(enhanced: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(enhanced, cv2.COLOR_RGB2GRAY) if enhanced.ndim == 3 else enhanced
+
+
+@metrics.timed("analyze_spots")
+def analyze_spots(enhanced: np.ndarray, min_area: int = 1, rgb: Optional[np.ndarray] = None) -> SpotStats:
+    """
+    Detects spots in an enhanced image in one pass:
+      1. Convert to grayscale (if RGB)
+      2. Otsu thresholding
+      3. Fill holes, so each component is one outer contour
+      4. 8-connected component labelling with per-component stats
+      5. Drop spots with fewer than min_area foreground pixels
+
+    With min_area=1 the boxes are exactly the bounding rectangles of the
+    external contours used by the original overlay. The enhanced image is
+    grayscale, so the affected-area ratio is measured on `rgb` by
+    affected_leaf_ratio.
+
+    Args:
+      enhanced: H×W×3 RGB or H×W grayscale uint8 image (e.g. from preprocess_image)
+      min_area: Smallest spot, in foreground pixels, to keep
+      rgb:      The same image before enhancement, for affected_ratio
+
+    Returns:
+      SpotStats with count, boxes, areas, centroids and affected-leaf ratio
+      (NaN when rgb is not given)
+    """
+    batch = _analyze_stack(_to_gray(enhanced)[np.newaxis], min_area, None if rgb is None else rgb[np.newaxis])
+    return SpotStats(
+        count=int(batch.counts[0]),
+        boxes=batch.boxes,
+        areas=batch.areas,
+        centroids=batch.centroids,
+        affected_ratio=float(batch.affected_ratio[0]),
+    )
+
+
+@metrics.timed("analyze_spots_batch")
+def analyze_spots_batch(
+    images: Union[Sequence[np.ndarray], np.ndarray],
+    min_area: int = 1,
+    rgb: Optional[Union[Sequence[np.ndarray], np.ndarray]] = None
+) -> SpotBatch:
+    """
+    analyze_spots over N images (a list or an N×H×W×3 array) in one pass:
+    images of the same size are stacked into a single mosaic, so hole
+    filling, connected-component labelling and the leaf segmentation each
+    run once per batch rather than once per image. Only the Otsu threshold
+    is still chosen per image. Results equal analyze_spots on each image.
+
+    Args:
+      images:   Enhanced images, e.g. from preprocess_images
+      min_area: Smallest spot, in pixels, to keep
+      rgb:      The same N images before enhancement, for affected_ratio
+
+    Returns:
+      SpotBatch; the spots of image i are those where image_index == i
+    """
+    n = len(images)
+    gray = [_to_gray(img) for img in images]
+    # Usually one group; a list of mixed sizes is labelled one size at a time
+    groups: dict = {}
+    for i, g in enumerate(gray):
+        groups.setdefault(g.shape, []).append(i)
+
+    counts = np.zeros(n, dtype=np.int32)
+    ratios = np.full(n, np.nan, dtype=np.float32)
+    parts = []
+    for members in groups.values():
+        stack_rgb = None if rgb is None else np.stack([rgb[i] for i in members])
+        part = _analyze_stack(np.stack([gray[i] for i in members]), min_area, stack_rgb)
+        members = np.asarray(members, dtype=np.int32)
+        counts[members] = part.counts
+        ratios[members] = part.affected_ratio
+        parts.append(part._replace(image_index=members[part.image_index]))
+
+    # Spots of image 0 first, then image 1, ... as a per-image loop would give
+    image_index = np.concatenate([p.image_index for p in parts]) if parts else np.empty(0, np.int32)
+    order = np.argsort(image_index, kind="stable")
+    return SpotBatch(
+        counts=counts,
+        affected_ratio=ratios,
+        image_index=image_index[order],
+        boxes=np.concatenate([p.boxes for p in parts])[order] if parts else np.empty((0, 4), np.int32),
+        areas=np.concatenate([p.areas for p in parts])[order] if parts else np.empty(0, np.int32),
+        centroids=np.concatenate([p.centroids for p in parts])[order] if parts else np.empty((0, 2), np.float32),
+    )
+
+
+def draw_spot_overlay(
+    image: np.ndarray,
+    boxes: np.ndarray,
+    color: tuple = (255, 0, 0),
+    thickness: int = 2
+) -> np.ndarray:
+    """
+    Returns a copy of image with a rectangle around each spot box.
+
+    Args:
+      image:     H×W×3 RGB image to draw on (not modified)
+      boxes:     (K, 4) array of (x, y, w, h), e.g. SpotStats.boxes
+      color:     RGB rectangle color
+      thickness: Line thickness in pixels
+    """
+    overlay = image.copy()
+    for x, y, w, h in boxes.tolist():
+        cv2.rectangle(overlay, (x, y), (x + w, y + h), color, thickness)
+    return overlay
@@ -0,0 +1,232 @@
+# utils/video.py
+#
+# Walk-through video analysis. Frames are decoded lazily with OpenCV and
+# sampled at a fixed rate; a sampled frame that barely differs from the last
+# frame sent to the model (mean absolute difference of 32×32 grayscale
+# thumbnails) reuses that frame's prediction instead of being scored again.
+# The remaining frames are scored in batches through
+# utils.predict.predict_leaf_disease_batch. At most one batch of model-size
+# frames is held at a time, so memory does not grow with the video's length.
+#
+# Used by analyze_video.py and the app's video upload.
+
+import math
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from utils import metrics
+from utils.predict import DEFAULT_BATCH_SIZE, ModelVersion, current_version, predict_leaf_disease_batch
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".m4v", ".webm")
+
+# Frames per second of video passed on for analysis
+SAMPLE_FPS = 2.0
+# Mean absolute difference (0–1) of grayscale thumbnails below which a
+# sampled frame counts as a near-duplicate of the last scored frame
+DIFF_THRESHOLD = 0.03
+# Side of the grayscale thumbnail the difference check compares
+SIGNATURE_SIDE = 32
+# Frame rate assumed when the container does not report one
+FALLBACK_FPS = 30.0
+# Sampled frames waiting on a batch before it is scored early (long static stretches)
+MAX_PENDING_FRAMES = 1024
+
+
+class VideoFrame(NamedTuple):
+    index: int            # frame number in the video
+    time_s: float         # timestamp in seconds
+    rgb: np.ndarray       # target_size uint8 RGB, H×W×3
+
+
+class FramePrediction(NamedTuple):
+    index: int
+    time_s: float
+    label: str
+    confidence: float
+    duplicate: bool       # True if the prediction was reused from the last scored frame
+
+
+class VideoSummary:
+    """Running aggregate of a video's frame predictions; constant size."""
+
+    def __init__(self):
+        self.sampled = 0
+        self.scored = 0
+        self.duration_s = 0.0
+        self.counts: Dict[str, int] = {}
+        self.confidence_sums: Dict[str, float] = {}
+
+    def add(self, pred: FramePrediction) -> None:
+        self.sampled += 1
+        self.scored += not pred.duplicate
+        self.duration_s = max(self.duration_s, pred.time_s)
+        self.counts[pred.label] = self.counts.get(pred.label, 0) + 1
+        self.confidence_sums[pred.label] = self.confidence_sums.get(pred.label, 0.0) + pred.confidence
+
+    def prevalence(self) -> List[dict]:
+        """Share of sampled frames and mean confidence per predicted class, most frequent first."""
+        return [
+            {
+                "label": label,
+                "frames": count,
+                "share": count / self.sampled,
+                "mean_confidence": self.confidence_sums[label] / count,
+            }
+            for label, count in sorted(self.counts.items(), key=lambda kv: -kv[1])
+        ]
+
+    def as_dict(self) -> dict:
+        return {
+            "sampled_frames": self.sampled,
+            "scored_frames": self.scored,
+            "skipped_duplicates": self.sampled - self.scored,
+            "duration_s": self.duration_s,
+            "prevalence": self.prevalence(),
+        }
+
+
+class VideoAnalysis(NamedTuple):
+    timeline: List[FramePrediction]
+    summary: VideoSummary
+
+
+def iter_frames(
+    path: str,
+    sample_fps: float = SAMPLE_FPS,
+    target_size: Tuple[int, int] = (224, 224)
+) -> Iterator[VideoFrame]:
+    """
+    Decodes a video one frame at a time and yields every frame that falls on
+    the sampling grid, resized to target_size. Frames in between are only
+    grabbed, never converted.
+
+    Args:
+      path:        Video file readable by OpenCV/FFmpeg
+      sample_fps:  Frames per second to yield (at most the video's own rate)
+      target_size: (width, height) of the yielded frames
+
+    Raises:
+      ValueError if the file cannot be opened as a video
+    """
+    if sample_fps <= 0:
+        raise ValueError(f"sample_fps must be positive, got {sample_fps}")
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or math.isnan(fps) or fps <= 0:
+            fps = FALLBACK_FPS
+        step = 1.0 / sample_fps
+        next_t = 0.0
+        index = 0
+        while cap.grab():
+            t = index / fps
+            if t + 1e-6 >= next_t:
+                ok, bgr = cap.retrieve()
+                if ok:
+                    small = cv2.resize(bgr, target_size, interpolation=cv2.INTER_AREA)
+                    yield VideoFrame(index, t, cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+                next_t += step * max(1, math.floor((t - next_t) / step) + 1)
+            index += 1
+    finally:
+        cap.release()
+
+
+def frame_signature(rgb: np.ndarray) -> np.ndarray:
+    """Grayscale SIGNATURE_SIDE² thumbnail in [0, 1], compared by frame_difference."""
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (SIGNATURE_SIDE, SIGNATURE_SIDE), interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32) / 255.0
+
+
+def frame_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two frame signatures, 0 (identical) to 1."""
+    return float(np.mean(np.abs(a - b)))
+
+
+def iter_video_predictions(
+    path: str,
+    sample_fps: float = SAMPLE_FPS,
+    diff_threshold: float = DIFF_THRESHOLD,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    target_size: Tuple[int, int] = (224, 224),
+    version: Union[None, str, ModelVersion] = None
+) -> Iterator[FramePrediction]:
+    """
+    Yields a prediction for every sampled frame, in order. Frames that differ
+    from the last scored frame by less than diff_threshold are not sent to
+    the model and repeat its prediction (duplicate=True). Scored frames are
+    collected into batches of batch_size, so results arrive one batch late
+    (or after MAX_PENDING_FRAMES sampled frames, whichever comes first).
+
+    Args:
+      path:           Video file
+      sample_fps:     Frames per second analyzed
+      diff_threshold: Near-duplicate cutoff for frame_difference; 0 scores every sampled frame
+      batch_size:     Frames per forward pass
+      target_size:    Model input (width, height)
+      version:        Model version; resolved once, so a hot-swap mid-video does not mix versions
+    """
+    model_version = current_version() if version is None else version
+    pending: List[Tuple[int, float, bool]] = []   # (index, time_s, scored?) in video order
+    batch: List[np.ndarray] = []
+    last_signature: Optional[np.ndarray] = None
+    last: Optional[Tuple[str, float]] = None
+
+    def flush() -> Iterator[FramePrediction]:
+        nonlocal last
+        scored = iter(())
+        if batch:
+            labels, confidences, _ = predict_leaf_disease_batch(batch, batch_size, target_size, model_version)
+            scored = iter(zip(labels.tolist(), confidences.tolist()))
+        for index, time_s, is_scored in pending:
+            if is_scored:
+                last = next(scored)
+            yield FramePrediction(index, time_s, last[0], float(last[1]), not is_scored)
+        pending.clear()
+        batch.clear()
+
+    for frame in iter_frames(path, sample_fps, target_size):
+        signature = frame_signature(frame.rgb)
+        is_scored = last_signature is None or frame_difference(signature, last_signature) >= diff_threshold
+        if is_scored:
+            last_signature = signature
+            if len(batch) == batch_size:
+                yield from flush()
+            batch.append(frame.rgb)
+        pending.append((frame.index, frame.time_s, is_scored))
+        if len(pending) >= MAX_PENDING_FRAMES:
+            yield from flush()
+    if pending:
+        yield from flush()
+
+
+@metrics.timed("analyze_video")
+def analyze_video(
+    path: str,
+    sample_fps: float = SAMPLE_FPS,
+    diff_threshold: float = DIFF_THRESHOLD,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    target_size: Tuple[int, int] = (224, 224),
+    version: Union[None, str, ModelVersion] = None,
+    on_frame: Optional[Callable[[FramePrediction], None]] = None
+) -> VideoAnalysis:
+    """
+    Timeline of frame predictions and disease prevalence of a whole video.
+    See iter_video_predictions for the arguments; on_frame is called with
+    each prediction as it arrives (e.g. to report progress).
+
+    Returns:
+      VideoAnalysis with the timeline (one small record per sampled frame)
+      and the aggregate VideoSummary
+    """
+    timeline, summary = [], VideoSummary()
+    for pred in iter_video_predictions(path, sample_fps, diff_threshold, batch_size, target_size, version):
+        timeline.append(pred)
+        summary.add(pred)
+        if on_frame is not None:
+            on_frame(pred)
+    return VideoAnalysis(timeline, summary)